@@ -0,0 +1,222 @@
+"""
+Server chat completion tiruan yang kompatibel dengan OpenAI/Groq, untuk load test.
+
+Fitur: distribusi latensi yang bisa diatur (per model juga bisa), injeksi HTTP 429
+dengan header retry-after, dan streaming SSE (stream=true) dengan jeda antar token.
+
+Jalankan lalu arahkan bot ke sini (SDK groq membaca GROQ_BASE_URL sendiri):
+    python -m benchmarks.groq_stub --port 8765 --latency lognormal:600,0.5 --rate-limit-ratio 0.02
+    GROQ_BASE_URL=http://127.0.0.1:8765 python main.py
+
+Format --latency (milidetik): fixed:MS | uniform:MIN,MAX | normal:MEAN,STDDEV |
+lognormal:MEDIAN,SIGMA | exponential:MEAN. Override per model dengan
+--model-latency MODEL=SPEC (boleh diulang).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+import uuid
+from typing import Callable
+
+from aiohttp import web
+
+from bot_config import AVAILABLE_GROQ_MODELS
+
+FILLER_WORDS = (
+    "the", "group", "answer", "is", "that", "you", "can", "use", "a", "simple", "approach", "and",
+    "keep", "it", "short", "so", "everyone", "understands", "what", "happens", "next",
+)
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Mengembalikan sampler latensi dalam detik dari spesifikasi `jenis:parameter` (ms)."""
+    kind, _, raw_params = spec.partition(":")
+    params = [float(p) for p in raw_params.split(",") if p.strip()] if raw_params else []
+    if kind == "fixed":
+        value = params[0] / 1000
+        return lambda: value
+    if kind == "uniform":
+        low, high = params[0] / 1000, params[1] / 1000
+        return lambda: random.uniform(low, high)
+    if kind == "normal":
+        mean, stddev = params[0] / 1000, params[1] / 1000
+        return lambda: max(0.0, random.gauss(mean, stddev))
+    if kind == "lognormal":
+        # MEDIAN dalam ms, SIGMA tanpa satuan: ekor panjang seperti latensi LLM sungguhan
+        mu, sigma = math.log(params[0] / 1000), params[1]
+        return lambda: random.lognormvariate(mu, sigma)
+    if kind == "exponential":
+        mean = params[0] / 1000
+        return lambda: random.expovariate(1 / mean) if mean > 0 else 0.0
+    raise argparse.ArgumentTypeError(f"Unknown latency distribution: {spec!r}")
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def generate_reply(messages: list[dict], response_words: int) -> str:
+    """Jawaban deterministik-kasar yang cukup mirip bentuk jawaban untuk tiap tugas bot."""
+    system = " ".join(m.get("content") or "" for m in messages if m.get("role") == "system").lower()
+    last_user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+    if "moderat" in system:
+        return "SAFE"
+    if "welcome" in system or "welcome" in last_user.lower():
+        return "Hey {{user_mention}}, welcome to {{group_name}}! Glad to have you here."
+    words = [random.choice(FILLER_WORDS) for _ in range(response_words)]
+    return f"Regarding \"{last_user[:60]}\": " + " ".join(words).capitalize() + "."
+
+
+class GroqStubState:
+    def __init__(self, args):
+        self.default_latency = parse_latency(args.latency)
+        self.model_latency = {}
+        for item in args.model_latency or []:
+            model, _, spec = item.partition("=")
+            self.model_latency[model] = parse_latency(spec)
+        self.rate_limit_ratio = args.rate_limit_ratio
+        self.retry_after_seconds = args.retry_after
+        self.token_interval = args.token_interval_ms / 1000
+        self.response_words = args.response_words
+        # None = terima model apa pun; daftar /models tetap memakai model dari bot_config
+        self.models = tuple(args.models.split(",")) if args.models else None
+        self.stats = {"requests": 0, "rate_limited": 0, "streamed": 0}
+
+    def latency_for(self, model: str) -> float:
+        return self.model_latency.get(model, self.default_latency)()
+
+
+def _rate_limited_response(state: GroqStubState, model: str) -> web.Response:
+    state.stats["rate_limited"] += 1
+    return web.json_response(
+        {"error": {
+            "message": f"Rate limit reached for model `{model}` (injected by groq_stub). Please try again in {state.retry_after_seconds}s.",
+            "type": "tokens", "code": "rate_limit_exceeded",
+        }},
+        status=429,
+        headers={"retry-after": str(state.retry_after_seconds), "x-ratelimit-remaining-requests": "0"}
+    )
+
+
+def _completion_body(completion_id: str, model: str, content: str, prompt_tokens: int, elapsed: float) -> dict:
+    completion_tokens = _estimate_tokens(content)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "logprobs": None, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens, "total_time": round(elapsed, 3),
+        },
+        "system_fingerprint": "fp_groq_stub",
+        "x_groq": {"id": f"req_{completion_id}"},
+    }
+
+
+async def _stream_completion(request: web.Request, state: GroqStubState, completion_id: str, model: str,
+                             content: str, prompt_tokens: int, first_token_delay: float) -> web.StreamResponse:
+    state.stats["streamed"] += 1
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+    created = int(time.time())
+
+    def chunk(delta: dict, finish_reason: str | None = None, extra: dict | None = None) -> bytes:
+        body = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+            "choices": [{"index": 0, "delta": delta, "logprobs": None, "finish_reason": finish_reason}],
+        }
+        if extra:
+            body.update(extra)
+        return f"data: {json.dumps(body)}\n\n".encode()
+
+    await asyncio.sleep(first_token_delay)
+    await response.write(chunk({"role": "assistant", "content": ""}))
+    for index, word in enumerate(content.split(" ")):
+        await response.write(chunk({"content": word if index == 0 else " " + word}))
+        if state.token_interval:
+            await asyncio.sleep(state.token_interval)
+    completion_tokens = _estimate_tokens(content)
+    await response.write(chunk({}, "stop", {"x_groq": {"id": f"req_{completion_id}", "usage": {
+        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }}}))
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+def build_app(state: GroqStubState) -> web.Application:
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        state.stats["requests"] += 1
+        try:
+            payload = await request.json()
+        except json.JSONDecodeError:
+            return web.json_response({"error": {"message": "Invalid JSON body", "type": "invalid_request_error"}}, status=400)
+        model = payload.get("model") or "unknown"
+        messages = payload.get("messages") or []
+        if state.models is not None and model not in state.models:
+            return web.json_response(
+                {"error": {"message": f"The model `{model}` does not exist or you do not have access to it.",
+                           "type": "invalid_request_error", "code": "model_not_found"}},
+                status=404
+            )
+        if state.rate_limit_ratio and random.random() < state.rate_limit_ratio:
+            return _rate_limited_response(state, model)
+
+        started_at = time.monotonic()
+        latency = state.latency_for(model)
+        content = generate_reply(messages, state.response_words)
+        max_tokens = payload.get("max_tokens")
+        if max_tokens:
+            content = " ".join(content.split(" ")[:max(1, int(max_tokens))])
+        prompt_tokens = sum(_estimate_tokens(m.get("content") or "") for m in messages)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+
+        if payload.get("stream"):
+            return await _stream_completion(request, state, completion_id, model, content, prompt_tokens, latency)
+        await asyncio.sleep(latency)
+        return web.json_response(_completion_body(completion_id, model, content, prompt_tokens, time.monotonic() - started_at))
+
+    async def list_models(request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [
+            {"id": model, "object": "model", "created": 0, "owned_by": "groq_stub", "active": True}
+            for model in (state.models or [m["id"] for m in AVAILABLE_GROQ_MODELS])
+        ]})
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(state.stats)
+
+    app = web.Application()
+    app.router.add_post("/openai/v1/chat/completions", chat_completions)
+    app.router.add_get("/openai/v1/models", list_models)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI/Groq-compatible chat completion stand-in for load testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:600,0.5", help="Latency distribution in ms (see module docstring)")
+    parser.add_argument("--model-latency", action="append", metavar="MODEL=SPEC", help="Per-model latency override")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="Fraction of requests answered with HTTP 429")
+    parser.add_argument("--retry-after", type=int, default=2, help="retry-after header value for injected 429s (seconds)")
+    parser.add_argument("--token-interval-ms", type=float, default=15.0, help="Delay between streamed tokens")
+    parser.add_argument("--response-words", type=int, default=60, help="Length of generated answers")
+    parser.add_argument("--models", help="Comma-separated list of accepted model ids (default: accept any)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    state = GroqStubState(args)
+    logging.info(f"Groq stand-in on http://{args.host}:{args.port} (set GROQ_BASE_URL to this address)")
+    web.run_app(build_app(state), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
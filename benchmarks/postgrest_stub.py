@@ -0,0 +1,344 @@
+"""
+Server PostgREST tiruan berbasis SQLite untuk load test tanpa Supabase asli.
+
+Mendukung subset yang dipakai bot: tabel group_configs, conversation_history,
+user_preferences dan group_usage_daily; GET/POST/PATCH/DELETE pada /rest/v1/<tabel>;
+filter eq, neq, gt, gte, lt, lte, is, in; select kolom, order, limit/offset; upsert
+(on_conflict + Prefer: resolution=merge-duplicates|ignore-duplicates), Prefer:
+return=minimal, dan RPC POST /rest/v1/rpc/increment_group_usage.
+
+Jalankan lalu arahkan bot ke sini:
+    python -m benchmarks.postgrest_stub --port 54321 --db /tmp/wisedebot.sqlite --seed-groups 50
+    SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_SERVICE_KEY=local-stub python main.py
+
+Setiap baris disimpan sebagai dokumen JSON; filter memakai json_extract, dengan
+index ekspresi pada kolom yang sering difilter.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+# tabel -> (kolom kunci untuk upsert default, kolom yang diberi index, default saat insert)
+TABLES = {
+    "group_configs": {"primary_key": ("group_id",), "indexed": ("group_id",)},
+    "conversation_history": {
+        "primary_key": ("id",),
+        "indexed": ("group_id", "message_id", "timestamp"),
+        "defaults": {"timestamp": lambda: datetime.now(timezone.utc).isoformat()},
+    },
+    "user_preferences": {"primary_key": ("user_id",), "indexed": ("user_id",)},
+    "group_usage_daily": {"primary_key": ("group_id", "usage_date", "task"), "indexed": ("group_id", "usage_date")},
+}
+
+USAGE_COUNTERS = ("requests", "prompt_tokens", "completion_tokens", "latency_ms_total")
+
+FILTER_OPERATORS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+class PostgrestError(Exception):
+    def __init__(self, status: int, code: str, message: str, details: str | None = None):
+        super().__init__(message)
+        self.status = status
+        self.code = code
+        self.message = message
+        self.details = details
+
+    def to_response(self) -> web.Response:
+        return web.json_response(
+            {"code": self.code, "message": self.message, "details": self.details, "hint": None},
+            status=self.status
+        )
+
+
+def _coerce(raw: str):
+    if raw in ("null", "true", "false"):
+        return {"null": None, "true": True, "false": False}[raw]
+    for cast in (int, float):
+        try:
+            return cast(raw)
+        except ValueError:
+            pass
+    return raw
+
+
+def _column(name: str) -> str:
+    if not name.replace("_", "").isalnum():
+        raise PostgrestError(400, "PGRST100", f"Invalid column name: {name}")
+    return f"json_extract(doc, '$.{name}')"
+
+
+class SqliteStore:
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        for table, spec in TABLES.items():
+            self.conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (rowid_ INTEGER PRIMARY KEY AUTOINCREMENT, doc TEXT NOT NULL)")
+            for column in spec["indexed"]:
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({_column(column)})")
+        self.conn.commit()
+
+    @staticmethod
+    def _spec(table: str) -> dict:
+        spec = TABLES.get(table)
+        if spec is None:
+            raise PostgrestError(404, "PGRST205", f"Could not find the table 'public.{table}' in the schema cache")
+        return spec
+
+    @staticmethod
+    def _where(params) -> tuple[str, list]:
+        clauses, values = [], []
+        for key, raw in params.items():
+            if key in RESERVED_PARAMS:
+                continue
+            negate = raw.startswith("not.")
+            if negate:
+                raw = raw[4:]
+            operator, _, operand = raw.partition(".")
+            if operator in FILTER_OPERATORS:
+                clause = f"{_column(key)} {FILTER_OPERATORS[operator]} ?"
+                values.append(_coerce(operand))
+            elif operator == "is":
+                clause = f"{_column(key)} IS {'NULL' if operand == 'null' else ('1' if operand == 'true' else '0')}"
+            elif operator == "in":
+                items = [_coerce(item.strip().strip('"')) for item in operand.strip("()").split(",") if item.strip()]
+                if not items:
+                    clause = "0"
+                else:
+                    clause = f"{_column(key)} IN ({', '.join('?' for _ in items)})"
+                    values.extend(items)
+            else:
+                raise PostgrestError(400, "PGRST100", f"Unsupported filter operator: {operator}")
+            clauses.append(f"NOT ({clause})" if negate else clause)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", values
+
+    @staticmethod
+    def _order(raw: str | None) -> str:
+        if not raw:
+            return " ORDER BY rowid_"
+        parts = []
+        for item in raw.split(","):
+            column, *modifiers = item.split(".")
+            direction = "DESC" if "desc" in modifiers else "ASC"
+            nulls = " NULLS FIRST" if "nullsfirst" in modifiers else (" NULLS LAST" if "nullslast" in modifiers else "")
+            parts.append(f"{_column(column)} {direction}{nulls}")
+        return " ORDER BY " + ", ".join(parts) + ", rowid_"
+
+    @staticmethod
+    def _project(rows: list[dict], select: str | None) -> list[dict]:
+        if not select or select.strip() == "*":
+            return rows
+        columns = [c.strip() for c in select.split(",") if c.strip()]
+        return [{c: row.get(c) for c in columns} for row in rows]
+
+    def _fetch(self, table: str, params) -> list[tuple[int, dict]]:
+        where, values = self._where(params)
+        sql = f"SELECT rowid_, doc FROM {table}{where}{self._order(params.get('order'))}"
+        if "limit" in params:
+            sql += " LIMIT ?"
+            values.append(int(params["limit"]))
+            if "offset" in params:
+                sql += " OFFSET ?"
+                values.append(int(params["offset"]))
+        elif "offset" in params:
+            sql += " LIMIT -1 OFFSET ?"
+            values.append(int(params["offset"]))
+        return [(rowid, json.loads(doc)) for rowid, doc in self.conn.execute(sql, values)]
+
+    def select(self, table: str, params) -> list[dict]:
+        self._spec(table)
+        return self._project([doc for _, doc in self._fetch(table, params)], params.get("select"))
+
+    def insert(self, table: str, rows: list[dict], on_conflict: str | None, resolution: str | None) -> list[dict]:
+        spec = self._spec(table)
+        conflict_columns = tuple(c.strip() for c in on_conflict.split(",")) if on_conflict else spec["primary_key"]
+        result = []
+        for row in rows:
+            row = dict(row)
+            for column, default in spec.get("defaults", {}).items():
+                row.setdefault(column, default())
+            existing = None
+            if all(row.get(c) is not None for c in conflict_columns):
+                where = " AND ".join(f"{_column(c)} = ?" for c in conflict_columns)
+                existing = self.conn.execute(
+                    f"SELECT rowid_, doc FROM {table} WHERE {where} LIMIT 1", [row[c] for c in conflict_columns]
+                ).fetchone()
+            if existing is not None:
+                if resolution is None:
+                    raise PostgrestError(409, "23505", f"duplicate key value violates unique constraint on {', '.join(conflict_columns)}")
+                if resolution == "ignore-duplicates":
+                    continue
+                merged = {**json.loads(existing[1]), **row}
+                self.conn.execute(f"UPDATE {table} SET doc = ? WHERE rowid_ = ?", (json.dumps(merged), existing[0]))
+                result.append(merged)
+                continue
+            cursor = self.conn.execute(f"INSERT INTO {table} (doc) VALUES ('{{}}')")
+            if "id" in spec["primary_key"] and row.get("id") is None:
+                row["id"] = cursor.lastrowid
+            self.conn.execute(f"UPDATE {table} SET doc = ? WHERE rowid_ = ?", (json.dumps(row), cursor.lastrowid))
+            result.append(row)
+        self.conn.commit()
+        return result
+
+    def update(self, table: str, params, patch: dict) -> list[dict]:
+        self._spec(table)
+        updated = []
+        for rowid, doc in self._fetch(table, params):
+            doc.update(patch)
+            self.conn.execute(f"UPDATE {table} SET doc = ? WHERE rowid_ = ?", (json.dumps(doc), rowid))
+            updated.append(doc)
+        self.conn.commit()
+        return updated
+
+    def increment_group_usage(self, rows: list[dict]) -> list[dict]:
+        # Meniru migrations/006_group_usage_daily.sql: upsert dengan penjumlahan, lalu total per grup per hari
+        touched = set()
+        for row in rows:
+            key = (row["group_id"], row["usage_date"], row["task"])
+            touched.add(key[:2])
+            existing = self.conn.execute(
+                f"SELECT rowid_, doc FROM group_usage_daily WHERE {_column('group_id')} = ? AND {_column('usage_date')} = ? AND {_column('task')} = ? LIMIT 1",
+                key
+            ).fetchone()
+            if existing is None:
+                doc = {"group_id": key[0], "usage_date": key[1], "task": key[2], **{c: row.get(c) or 0 for c in USAGE_COUNTERS}}
+                self.conn.execute("INSERT INTO group_usage_daily (doc) VALUES (?)", (json.dumps(doc),))
+            else:
+                doc = json.loads(existing[1])
+                for counter in USAGE_COUNTERS:
+                    doc[counter] = (doc.get(counter) or 0) + (row.get(counter) or 0)
+                self.conn.execute("UPDATE group_usage_daily SET doc = ? WHERE rowid_ = ?", (json.dumps(doc), existing[0]))
+        self.conn.commit()
+        totals = []
+        for group_id, usage_date in touched:
+            day_rows = self.select("group_usage_daily", {"group_id": f"eq.{group_id}", "usage_date": f"eq.{usage_date}"})
+            totals.append({
+                "group_id": group_id, "usage_date": usage_date,
+                "requests": sum(r["requests"] for r in day_rows),
+                "total_tokens": sum(r["prompt_tokens"] + r["completion_tokens"] for r in day_rows),
+            })
+        return totals
+
+    def delete(self, table: str, params) -> list[dict]:
+        self._spec(table)
+        rows = self._fetch(table, params)
+        self.conn.executemany(f"DELETE FROM {table} WHERE rowid_ = ?", [(rowid,) for rowid, _ in rows])
+        self.conn.commit()
+        return [doc for _, doc in rows]
+
+
+def _parse_prefer(request: web.Request) -> dict:
+    prefer = {}
+    for item in request.headers.get("Prefer", "").split(","):
+        key, _, value = item.strip().partition("=")
+        if key:
+            prefer[key] = value
+    return prefer
+
+
+def _respond(rows: list[dict], prefer: dict, status: int, request: web.Request) -> web.Response:
+    headers = {"Content-Range": f"0-{max(len(rows) - 1, 0)}/{len(rows) if prefer.get('count') else '*'}"}
+    if prefer.get("return") == "minimal":
+        return web.Response(status=204 if status == 200 else status, headers=headers)
+    if request.headers.get("Accept") == "application/vnd.pgrst.object+json":
+        if len(rows) != 1:
+            raise PostgrestError(406, "PGRST116", "JSON object requested, multiple (or no) rows returned",
+                                 f"The result contains {len(rows)} rows")
+        return web.json_response(rows[0], status=status, headers=headers)
+    return web.json_response(rows, status=status, headers=headers)
+
+
+def build_app(store: SqliteStore, latency_seconds: float = 0.0, jitter_seconds: float = 0.0) -> web.Application:
+    lock = asyncio.Lock()
+
+    async def handle(request: web.Request) -> web.Response:
+        table = request.match_info["table"]
+        params = request.query
+        prefer = _parse_prefer(request)
+        if latency_seconds or jitter_seconds:
+            await asyncio.sleep(max(0.0, latency_seconds + random.uniform(-jitter_seconds, jitter_seconds)))
+        try:
+            async with lock:
+                if request.method == "GET":
+                    return _respond(store.select(table, params), prefer, 200, request)
+                if request.method == "POST":
+                    payload = await request.json()
+                    rows = payload if isinstance(payload, list) else [payload]
+                    resolution = prefer.get("resolution")
+                    inserted = store.insert(table, rows, params.get("on_conflict"), resolution)
+                    return _respond(store._project(inserted, params.get("select")), prefer, 201, request)
+                if request.method == "PATCH":
+                    updated = store.update(table, params, await request.json())
+                    return _respond(store._project(updated, params.get("select")), prefer, 200, request)
+                if request.method == "DELETE":
+                    deleted = store.delete(table, params)
+                    return _respond(store._project(deleted, params.get("select")), prefer, 200, request)
+        except PostgrestError as e:
+            return e.to_response()
+        except (ValueError, sqlite3.Error) as e:
+            return PostgrestError(400, "PGRST100", str(e)).to_response()
+        return PostgrestError(405, "PGRST117", f"Unsupported HTTP method: {request.method}").to_response()
+
+    rpc_functions = {"increment_group_usage": lambda payload: store.increment_group_usage(payload.get("rows") or [])}
+
+    async def handle_rpc(request: web.Request) -> web.Response:
+        function = rpc_functions.get(request.match_info["function"])
+        if function is None:
+            return PostgrestError(404, "PGRST202", f"Could not find the function public.{request.match_info['function']} in the schema cache").to_response()
+        if latency_seconds or jitter_seconds:
+            await asyncio.sleep(max(0.0, latency_seconds + random.uniform(-jitter_seconds, jitter_seconds)))
+        try:
+            async with lock:
+                return web.json_response(function(await request.json()))
+        except (KeyError, ValueError, sqlite3.Error) as e:
+            return PostgrestError(400, "PGRST100", str(e)).to_response()
+
+    app = web.Application()
+    app.router.add_route("POST", "/rest/v1/rpc/{function}", handle_rpc)
+    app.router.add_route("*", "/rest/v1/{table}", handle)
+    return app
+
+
+def seed_group_configs(store: SqliteStore, group_count: int, encryption_key: str):
+    # Dipakai agar load test langsung punya grup aktif dengan API key terenkripsi
+    from benchmarks.replay_dispatcher import build_group_configs
+    from utils.crypto_interface import CryptoUtil
+
+    rows = build_group_configs(CryptoUtil(encryption_key), group_count)
+    store.insert("group_configs", rows, None, "merge-duplicates")
+    logging.info(f"Seeded {len(rows)} group_configs rows.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite-backed PostgREST stand-in for load testing the bot.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--db", default=":memory:", help="SQLite database path (default: in-memory)")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Artificial latency added to every request")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter around --latency-ms")
+    parser.add_argument("--seed-groups", type=int, default=0, help="Pre-populate N active group_configs rows")
+    parser.add_argument("--encryption-key", default=os.environ.get("ENCRYPTION_KEY"),
+                        help="Fernet key used to encrypt the seeded Groq key (default: $ENCRYPTION_KEY)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    store = SqliteStore(args.db)
+    if args.seed_groups:
+        if not args.encryption_key:
+            raise SystemExit("--seed-groups needs --encryption-key or ENCRYPTION_KEY so the bot can decrypt the seeded key.")
+        seed_group_configs(store, args.seed_groups, args.encryption_key)
+
+    logging.info(f"PostgREST stand-in on http://{args.host}:{args.port} (set SUPABASE_URL to this address)")
+    web.run_app(build_app(store, args.latency_ms / 1000, args.jitter_ms / 1000), host=args.host, port=args.port, print=None, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Benchmark offline: membangun Dispatcher asli dari main.build_dispatcher, mengganti
+Supabase/Groq/Telegram dengan stand-in lokal, lalu memutar ulang aliran Update.
+
+Contoh (dari root repo):
+    python -m benchmarks.replay_dispatcher --updates 5000 --concurrency 32
+    python -m benchmarks.replay_dispatcher --input recorded_updates.jsonl --groq-latency-ms 400
+
+File --input berisi satu objek Update (format JSON Bot API, mis. dari getUpdates) per baris.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import time
+
+from aiogram import Bot
+from aiogram.types import Update
+from cryptography.fernet import Fernet
+
+import main as bot_main
+from bot_config import LOG_CATEGORY_LEVELS
+from benchmarks.stand_ins import FakeSupabaseClient, FakeGroqBackend, FakeTelegramSession
+from handlers import common_handlers
+from utils import groq_interface
+from utils.config_store import group_config_store
+from utils.metrics import DROPPED_UPDATES
+from utils.crypto_interface import CryptoUtil
+from utils.usage_tracker import usage_tracker
+from utils.loop_monitor import loop_monitor
+from utils.log_pipeline import setup_logging
+
+BOT_USER = {"id": 700000001, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+BOT_TOKEN = f"{BOT_USER['id']}:AAbenchmarkbenchmarkbenchmarkbenchmark"
+DEFAULT_MIX = "chatter=70,mention=12,join=8,callback=10"
+
+CHATTER_LINES = [
+    "good morning everyone", "anyone tried the new release?", "lol", "see you at the meetup tonight",
+    "can someone share the slides?", "thanks!", "the build is green again", "brb",
+]
+QUESTIONS = [
+    "what is the difference between a list and a tuple?", "how do I reset my password?",
+    "summarize the rules of this group", "what time is the meetup?", "explain async/await in one paragraph",
+]
+
+
+def build_group_configs(crypto_util: CryptoUtil, group_count: int) -> list[dict]:
+    encrypted_key = crypto_util.encrypt_data("gsk_benchmark_key")
+    rows = []
+    for index in range(group_count):
+        rows.append({
+            "group_id": -1001000000000 - index,
+            "encrypted_groq_api_key": encrypted_key,
+            "system_prompt": "You are a helpful assistant.",
+            "groq_model": "llama3-70b-8192",
+            "language_code": "en",
+            "is_active": True,
+            "ai_trigger_command_enabled": True,
+            "ai_trigger_mention_enabled": True,
+            "ai_trigger_custom_prefix": None,
+            # Sepertiga grup memakai moderasi, separuh memakai welcome (AI di grup genap)
+            "moderation_level": "normal" if index % 3 == 0 else "disabled",
+            "moderation_action": "warn",
+            "welcome_message_enabled": index % 2 == 0,
+            "welcome_message_ai_enabled": index % 4 == 0,
+            "custom_welcome_message": "Welcome {{user_mention}} to {{group_name}}!",
+            "model_routes": {},
+        })
+    return rows
+
+
+class SyntheticUpdates:
+    def __init__(self, group_ids: list[int], users_per_group: int, seed: int):
+        self.group_ids = group_ids
+        self.users_per_group = users_per_group
+        self.random = random.Random(seed)
+        self.update_id = 0
+        self.message_id = 0
+        self.joined_user_id = 900_000_000
+
+    def _next_ids(self) -> tuple[int, int]:
+        self.update_id += 1
+        self.message_id += 1
+        return self.update_id, self.message_id
+
+    def _chat(self, group_id: int) -> dict:
+        return {"id": group_id, "type": "supergroup", "title": f"Group {abs(group_id) % 1000}"}
+
+    def _user(self, group_id: int) -> dict:
+        user_id = abs(group_id) % 100_000 * 1000 + self.random.randrange(self.users_per_group)
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "language_code": "en"}
+
+    def _message(self, group_id: int, text: str, entities: list | None = None) -> dict:
+        update_id, message_id = self._next_ids()
+        message = {
+            "message_id": message_id, "date": int(time.time()),
+            "chat": self._chat(group_id), "from": self._user(group_id), "text": text,
+        }
+        if entities:
+            message["entities"] = entities
+        return {"update_id": update_id, "message": message}
+
+    def chatter(self, group_id: int) -> dict:
+        return self._message(group_id, self.random.choice(CHATTER_LINES))
+
+    def mention(self, group_id: int) -> dict:
+        mention = f"@{BOT_USER['username']}"
+        text = f"{mention} {self.random.choice(QUESTIONS)}"
+        return self._message(group_id, text, [{"type": "mention", "offset": 0, "length": len(mention)}])
+
+    def join(self, group_id: int) -> dict:
+        update_id, _ = self._next_ids()
+        self.joined_user_id += 1
+        new_user = {"id": self.joined_user_id, "is_bot": False, "first_name": f"Newcomer{self.joined_user_id}"}
+        return {"update_id": update_id, "chat_member": {
+            "chat": self._chat(group_id), "from": new_user, "date": int(time.time()),
+            "old_chat_member": {"status": "left", "user": new_user},
+            "new_chat_member": {"status": "member", "user": new_user},
+        }}
+
+    def callback(self, group_id: int) -> dict:
+        update_id, message_id = self._next_ids()
+        user = self._user(group_id)
+        return {"update_id": update_id, "callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": str(group_id),
+            "data": f"{common_handlers.HELP_CAT_PREFIX}{self.random.choice(['main', 'admin', 'user', 'ai'])}",
+            "message": {
+                "message_id": message_id, "date": int(time.time()), "chat": {"id": user["id"], "type": "private"},
+                "from": BOT_USER, "text": "Help menu",
+            },
+        }}
+
+    def generate(self, count: int, mix: dict[str, int]) -> list[dict]:
+        kinds = list(mix)
+        weights = [mix[k] for k in kinds]
+        return [getattr(self, kind)(self.random.choice(self.group_ids))
+                for kind in self.random.choices(kinds, weights=weights, k=count)]
+
+
+def parse_mix(raw: str) -> dict[str, int]:
+    mix = {}
+    for part in raw.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("chatter", "mention", "join", "callback"):
+            raise SystemExit(f"Unknown update kind in --mix: {name!r}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def load_recorded_updates(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+async def run_benchmark(args) -> dict:
+    crypto_util = CryptoUtil(Fernet.generate_key().decode())
+    # Grup tanpa baris group_configs (bot ada di grup, tapi tidak pernah di-setup)
+    group_ids = [-1001000000000 - i for i in range(args.groups + args.unconfigured_groups)]
+    supabase = FakeSupabaseClient(
+        latency_seconds=args.supabase_latency_ms / 1000,
+        tables={"group_configs": build_group_configs(crypto_util, args.groups)}
+    )
+    groq_backend = FakeGroqBackend(latency_seconds=args.groq_latency_ms / 1000)
+    groq_interface.client_factory = groq_backend.client_factory
+    session = FakeTelegramSession(BOT_USER, latency_seconds=args.telegram_latency_ms / 1000)
+    bot = Bot(token=BOT_TOKEN, session=session)
+    common_handlers.join_aggregator.window_seconds = args.join_window
+
+    if not args.no_config_snapshot:
+        await group_config_store.preload(supabase)
+    dp = bot_main.build_dispatcher(supabase, crypto_util)
+
+    if args.input:
+        raw_updates = load_recorded_updates(args.input)
+    else:
+        raw_updates = SyntheticUpdates(group_ids, args.users_per_group, args.seed).generate(args.updates, parse_mix(args.mix))
+    updates = [Update.model_validate(raw, context={"bot": bot}) for raw in raw_updates]
+
+    latencies: list[float] = []
+    failures = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def feed(update: Update):
+        nonlocal failures
+        async with semaphore:
+            started_at = time.perf_counter()
+            try:
+                await dp.feed_update(bot, update)
+            except Exception:
+                failures += 1
+                logging.exception(f"Update {update.update_id} raised during replay")
+            latencies.append(time.perf_counter() - started_at)
+
+    loop_monitor.start()
+    started_at = time.perf_counter()
+    await asyncio.gather(*(feed(update) for update in updates))
+    dispatch_seconds = time.perf_counter() - started_at
+    await loop_monitor.stop()
+
+    # Pekerjaan latar (batch welcome, isi ulang pool) ikut dihitung sebagai panggilan keluar
+    await asyncio.sleep(args.join_window)
+    pending = list(common_handlers.join_aggregator._flush_tasks)
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    # Satu flush pemakaian Groq di akhir, seperti saat bot shutdown
+    await usage_tracker.flush(supabase)
+    await bot.session.close()
+
+    latencies.sort()
+    total = len(updates) or 1
+    supabase_calls = sum(supabase.calls.values())
+    groq_calls = sum(groq_backend.calls.values())
+    telegram_calls = sum(session.calls.values())
+    return {
+        "updates": len(updates),
+        "failures": failures,
+        "concurrency": args.concurrency,
+        "dispatch_seconds": round(dispatch_seconds, 3),
+        "updates_per_second": round(len(updates) / dispatch_seconds, 1) if dispatch_seconds else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "mean": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        },
+        "external_calls_per_update": {
+            "supabase": round(supabase_calls / total, 3),
+            "groq": round(groq_calls / total, 3),
+            "telegram": round(telegram_calls / total, 3),
+        },
+        "dropped_idle_group_updates": int(DROPPED_UPDATES.value("idle_group")),
+        "event_loop_lag_ms": {
+            "p99": round((loop_monitor.lag_percentile(0.99) or 0.0) * 1000, 2),
+            "max": round((loop_monitor.lag_percentile(1.0) or 0.0) * 1000, 2),
+            "stalls": loop_monitor.stalls,
+        },
+        "external_calls": {
+            "supabase": dict(supabase.calls.most_common()),
+            "groq": dict(groq_backend.calls.most_common()),
+            "telegram": dict(session.calls.most_common()),
+        },
+    }
+
+
+def print_report(report: dict):
+    print(f"Replayed {report['updates']} updates in {report['dispatch_seconds']}s "
+          f"(concurrency {report['concurrency']}, failures {report['failures']})")
+    print(f"Throughput: {report['updates_per_second']} updates/s (idle-group chatter dropped: {report['dropped_idle_group_updates']})")
+    latency = report["latency_ms"]
+    print(f"Handler latency: p50 {latency['p50']} ms | p95 {latency['p95']} ms | p99 {latency['p99']} ms | mean {latency['mean']} ms")
+    loop_lag = report["event_loop_lag_ms"]
+    print(f"Event loop lag: p99 {loop_lag['p99']} ms | max {loop_lag['max']} ms | stalls {loop_lag['stalls']}")
+    per_update = report["external_calls_per_update"]
+    print(f"External calls per update: supabase {per_update['supabase']} | groq {per_update['groq']} | telegram {per_update['telegram']}")
+    for backend, calls in report["external_calls"].items():
+        if calls:
+            print(f"  {backend}: " + ", ".join(f"{name}={count}" for name, count in calls.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay Telegram updates through the real dispatcher with local stand-ins.")
+    parser.add_argument("--input", help="JSONL file with one recorded Update per line (default: synthetic stream)")
+    parser.add_argument("--updates", type=int, default=2000, help="Number of synthetic updates")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Synthetic update mix (default: {DEFAULT_MIX})")
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--unconfigured-groups", type=int, default=0, help="Extra groups that never ran /setup_ai")
+    parser.add_argument("--users-per-group", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=16, help="Updates dispatched concurrently")
+    parser.add_argument("--supabase-latency-ms", type=float, default=0.0)
+    parser.add_argument("--groq-latency-ms", type=float, default=0.0)
+    parser.add_argument("--telegram-latency-ms", type=float, default=0.0)
+    parser.add_argument("--join-window", type=float, default=0.05, help="Join aggregation window used during replay (seconds)")
+    parser.add_argument("--no-config-snapshot", action="store_true", help="Query group_configs per update instead of preloading the snapshot")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    # Level kategori dari bot_config (mis. aiogram.event=INFO) ikut diturunkan ke --log-level
+    log_listener = setup_logging(
+        level=args.log_level, log_format="text",
+        category_levels={name: args.log_level for name in LOG_CATEGORY_LEVELS}
+    )
+    try:
+        report = asyncio.run(run_benchmark(args))
+    finally:
+        log_listener.stop()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
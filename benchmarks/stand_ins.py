@@ -0,0 +1,298 @@
+"""
+Stand-in lokal untuk Supabase, Groq dan Telegram Bot API, dipakai oleh
+benchmarks/replay_dispatcher.py. Ketiganya menghitung setiap panggilan keluar
+dan bisa diberi latensi buatan, tanpa akses jaringan sama sekali.
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+import typing
+from datetime import datetime, timezone
+from collections import Counter as CallCounter
+from types import SimpleNamespace
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Message, User, ChatMemberMember
+
+
+class FakeSupabaseResponse:
+    def __init__(self, data, status_code: int = 200):
+        self.data = data
+        self.status_code = status_code
+
+
+class FakeSupabaseQuery:
+    """Subset builder postgrest yang dipakai supabase_interface dan handler."""
+
+    def __init__(self, client: "FakeSupabaseClient", table_name: str):
+        self._client = client
+        self._table = table_name
+        self._operation = "select"
+        self._payload = None
+        self._on_conflict = None
+        self._filters: list[typing.Callable[[dict], bool]] = []
+        self._order = None
+        self._limit = None
+        self._offset = 0
+        self._single = False
+
+    def select(self, *_columns):
+        self._operation = "select"
+        return self
+
+    def insert(self, payload):
+        self._operation, self._payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict: str | None = None):
+        self._operation, self._payload, self._on_conflict = "upsert", payload, on_conflict
+        return self
+
+    def update(self, payload):
+        self._operation, self._payload = "update", payload
+        return self
+
+    def delete(self):
+        self._operation = "delete"
+        return self
+
+    def eq(self, column, value):
+        self._filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = list(values)
+        self._filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def gte(self, column, value):
+        self._filters.append(lambda row: row.get(column) is not None and row.get(column) >= value)
+        return self
+
+    def is_(self, column, value):
+        expected = None if value in (None, "null") else value
+        self._filters.append(lambda row: row.get(column) is expected)
+        return self
+
+    def order(self, column, desc: bool = False):
+        self._order = (column, desc)
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def range(self, start, end):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def maybe_single(self):
+        self._single = True
+        return self
+
+    def execute(self):
+        return self._client._execute(self)
+
+
+class FakeSupabaseRpc:
+    def __init__(self, client: "FakeSupabaseClient", name: str, params: dict):
+        self._client = client
+        self._name = name
+        self._params = params
+
+    def execute(self):
+        return self._client._execute_rpc(self._name, self._params)
+
+
+class FakeSupabaseClient:
+    """
+    Penyimpanan in-memory per tabel. execute() dipanggil lewat asyncio.to_thread
+    oleh supabase_interface, jadi latensi disimulasikan dengan time.sleep di thread.
+    """
+
+    def __init__(self, latency_seconds: float = 0.0, tables: dict[str, list[dict]] | None = None):
+        self.latency_seconds = latency_seconds
+        self.tables: dict[str, list[dict]] = {name: list(rows) for name, rows in (tables or {}).items()}
+        self.calls: CallCounter = CallCounter()
+        self._lock = threading.Lock()
+        self._next_id = 1
+
+    def table(self, name: str) -> FakeSupabaseQuery:
+        return FakeSupabaseQuery(self, name)
+
+    def rpc(self, name: str, params: dict) -> "FakeSupabaseRpc":
+        return FakeSupabaseRpc(self, name, params)
+
+    def _execute_rpc(self, name: str, params: dict) -> FakeSupabaseResponse:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with self._lock:
+            self.calls[f"rpc.{name}"] += 1
+            if name != "increment_group_usage":
+                raise ValueError(f"Unsupported fake Supabase RPC: {name}")
+            # Meniru migrations/006_group_usage_daily.sql: upsert dengan penjumlahan, lalu total per hari
+            rows = self.tables.setdefault("group_usage_daily", [])
+            counters = ("requests", "prompt_tokens", "completion_tokens", "latency_ms_total")
+            touched = set()
+            for payload in params["rows"]:
+                key = (payload["group_id"], payload["usage_date"], payload["task"])
+                touched.add(key[:2])
+                existing = next((row for row in rows if (row["group_id"], row["usage_date"], row["task"]) == key), None)
+                if existing is None:
+                    rows.append(dict(payload))
+                else:
+                    for counter in counters:
+                        existing[counter] += payload[counter]
+            totals = []
+            for group_id, usage_date in touched:
+                day_rows = [row for row in rows if (row["group_id"], row["usage_date"]) == (group_id, usage_date)]
+                totals.append({
+                    "group_id": group_id, "usage_date": usage_date,
+                    "requests": sum(row["requests"] for row in day_rows),
+                    "total_tokens": sum(row["prompt_tokens"] + row["completion_tokens"] for row in day_rows),
+                })
+            return FakeSupabaseResponse(totals)
+
+    def _execute(self, query: FakeSupabaseQuery) -> FakeSupabaseResponse:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with self._lock:
+            self.calls[f"{query._table}.{query._operation}"] += 1
+            rows = self.tables.setdefault(query._table, [])
+            matched = [row for row in rows if all(f(row) for f in query._filters)]
+
+            if query._operation == "select":
+                if query._order:
+                    column, desc = query._order
+                    matched.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+                if query._limit is not None:
+                    matched = matched[query._offset:query._offset + query._limit]
+                matched = [dict(row) for row in matched]
+                if query._single:
+                    return FakeSupabaseResponse(matched[0] if matched else None)
+                return FakeSupabaseResponse(matched)
+
+            if query._operation == "insert":
+                payloads = query._payload if isinstance(query._payload, list) else [query._payload]
+                inserted = []
+                for payload in payloads:
+                    row = {"id": self._next_id, "timestamp": datetime.now(timezone.utc).isoformat(), **payload}
+                    self._next_id += 1
+                    rows.append(row)
+                    inserted.append(dict(row))
+                return FakeSupabaseResponse(inserted, 201)
+
+            if query._operation == "upsert":
+                payload = query._payload
+                keys = [k.strip() for k in (query._on_conflict or "id").split(",")]
+                existing = next((row for row in rows if all(row.get(k) == payload.get(k) for k in keys)), None)
+                if existing is None:
+                    existing = dict(payload)
+                    rows.append(existing)
+                else:
+                    existing.update(payload)
+                return FakeSupabaseResponse([dict(existing)], 201)
+
+            if query._operation == "update":
+                for row in matched:
+                    row.update(query._payload)
+                return FakeSupabaseResponse([dict(row) for row in matched])
+
+            if query._operation == "delete":
+                self.tables[query._table] = [row for row in rows if row not in matched]
+                return FakeSupabaseResponse([dict(row) for row in matched])
+
+        raise ValueError(f"Unsupported fake Supabase operation: {query._operation}")
+
+
+class FakeGroqCompletions:
+    def __init__(self, owner: "FakeGroqBackend"):
+        self._owner = owner
+
+    async def create(self, messages, model, max_tokens=None, **kwargs):
+        owner = self._owner
+        owner.calls[model] += 1
+        if owner.latency_seconds:
+            await asyncio.sleep(owner.latency_seconds * random.uniform(0.5, 1.5))
+        last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        if "welcome" in last_user.lower() or "{{user_mention}}" in last_user:
+            content = "Welcome {{user_mention}} to {{group_name}}!"
+        elif any("moderat" in (m.get("content") or "").lower() for m in messages if m["role"] == "system"):
+            content = "SAFE"
+        else:
+            content = f"Benchmark answer to: {last_user[:200]}"
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=sum(len(m["content"]) // 4 for m in messages), completion_tokens=len(content) // 4)
+        )
+
+
+class FakeGroqBackend:
+    """Pengganti kelas AsyncGroq: `groq_interface.client_factory = backend.client_factory`."""
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.calls: CallCounter = CallCounter()
+
+    def client_factory(self, api_key: str | None = None, **_kwargs):
+        return SimpleNamespace(chat=SimpleNamespace(completions=FakeGroqCompletions(self)), close=self._close_client)
+
+    async def _close_client(self):
+        pass
+
+
+class FakeTelegramSession(BaseSession):
+    """
+    Session aiogram yang tidak pernah menyentuh jaringan. Hasil dibentuk sebagai JSON
+    lalu divalidasi lewat check_response, sama seperti jalur session asli.
+    """
+
+    def __init__(self, bot_user: dict, latency_seconds: float = 0.0):
+        super().__init__()
+        self.bot_user = bot_user
+        self.latency_seconds = latency_seconds
+        self.calls: CallCounter = CallCounter()
+        self._next_message_id = 1_000_000
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    def _fake_message(self, method: TelegramMethod) -> dict:
+        self._next_message_id += 1
+        chat_id = getattr(method, "chat_id", None) or 0
+        chat_type = "private" if isinstance(chat_id, int) and chat_id > 0 else "supergroup"
+        return {
+            "message_id": getattr(method, "message_id", None) or self._next_message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": chat_type, "title": None if chat_type == "private" else "Benchmark group"},
+            "from": self.bot_user,
+            "text": getattr(method, "text", None) or getattr(method, "caption", None) or "",
+        }
+
+    def _fake_result(self, method: TelegramMethod):
+        returning = method.__returning__
+        candidates = typing.get_args(returning) or (returning,)
+        if Message in candidates:
+            return self._fake_message(method)
+        if User in candidates:
+            return self.bot_user
+        if typing.get_origin(returning) is list:
+            return []
+        if any(isinstance(c, type) and issubclass(c, ChatMemberMember) for c in candidates) or "ChatMember" in str(returning):
+            return {"status": "member", "user": {"id": getattr(method, "user_id", 0), "is_bot": False, "first_name": "Member"}}
+        return True
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None):
+        self.calls[method.__api_method__] += 1
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        content = json.dumps({"ok": True, "result": self._fake_result(method)})
+        response = self.check_response(bot=bot, method=method, status_code=200, content=content)
+        return response.result
@@ -42,10 +42,175 @@ def get_model_display_name(model_id_to_find: str) -> str:
 
 
 GROQ_MAX_TOKENS = 512
+
+# Routing model per tugas. "model": None berarti memakai groq_model milik grup.
+# Grup bisa menimpa entri ini lewat kolom JSON `model_routes` di group_configs,
+# contoh: {"moderation": {"model": "gemma2-9b-it", "max_tokens": 32}}
+TASK_MODEL_ROUTES = {
+    "qa": {
+        "model": None,
+        "fallback_models": [DEFAULT_GROQ_MODEL, "llama-3.1-8b-instant"],
+        "max_tokens": GROQ_MAX_TOKENS,
+        "temperature": 0.7,
+        "timeout_seconds": 30.0,
+    },
+    "moderation": {
+        "model": "llama-3.1-8b-instant",
+        "fallback_models": ["gemma2-9b-it"],
+        "max_tokens": 48,
+        "temperature": 0.0,
+        "timeout_seconds": 6.0,
+    },
+    "welcome": {
+        "model": "gemma2-9b-it",
+        "fallback_models": ["llama-3.1-8b-instant"],
+        "max_tokens": 160,
+        "temperature": 0.9,
+        "timeout_seconds": 10.0,
+    },
+    "summary": {
+        "model": "llama-3.1-8b-instant",
+        "fallback_models": [DEFAULT_GROQ_MODEL],
+        "max_tokens": 384,
+        "temperature": 0.3,
+        "timeout_seconds": 20.0,
+    },
+}
+# Jumlah client AsyncGroq (satu per API key) yang disimpan untuk dipakai ulang
+GROQ_CLIENT_CACHE_SIZE = 256
+
+# Akuntansi pemakaian Groq per grup/tugas: diakumulasi di memori, di-flush ke group_usage_daily tiap N detik.
+# Grup yang melewati kuota harian (kolom daily_token_quota / daily_request_quota) tidak dilayani Q&A,
+# dan hanya sebagian kecil pesan yang tetap dimoderasi.
+USAGE_FLUSH_INTERVAL_SECONDS = 30
+USAGE_OVER_QUOTA_MODERATION_SAMPLE_RATE = 0.1
+
+# Berapa lama sebuah model (per API key) dilewati setelah timeout / error server
+MODEL_FAILURE_COOLDOWN_SECONDS = 60
+
+# Hedging: jika model utama belum menjawab setelah p95 latensinya, kirim request
+# yang sama ke model sekunder; jawaban pertama yang dipakai.
+GROQ_HEDGING_ENABLED = False
+GROQ_HEDGE_MODELS = {
+    "llama3-70b-8192": "llama-3.1-8b-instant",
+    "deepseek-r1-distill-llama-70b": "llama3-70b-8192",
+    "gemma2-9b-it": "llama-3.1-8b-instant",
+}
+GROQ_HEDGE_PERCENTILE = 0.95
+GROQ_HEDGE_MIN_SAMPLES = 20
+GROQ_HEDGE_MIN_DELAY_SECONDS = 0.5
+
+# Indikator "sedang berpikir" untuk jawaban AI: "typing" = heartbeat sendChatAction lalu jawaban
+# dikirim sebagai satu pesan; "placeholder" = pesan ai_thinking yang kemudian di-edit;
+# "auto" = typing, kecuali persentil latensi model qa (dari statistik live) melewati ambang.
+AI_PROGRESS_MODE = "auto"
+AI_TYPING_HEARTBEAT_SECONDS = 4.5
+AI_PLACEHOLDER_LATENCY_THRESHOLD_SECONDS = 8.0
+AI_PLACEHOLDER_LATENCY_PERCENTILE = 0.9
+AI_PLACEHOLDER_MIN_SAMPLES = 10
+
+# Jawaban yang setelah dirender butuh lebih dari N pesan dikirim sebagai satu dokumen .md
+# (dibangun di memori) dengan preview singkat, bukan rangkaian reply berurutan
+AI_ANSWER_DOCUMENT_MIN_CHUNKS = 4
+AI_ANSWER_DOCUMENT_PREVIEW_CHARS = 700
+
+# Tracing per update: trace yang total durasinya melewati ambang ditulis sebagai JSON lines.
+# Bisa ditimpa lewat env TRACE_SLOW_THRESHOLD_SECONDS / TRACE_EXPORT_PATH.
+TRACING_ENABLED = True
+TRACE_SLOW_THRESHOLD_SECONDS = 3.0
+TRACE_EXPORT_PATH = "slow_traces.jsonl"
+
+# Monitor event loop (utils/loop_monitor.py): lag diukur tiap N detik dari keterlambatan sleep.
+# Jika loop tidak berdetak lebih lama dari ambang, thread watchdog mengambil stack thread loop
+# dan mencatat handler/update yang sedang berjalan; stack ditulis paling sering sekali per cooldown.
+LOOP_LAG_SAMPLE_INTERVAL_SECONDS = 0.25
+LOOP_STALL_THRESHOLD_SECONDS = 0.5
+LOOP_STALL_STACK_COOLDOWN_SECONDS = 10.0
+
+# Logging: pipeline QueueHandler + JSON (utils/log_pipeline.py). Level per kategori = level
+# per nama logger; bisa ditimpa lewat env LOG_LEVEL, LOG_FORMAT dan LOG_LEVELS ("nama=LEVEL,...").
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "json"
+LOG_CATEGORY_LEVELS = {
+    "wisedebot.moderation": "INFO",
+    "wisedebot.supabase": "INFO",
+    "wisedebot.groq": "INFO",
+    "wisedebot.i18n": "WARNING",
+    "wisedebot.loop": "INFO",
+    # httpx mencatat setiap request Supabase/Groq pada level INFO
+    "httpx": "WARNING",
+    "aiogram.event": "INFO",
+}
+# Sampling log INFO/DEBUG per lokasi pemanggilan: paling banyak N record per window
+LOG_SAMPLE_MAX_PER_WINDOW = 20
+LOG_SAMPLE_WINDOW_SECONDS = 10.0
+
+def resolve_task_route(task: str, group_config: dict | None = None) -> dict:
+    route = dict(TASK_MODEL_ROUTES.get(task, TASK_MODEL_ROUTES["qa"]))
+    group_config = group_config or {}
+    overrides = (group_config.get("model_routes") or {}).get(task)
+    if isinstance(overrides, dict):
+        route.update({k: v for k, v in overrides.items() if k in route and v is not None})
+    if not route.get("model"):
+        route["model"] = group_config.get("groq_model") or DEFAULT_GROQ_MODEL
+    route["fallback_models"] = [
+        m for i, m in enumerate(route.get("fallback_models") or [])
+        if m and m != route["model"] and m not in route["fallback_models"][:i]
+    ]
+    return route
+
+# Snapshot lokal group_configs: dimuat penuh per halaman saat startup, lalu hanya baris dengan
+# last_updated_at yang lebih baru dari sinkronisasi terakhir yang diambil ulang tiap N detik
+GROUP_CONFIG_PRELOAD_PAGE_SIZE = 1000
+GROUP_CONFIG_REFRESH_SECONDS = 5.0
+GROUP_CONFIG_DELTA_OVERLAP_SECONDS = 30.0
+# Cache negatif "grup ini tidak punya baris config", dipakai selama snapshot belum termuat
+GROUP_CONFIG_NEGATIVE_TTL_SECONDS = 300
+GROUP_CONFIG_NEGATIVE_MAX_ENTRIES = 20000
+
 CONVERSATION_HISTORY_LIMIT = 10
+
+# Retrieval leksikal (BM25) atas history grup, pengganti "N giliran terakhir"
+HISTORY_INDEX_MAX_MESSAGES = 400
+# Jumlah indeks (grup, topik) yang disimpan di memori; yang paling lama tidak dipakai dibuang (LRU)
+HISTORY_INDEX_MAX_GROUPS = 1000
+HISTORY_RETRIEVAL_TOP_K = 4
+HISTORY_RETRIEVAL_RECENT_TURNS = 2
+
+# Konteks berbasis reply chain: jika user membalas jawaban bot, hanya thread itu yang dikirim
+REPLY_THREAD_MAX_TURNS = 8
+REPLY_THREAD_CACHE_MAX_NODES = 5000
+# Pesan bot yang bukan jawaban AI (welcome, peringatan, dsb.) diingat sebagai miss supaya
+# membalasnya tidak memicu query Supabase setiap kali
+REPLY_THREAD_NEGATIVE_MAX_ENTRIES = 20000
+REPLY_THREAD_NEGATIVE_TTL_SECONDS = 600
+
+# Cache jawaban exact-match (opt-in per grup lewat kolom answer_cache_enabled)
+ANSWER_CACHE_TTL_SECONDS = 6 * 60 * 60
+ANSWER_CACHE_MAX_ENTRIES = 2000
+# Jumlah giliran history terakhir yang ikut di-fingerprint jika answer_cache_history_scoped aktif
+ANSWER_CACHE_HISTORY_FINGERPRINT_TURNS = 4
+# Payload tombol "show thoughts": dibatasi jumlah entri, total byte dan TTL; payload besar dikompres.
+# THOUGHTS_STORE_SQLITE_PATH (atau env THOUGHTS_STORE_PATH) menyimpan salinan di SQLite
+# supaya tombol tetap berfungsi setelah restart. None = hanya di memori.
+THOUGHTS_STORE_MAX_ENTRIES = 2000
+THOUGHTS_STORE_MAX_BYTES = 32 * 1024 * 1024
+THOUGHTS_STORE_TTL_SECONDS = 24 * 60 * 60
+THOUGHTS_STORE_COMPRESS_MIN_BYTES = 1024
+THOUGHTS_STORE_SQLITE_PATH = None
 PRIVACY_POLICY_URL = "https://t.me/botaralabs/16" 
 START_COMMAND_IMAGE_FILE_ID = "AgACAgUAAxkBAAIB0Gg1ROrJzEJPqk3XbYlyiWmuU0R6AAKZyTEbvRepVWq-f_fK236MAQADAgADeQADNgQ" 
 
+# Pool template welcome AI per grup (placeholder masih utuh), diisi ulang di background
+WELCOME_POOL_SIZE = 5
+WELCOME_POOL_LOW_WATERMARK = 2
+
+# Penggabungan join: join dalam satu window dikirimi satu pesan welcome bersama.
+# Di atas ambang, grup masuk mode tenang (satu ringkasan, lalu tanpa welcome untuk sementara).
+WELCOME_JOIN_WINDOW_SECONDS = 3.0
+WELCOME_BURST_QUIET_THRESHOLD = 10
+WELCOME_QUIET_MODE_SECONDS = 300
+
 MODERATION_LEVELS = {
     "disabled": "Disabled",
     "low": "Low",
@@ -54,3 +219,17 @@ MODERATION_LEVELS = {
     "very_aggressive": "Very Aggressive"
 }
 DEFAULT_MODERATION_LEVEL = "disabled"
+
+# Batas laju pemicu AI (sliding window) per user dan per grup, dipilih per grup lewat menu
+# /set_ai_triggers (kolom ai_rate_limit_level). Nilai: (maks per user, maks per grup) dalam
+# satu window; None = tanpa batas.
+AI_RATE_LIMIT_LEVELS = {
+    "off": None,
+    "relaxed": (10, 60),
+    "normal": (5, 30),
+    "strict": (2, 10)
+}
+DEFAULT_AI_RATE_LIMIT_LEVEL = "normal"
+AI_RATE_LIMIT_WINDOW_SECONDS = 60
+# Counter user/grup yang tidak aktif selama 2 window dibuang paling cepat tiap N detik
+AI_RATE_LIMIT_SWEEP_SECONDS = 120
@@ -1,24 +1,29 @@
+from __future__ import annotations
 import asyncio
 import logging
 from aiogram import Bot, Router, types, F
-from aiogram.filters import Command, StateFilter
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.base import StorageKey
 from aiogram.enums import ChatMemberStatus
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from supabase import Client as SupabaseClient
+from typing import TYPE_CHECKING
 from datetime import datetime
 from utils.helpers import escape_html_tags
 from states.setup_states import AISetupStates
-from utils.supabase_interface import get_ai_config, get_group_language, delete_ai_config, save_ai_config
+from utils.supabase_interface import get_ai_config, get_group_language, delete_ai_config, save_ai_config, set_group_quota
+from utils.usage_tracker import usage_tracker
 from bot_config import (
     DEFAULT_GROQ_MODEL, AVAILABLE_LANGUAGES, DEFAULT_LANGUAGE,
     AVAILABLE_GROQ_MODELS, get_model_display_name,
-    MODERATION_LEVELS, DEFAULT_MODERATION_LEVEL
+    MODERATION_LEVELS, DEFAULT_MODERATION_LEVEL,
+    AI_RATE_LIMIT_LEVELS, DEFAULT_AI_RATE_LIMIT_LEVEL, AI_RATE_LIMIT_WINDOW_SECONDS
 )
 from middlewares.i18n_middleware import load_translations
+if TYPE_CHECKING:
+    from supabase import Client as SupabaseClient
 
-admin_router = Router()
+admin_router = Router(name="admin")
 TRIGGERS_CALLBACK_PREFIX = "aitrig:"
 MODERATION_CALLBACK_PREFIX = "modcfg:"
 
@@ -59,6 +64,15 @@ async def build_triggers_menu(
     cmd_enabled = config.get('ai_trigger_command_enabled', True)
     mention_enabled = config.get('ai_trigger_mention_enabled', True)
     custom_prefix = config.get('ai_trigger_custom_prefix')
+    answer_cache_enabled = config.get('answer_cache_enabled', False)
+    rate_limit_level = config.get('ai_rate_limit_level') or DEFAULT_AI_RATE_LIMIT_LEVEL
+    rate_limits = AI_RATE_LIMIT_LEVELS.get(rate_limit_level)
+    rate_limit_name = get_menu_text(f"rate_limit_level_{rate_limit_level}", default_text=rate_limit_level.capitalize())
+    if rate_limits:
+        rate_limit_name += " " + get_menu_text(
+            "rate_limit_level_details", user_limit=rate_limits[0], group_limit=rate_limits[1],
+            window_seconds=AI_RATE_LIMIT_WINDOW_SECONDS
+        )
 
     text_kwargs_title = {"group_name": current_raw_group_name}
 
@@ -66,6 +80,8 @@ async def build_triggers_menu(
     text += f"1. {get_menu_text('trigger_ask_ai_command')}: <b>{get_menu_text('status_enabled') if cmd_enabled else get_menu_text('status_disabled')}</b>\n"
     text += f"2. {get_menu_text('trigger_bot_mention', bot_username=f'@{bot_username_from_fsm}')}: <b>{get_menu_text('status_enabled') if mention_enabled else get_menu_text('status_disabled')}</b>\n"
     text += f"3. {get_menu_text('trigger_custom_prefix')}: {f'<code>{escape_html_tags(custom_prefix)}</code>' if custom_prefix else get_menu_text('status_not_set')}\n"
+    text += f"\n{get_menu_text('trigger_answer_cache')}: <b>{get_menu_text('status_enabled') if answer_cache_enabled else get_menu_text('status_disabled')}</b>\n"
+    text += f"{get_menu_text('trigger_rate_limit')}: <b>{rate_limit_name}</b>\n"
 
     builder = InlineKeyboardBuilder()
     builder.button(
@@ -79,8 +95,13 @@ async def build_triggers_menu(
     builder.button(text=get_menu_text("button_set_custom_prefix"), callback_data=f"{TRIGGERS_CALLBACK_PREFIX}set_prefix")
     if custom_prefix:
         builder.button(text=get_menu_text("button_remove_custom_prefix"), callback_data=f"{TRIGGERS_CALLBACK_PREFIX}remove_prefix")
+    builder.button(
+        text=get_menu_text("button_toggle_answer_cache") + (f" ({get_menu_text('status_disabled')})" if not answer_cache_enabled else f" ({get_menu_text('status_enabled')})"),
+        callback_data=f"{TRIGGERS_CALLBACK_PREFIX}toggle_cache"
+    )
+    builder.button(text=get_menu_text("button_cycle_rate_limit"), callback_data=f"{TRIGGERS_CALLBACK_PREFIX}cycle_rate_limit")
     builder.button(text=get_menu_text("button_done_triggers"), callback_data=f"{TRIGGERS_CALLBACK_PREFIX}done")
-    builder.adjust(1,1,2,1)
+    builder.adjust(1,1,2 if custom_prefix else 1,1,1,1)
     return text, builder.as_markup()
 
 async def build_moderation_menu(
@@ -464,6 +485,14 @@ async def cq_ai_triggers_handler(callback_query: types.CallbackQuery, state: FSM
     elif action == "toggle_mention":
         current_status = config.get('ai_trigger_mention_enabled', True)
         await save_ai_config(supabase_client, group_id, admin_user_id, trigger_mention_enabled=not current_status)
+    elif action == "toggle_cache":
+        current_status = config.get('answer_cache_enabled', False)
+        await save_ai_config(supabase_client, group_id, admin_user_id, answer_cache_enabled=not current_status)
+    elif action == "cycle_rate_limit":
+        levels = list(AI_RATE_LIMIT_LEVELS)
+        current_level = config.get('ai_rate_limit_level') or DEFAULT_AI_RATE_LIMIT_LEVEL
+        next_level = levels[(levels.index(current_level) + 1) % len(levels)] if current_level in levels else DEFAULT_AI_RATE_LIMIT_LEVEL
+        await save_ai_config(supabase_client, group_id, admin_user_id, ai_rate_limit_level=next_level)
     elif action == "set_prefix":
         await callback_query.message.edit_text(get_dm_trigger_text("ask_custom_prefix_dm"))
         await callback_query.answer()
@@ -476,7 +505,7 @@ async def cq_ai_triggers_handler(callback_query: types.CallbackQuery, state: FSM
         await callback_query.answer()
         return
 
-    if action in ["toggle_cmd", "toggle_mention", "remove_prefix"]:
+    if action in ["toggle_cmd", "toggle_mention", "toggle_cache", "cycle_rate_limit", "remove_prefix"]:
         new_text, new_keyboard_markup = await build_triggers_menu(
             bot, supabase_client, group_id, raw_group_name, bot_username, lang_code_for_dm
         )
@@ -652,3 +681,48 @@ async def cmd_cancel_moderation_setup_in_dm(message: types.Message, state: FSMCo
     await state.clear()
     await message.answer(cancel_message_text)
     logging.info(f"cmd_cancel_moderation_setup_in_dm: State cleared.")
+
+
+def _parse_quota_value(raw: str) -> int | None:
+    # "off" / "0" = tanpa batas; selain itu bilangan bulat positif, boleh memakai "_" atau "," sebagai pemisah ribuan.
+    # Input lain (mis. "1.5", "2.000.000", "-5") ditolak, bukan ditafsirkan ulang diam-diam.
+    if raw.lower() in ("off", "none", "0"):
+        return None
+    digits = raw.replace("_", "").replace(",", "")
+    if not digits.isascii() or not digits.isdigit():
+        raise ValueError(f"Invalid quota value: {raw}")
+    return int(digits) or None
+
+@admin_router.message(Command("set_quota"))
+async def cmd_set_quota(message: types.Message, command: CommandObject, supabase_client: SupabaseClient, _: callable, bot: Bot):
+    if message.chat.type == 'private':
+        await message.answer(_("command_only_in_group")); return
+    if not await is_admin(bot, message.chat.id, message.from_user.id):
+        await message.answer(_("admin_only_command")); return
+
+    group_id = message.chat.id
+    config = await get_ai_config(supabase_client, group_id) or {}
+    args = (command.args or "").split()
+
+    if not args:
+        requests_used, tokens_used = usage_tracker.usage_today(group_id)
+        unlimited = _("quota_unlimited")
+        await message.answer(_(
+            "quota_status",
+            tokens_used=tokens_used, token_quota=config.get("daily_token_quota") or unlimited,
+            requests_used=requests_used, request_quota=config.get("daily_request_quota") or unlimited
+        ))
+        return
+
+    try:
+        token_quota = _parse_quota_value(args[0])
+        request_quota = _parse_quota_value(args[1]) if len(args) > 1 else config.get("daily_request_quota")
+    except ValueError:
+        await message.answer(_("quota_invalid_args"))
+        return
+
+    if await set_group_quota(supabase_client, group_id, message.from_user.id, token_quota, request_quota):
+        logging.info(f"SET_QUOTA: Group {group_id} quota set to tokens={token_quota}, requests={request_quota} by {message.from_user.id}.")
+        await message.answer(_("quota_set_success"))
+    else:
+        await message.answer(_("quota_set_fail"))
@@ -1,23 +1,141 @@
+from __future__ import annotations
+import asyncio
+import math
 import uuid
 import logging
+from contextlib import asynccontextmanager
 from aiogram import Router, types, F
+from aiogram.enums import ChatAction
+from aiogram.types import BufferedInputFile
 from aiogram.filters import Command
 # from aiogram.enums import ParseMode 
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from supabase import Client as SupabaseClient
+from typing import TYPE_CHECKING
 
-from utils.supabase_interface import get_ai_config, add_conversation_message, get_conversation_history
+from utils.supabase_interface import get_ai_config, add_conversation_message
 from utils.crypto_interface import CryptoUtil
-from utils.groq_interface import get_groq_completion
-from utils.helpers import escape_html_tags 
-from bot_config import DEFAULT_GROQ_MODEL 
+from utils.groq_interface import get_task_completion
+from utils.helpers import escape_html_tags, get_topic_id
+from utils.telegram_render import render_for_telegram, split_telegram_html, plain_preview, utf16_len, TELEGRAM_CAPTION_LIMIT
+from utils.thoughts_store import thoughts_store
+from utils.usage_tracker import usage_tracker
+from utils.rate_limiter import ai_rate_limiter
+from utils.metrics import QUOTA_DEGRADED, AI_PROGRESS_INDICATOR
+from utils.latency_stats import groq_latency
+from utils.history_index import ensure_group_index, select_context_messages
+from utils.reply_threads import get_thread_context, register_turn, thread_lock
+from utils.answer_cache import build_answer_cache_key, fingerprint_history, get_cached_answer, store_answer
+from bot_config import (
+    ANSWER_CACHE_HISTORY_FINGERPRINT_TURNS, resolve_task_route,
+    AI_PROGRESS_MODE, AI_TYPING_HEARTBEAT_SECONDS, AI_PLACEHOLDER_LATENCY_THRESHOLD_SECONDS,
+    AI_PLACEHOLDER_LATENCY_PERCENTILE, AI_PLACEHOLDER_MIN_SAMPLES,
+    AI_ANSWER_DOCUMENT_MIN_CHUNKS, AI_ANSWER_DOCUMENT_PREVIEW_CHARS
+)
+if TYPE_CHECKING:
+    from supabase import Client as SupabaseClient
 
-ai_response_router = Router()
+ai_response_router = Router(name="ai_response")
 
-pending_thoughts_cache: dict[str, str] = {}
 THOUGHTS_CALLBACK_PREFIX = "show_thoughts:"
 
 
+async def deliver_ai_response(
+    message: types.Message,
+    thinking_message: types.Message | None,
+    main_response_raw: str,
+    thoughts_content: str | None,
+    _: callable
+) -> list[types.Message]:
+    # Jika thinking_message None (jawaban dari cache atau mode typing), jawaban dikirim sebagai reply baru.
+    # Mengembalikan pesan-pesan yang berisi jawaban, supaya reply chain bisa dilacak.
+    sent_messages: list[types.Message] = []
+
+    async def send_first(text: str, reply_markup=None):
+        if thinking_message:
+            edited = await thinking_message.edit_text(text, reply_markup=reply_markup)
+            sent_messages.append(edited if isinstance(edited, types.Message) else thinking_message)
+        else:
+            sent_messages.append(await message.reply(text, reply_markup=reply_markup))
+
+    if main_response_raw.startswith("GROQ_API_ERROR:") or main_response_raw.startswith("UNEXPECTED_GROQ_ERROR:"):
+        error_details_raw = main_response_raw.split(":", 1)[1].strip() if ":" in main_response_raw else main_response_raw
+        safe_error_details = escape_html_tags(error_details_raw)
+        await send_first(_("ai_error_groq_api", error_details=safe_error_details))
+        return sent_messages
+
+    chunks = render_for_telegram(main_response_raw)
+
+    reply_markup = None
+    if thoughts_content:
+        thought_id = str(uuid.uuid4())
+        await thoughts_store.put(thought_id, thoughts_content)
+        builder = InlineKeyboardBuilder()
+        builder.button(text=_("button_show_thoughts"), callback_data=f"{THOUGHTS_CALLBACK_PREFIX}{thought_id}")
+        reply_markup = builder.as_markup()
+
+    try:
+        if not chunks:
+            await send_first(_("ai_error_generic"))
+            return sent_messages
+        if len(chunks) >= AI_ANSWER_DOCUMENT_MIN_CHUNKS:
+            await _deliver_as_document(message, thinking_message, main_response_raw, reply_markup, sent_messages, _)
+            return sent_messages
+        await send_first(chunks[0], reply_markup=reply_markup)
+        for chunk in chunks[1:]:
+            sent_messages.append(await message.reply(chunk))
+    except Exception as e_send:
+        logging.error(f"Error sending rendered AI response: {repr(e_send)}. Falling back to plain text.")
+        try:
+            # Render gagal diterima Telegram: kirim jawaban mentah sebagai teks biasa.
+            # Jika sebagian chunk sudah terkirim, sisanya tidak diulang supaya tidak dobel.
+            if not sent_messages:
+                plain_chunks = split_telegram_html(escape_html_tags(main_response_raw))
+                await send_first(plain_chunks[0], reply_markup=reply_markup)
+                for chunk in plain_chunks[1:]:
+                    sent_messages.append(await message.reply(chunk))
+        except Exception as e_plain:
+            logging.error(f"Error sending AI response even as plain text: {repr(e_plain)}. Original AI raw: {main_response_raw}")
+            await send_first(_("ai_error_generic") + "(Could not display formatted response)")
+    return sent_messages
+
+
+async def _deliver_as_document(
+    message: types.Message,
+    thinking_message: types.Message | None,
+    main_response_raw: str,
+    reply_markup,
+    sent_messages: list[types.Message],
+    _: callable
+):
+    # Satu upload dari buffer memori menggantikan banyak reply berurutan (dan flood wait-nya).
+    # Tanpa placeholder: cukup satu panggilan API, preview ikut sebagai caption dokumen.
+    header = _("ai_answer_sent_as_document")
+    document = BufferedInputFile(main_response_raw.encode("utf-8"), filename=f"answer-{message.message_id}.md")
+    if thinking_message:
+        # Upload dulu: jika gagal, placeholder belum tersentuh dan sent_messages masih kosong,
+        # sehingga fallback di pemanggil tetap mengirim jawaban sebagai teks biasa.
+        document_message = await message.reply_document(document)
+        preview = plain_preview(main_response_raw, AI_ANSWER_DOCUMENT_PREVIEW_CHARS * 2)
+        try:
+            edited = await thinking_message.edit_text(f"{header}\n\n{preview}", reply_markup=reply_markup)
+            sent_messages.append(edited if isinstance(edited, types.Message) else thinking_message)
+        except Exception as e_edit:
+            # Dokumen sudah terkirim; placeholder cukup diganti header polos (atau dihapus)
+            # supaya tidak tertinggal sebagai "sedang berpikir".
+            logging.warning(f"Could not edit placeholder after sending answer document: {repr(e_edit)}")
+            try:
+                await thinking_message.edit_text(escape_html_tags(header))
+            except Exception:
+                try:
+                    await thinking_message.delete()
+                except Exception as e_delete:
+                    logging.error(f"Could not replace placeholder after sending answer document: {repr(e_delete)}")
+        sent_messages.append(document_message)
+    else:
+        preview = plain_preview(main_response_raw, min(AI_ANSWER_DOCUMENT_PREVIEW_CHARS, TELEGRAM_CAPTION_LIMIT - utf16_len(header) - 2))
+        sent_messages.append(await message.reply_document(document, caption=f"{header}\n\n{preview}", reply_markup=reply_markup))
+
+
 async def process_ai_request(message: types.Message, user_question: str, supabase_client: SupabaseClient, crypto_util: CryptoUtil, _: callable):
     group_id = message.chat.id
     config = await get_ai_config(supabase_client, group_id)
@@ -30,6 +148,20 @@ async def process_ai_request(message: types.Message, user_question: str, supabas
         await message.reply(_("ai_error_config_inactive"))
         return
 
+    requester_id = message.from_user.id if message.from_user else (message.sender_chat.id if message.sender_chat else 0)
+    throttled = ai_rate_limiter.check(group_id, requester_id, config)
+    if throttled:
+        scope, wait_seconds, notify = throttled
+        # Permintaan berikutnya dalam window yang sama diabaikan diam-diam
+        if notify:
+            await message.reply(_(f"ai_rate_limited_{scope}", seconds=max(1, math.ceil(wait_seconds))))
+        return
+
+    if usage_tracker.quota_exhausted(group_id, config):
+        QUOTA_DEGRADED.inc("qa")
+        await message.reply(_("ai_quota_exhausted"))
+        return
+
     encrypted_api_key = config.get("encrypted_groq_api_key")
     if not encrypted_api_key:
         await message.reply(_("ai_error_no_api_key"))
@@ -40,84 +172,156 @@ async def process_ai_request(message: types.Message, user_question: str, supabas
         await message.reply(_("ai_error_decryption_failed"))
         return
 
+    # Jika user membalas jawaban bot, konteks diambil dari reply chain tersebut saja
+    thread_context = None
+    reply_target = message.reply_to_message
+    if reply_target and reply_target.from_user and reply_target.from_user.id == message.bot.id:
+        thread_context = await get_thread_context(supabase_client, group_id, reply_target.message_id)
+
+    if thread_context:
+        thread_root_id = thread_context[1]
+        async with thread_lock(group_id, thread_root_id):
+            # Dibaca ulang di dalam lock: giliran sebelumnya di thread ini bisa saja baru selesai dicatat
+            thread_context = await get_thread_context(supabase_client, group_id, reply_target.message_id)
+            thread_messages = thread_context[0] if thread_context else None
+            await _answer_ai_question(
+                message, user_question, config, decrypted_api_key, supabase_client, _,
+                thread_messages=thread_messages, parent_message_id=reply_target.message_id
+            )
+    else:
+        await _answer_ai_question(message, user_question, config, decrypted_api_key, supabase_client, _)
+
+
+def _use_thinking_placeholder(config: dict) -> bool:
+    if AI_PROGRESS_MODE != "auto":
+        return AI_PROGRESS_MODE == "placeholder"
+    # Placeholder hanya untuk model yang biasanya lambat; tanpa cukup sampel, anggap cepat
+    expected_seconds = groq_latency.percentile(
+        resolve_task_route("qa", config)["model"], AI_PLACEHOLDER_LATENCY_PERCENTILE, min_samples=AI_PLACEHOLDER_MIN_SAMPLES
+    )
+    return expected_seconds is not None and expected_seconds >= AI_PLACEHOLDER_LATENCY_THRESHOLD_SECONDS
+
+
+@asynccontextmanager
+async def _typing_heartbeat(message: types.Message):
+    # Status "typing" dari Telegram hilang setelah ~5 detik, jadi dikirim ulang selama completion berjalan
+    async def beat():
+        while True:
+            try:
+                await message.bot.send_chat_action(
+                    chat_id=message.chat.id, action=ChatAction.TYPING, message_thread_id=get_topic_id(message)
+                )
+            except Exception as e:
+                logging.debug(f"Typing heartbeat stopped for chat {message.chat.id}: {repr(e)}")
+                return
+            await asyncio.sleep(AI_TYPING_HEARTBEAT_SECONDS)
+
+    heartbeat_task = asyncio.create_task(beat())
+    try:
+        yield
+    finally:
+        heartbeat_task.cancel()
+
+
+async def _record_ai_turn(
+    supabase_client: SupabaseClient,
+    group_id: int,
+    user_question: str,
+    main_response_raw: str,
+    sent_messages: list[types.Message],
+    parent_message_id: int | None,
+    topic_id: int | None
+):
+    answer_message_id = sent_messages[0].message_id if sent_messages else None
+    await add_conversation_message(supabase_client, group_id, "user", user_question, answer_message_id, parent_message_id, topic_id)
+    await add_conversation_message(supabase_client, group_id, "assistant", main_response_raw, answer_message_id, parent_message_id, topic_id)
+    if sent_messages:
+        register_turn(group_id, [m.message_id for m in sent_messages], user_question, main_response_raw, parent_message_id)
+
+
+async def _answer_ai_question(
+    message: types.Message,
+    user_question: str,
+    config: dict,
+    decrypted_api_key: str,
+    supabase_client: SupabaseClient,
+    _: callable,
+    thread_messages: list[dict] | None = None,
+    parent_message_id: int | None = None
+):
+    group_id = message.chat.id
+    topic_id = get_topic_id(message)
     system_prompt_text = config.get("system_prompt", "You are a helpful assistant.")
-    groq_model = config.get("groq_model", DEFAULT_GROQ_MODEL)
 
-    thinking_message = await message.reply(_("ai_thinking"))
+    history_index = None
+    if thread_messages is None:
+        history_index = await ensure_group_index(supabase_client, group_id, topic_id)
+
+    # Cache jawaban (opt-in): jika hit, tidak perlu placeholder maupun panggilan LLM.
+    # Balasan di dalam thread tidak di-cache karena maknanya bergantung pada thread tersebut.
+    cache_key = None
+    if config.get("answer_cache_enabled", False) and history_index is not None:
+        history_fingerprint = None
+        if config.get("answer_cache_history_scoped", False):
+            recent_seqs = history_index.recent_seqs(ANSWER_CACHE_HISTORY_FINGERPRINT_TURNS)
+            history_fingerprint = fingerprint_history(history_index.messages_for(set(recent_seqs)))
+        qa_model = resolve_task_route("qa", config)["model"]
+        cache_key = build_answer_cache_key(group_id, topic_id, system_prompt_text, qa_model, user_question, history_fingerprint)
+        cached_answer = get_cached_answer(cache_key)
+        if cached_answer:
+            sent_messages = await deliver_ai_response(message, None, cached_answer["main_response"], cached_answer["thoughts"], _)
+            await _record_ai_turn(supabase_client, group_id, user_question, cached_answer["main_response"], sent_messages, None, topic_id)
+            return
 
-    history_messages_db = await get_conversation_history(supabase_client, group_id)
+    thinking_message = None
+    if _use_thinking_placeholder(config):
+        AI_PROGRESS_INDICATOR.inc("placeholder")
+        thinking_message = await message.reply(_("ai_thinking"))
+    else:
+        AI_PROGRESS_INDICATOR.inc("typing")
+
+    async def report_failure(text: str):
+        if thinking_message:
+            await thinking_message.edit_text(text)
+        else:
+            await message.reply(text)
+
+    if thread_messages is not None:
+        context_messages = thread_messages
+    else:
+        # Hanya giliran yang relevan dengan pertanyaan (BM25) + beberapa giliran terakhir
+        context_messages = select_context_messages(history_index, user_question)
     messages_for_groq = [{"role": "system", "content": system_prompt_text}]
-    for hist_msg in history_messages_db:
+    for hist_msg in context_messages:
         messages_for_groq.append({"role": hist_msg["role"], "content": hist_msg["content"]})
     messages_for_groq.append({"role": "user", "content": user_question})
 
-    parsed_groq_response = await get_groq_completion(
-        api_key=decrypted_api_key,
-        model=groq_model,
-        system_prompt_for_call="", 
-        user_prompt_for_call="",   
-        full_messages_list=messages_for_groq
-    )
+    if thinking_message:
+        parsed_groq_response = await get_task_completion(
+            api_key=decrypted_api_key, task="qa", messages=messages_for_groq, group_config=config, group_id=group_id
+        )
+    else:
+        async with _typing_heartbeat(message):
+            parsed_groq_response = await get_task_completion(
+                api_key=decrypted_api_key, task="qa", messages=messages_for_groq, group_config=config, group_id=group_id
+            )
 
     if parsed_groq_response:
         main_response_raw = parsed_groq_response.get("main_response")
         thoughts_content = parsed_groq_response.get("thoughts")
 
         if main_response_raw:
-            # Simpan ke history sebelum di-escape untuk tampilan
-            await add_conversation_message(supabase_client, group_id, "user", user_question)
-            await add_conversation_message(supabase_client, group_id, "assistant", main_response_raw)
-
-            if main_response_raw.startswith("GROQ_API_ERROR:") or main_response_raw.startswith("UNEXPECTED_GROQ_ERROR:"):
-                error_details_raw = main_response_raw.split(":", 1)[1].strip() if ":" in main_response_raw else main_response_raw
-                safe_error_details = escape_html_tags(error_details_raw)
-                await thinking_message.edit_text(_("ai_error_groq_api", error_details=safe_error_details))
-            else:
-                safe_ai_response = escape_html_tags(main_response_raw)
-                response_to_send = safe_ai_response
-
-                if (main_response_raw.strip().startswith("```") and main_response_raw.strip().endswith("```")):
-                    code_content = main_response_raw.strip()[3:-3]
-                    if '\n' in code_content:
-                        first_line, rest_of_code = code_content.split('\n', 1)
-                        common_langs = ["html", "python", "javascript", "css", "json", "sql", "java", "c", "c++", "csharp", "latex", ""]
-                        if first_line.strip().lower() in common_langs:
-                            code_content = rest_of_code
-                        # else: code_content tetap sama (mengandung penanda bahasa atau tidak)
-                    response_to_send = f"<pre><code>{escape_html_tags(code_content.strip())}</code></pre>"
-                elif (main_response_raw.count('\n') > 3 and len(main_response_raw) > 100) or \
-                     main_response_raw.strip().lower().startswith("<!doctype html") or \
-                     main_response_raw.strip().lower().startswith("<html") or \
-                     main_response_raw.strip().lower().startswith("<?xml"):
-                    response_to_send = f"<pre>{safe_ai_response}</pre>"
-
-                reply_markup = None
-                if thoughts_content:
-                    thought_id = str(uuid.uuid4())
-                    pending_thoughts_cache[thought_id] = thoughts_content
-                    builder = InlineKeyboardBuilder()
-                    builder.button(text=_("button_show_thoughts"), callback_data=f"{THOUGHTS_CALLBACK_PREFIX}{thought_id}")
-                    reply_markup = builder.as_markup()
+            is_error_response = main_response_raw.startswith("GROQ_API_ERROR:") or main_response_raw.startswith("UNEXPECTED_GROQ_ERROR:")
+            if cache_key and not is_error_response:
+                store_answer(cache_key, main_response_raw, thoughts_content)
 
-                try:
-                    if len(response_to_send) > 4000: 
-                        first_chunk = True
-                        for i in range(0, len(response_to_send), 4000):
-                            chunk = response_to_send[i:i+4000]
-                            if first_chunk:
-                                await thinking_message.edit_text(chunk, reply_markup=reply_markup if i == 0 else None)
-                                first_chunk = False
-                            else:
-                                await message.reply(chunk)
-                    else:
-                        await thinking_message.edit_text(response_to_send, reply_markup=reply_markup)
-                except Exception as e_send:
-                    logging.error(f"Error sending AI response even after HTML escaping: {repr(e_send)}. Original AI raw: {main_response_raw}")
-                    await thinking_message.edit_text(_("ai_error_generic") + "(Could not display formatted response)")
+            sent_messages = await deliver_ai_response(message, thinking_message, main_response_raw, thoughts_content, _)
+            # Simpan versi mentah (belum di-escape) ke history, bersama message_id jawaban untuk reply chain
+            await _record_ai_turn(supabase_client, group_id, user_question, main_response_raw, sent_messages, parent_message_id, topic_id)
         else: 
-             await thinking_message.edit_text(_("generic_error") + " (Empty AI response)")
+             await report_failure(_("generic_error") + " (Empty AI response)")
     else:
-        await thinking_message.edit_text(_("generic_error"))
+        await report_failure(_("generic_error"))
 # --- AKHIR DEFINISI process_ai_request ---
 
 
@@ -152,30 +356,21 @@ async def cmd_ask_ai(message: types.Message, command: Command, supabase_client:
 @ai_response_router.callback_query(F.data.startswith(THOUGHTS_CALLBACK_PREFIX))
 async def cq_show_thoughts(callback_query: types.CallbackQuery, _: callable):
     thought_id = callback_query.data.split(THOUGHTS_CALLBACK_PREFIX)[1]
-    thoughts_text_raw = pending_thoughts_cache.pop(thought_id, None)
+    # get, bukan pop: tombol yang sama boleh ditekan lebih dari sekali sampai entri kedaluwarsa
+    thoughts_text_raw = await thoughts_store.get(thought_id)
 
     if thoughts_text_raw:
-        safe_thoughts_text = escape_html_tags(thoughts_text_raw) 
-        header = _("ai_thoughts_header") 
-        full_thought_message = f"{header}\n<pre>{safe_thoughts_text}</pre>"
-
-        if len(full_thought_message) > 4096 :
-            for i in range(0, len(full_thought_message), 4090): 
-                chunk_to_send = full_thought_message[i:i+4090]
+        header = _("ai_thoughts_header")
+        chunks = split_telegram_html(f"{header}\n<pre>{escape_html_tags(thoughts_text_raw)}</pre>")
+        try:
+            for chunk in chunks:
                 if callback_query.message:
-                    await callback_query.message.reply(chunk_to_send) 
+                    await callback_query.message.reply(chunk)
                 else:
-                    await callback_query.bot.send_message(callback_query.from_user.id, chunk_to_send)
+                    await callback_query.bot.send_message(callback_query.from_user.id, chunk)
             await callback_query.answer()
-        else:
-            try:
-                if callback_query.message:
-                     await callback_query.message.reply(full_thought_message) 
-                else:
-                     await callback_query.bot.send_message(callback_query.from_user.id, full_thought_message)
-                await callback_query.answer() 
-            except Exception as e:
-                print(f"Error sending thoughts: {e}")
-                await callback_query.answer(_("generic_error"), show_alert=True)
+        except Exception as e:
+            logging.error(f"Error sending thoughts: {repr(e)}")
+            await callback_query.answer(_("generic_error"), show_alert=True)
     else:
         await callback_query.answer("Sorry, I couldn't retrieve the thought process. It might have expired.", show_alert=True)
@@ -1,25 +1,33 @@
-import asyncio
+from __future__ import annotations
 import logging
-import re
+import time
 from aiogram import Router, types, F, Bot
 from aiogram.filters import CommandStart, Command, ChatMemberUpdatedFilter, KICKED, MEMBER, LEFT, RESTRICTED
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.context import FSMContext
 from aiogram.enums import ChatMemberStatus, ParseMode, ContentType
-from supabase import Client as SupabaseClient
+from typing import TYPE_CHECKING
 from bot_config import (
     AVAILABLE_LANGUAGES, DEFAULT_LANGUAGE, DEFAULT_GROQ_MODEL,
     PRIVACY_POLICY_URL, START_COMMAND_IMAGE_FILE_ID,
-    MODERATION_LEVELS
+    MODERATION_LEVELS, WELCOME_JOIN_WINDOW_SECONDS, WELCOME_BURST_QUIET_THRESHOLD,
+    WELCOME_QUIET_MODE_SECONDS
 )
 from utils.supabase_interface import set_group_language, clear_conversation_history, get_group_language, get_ai_config
-from utils.helpers import escape_html_tags
-from utils.groq_interface import get_groq_completion
+from utils.helpers import escape_html_tags, get_topic_id
+from utils.welcome_pool import take_welcome_template
+from utils.welcome_template import CompiledTemplate, build_welcome_values, get_compiled_custom_template
+from utils.join_aggregator import JoinAggregator
 from utils.crypto_interface import CryptoUtil
 from handlers.user_settings_handlers import USER_SETTINGS_CALLBACK_PREFIX
 from middlewares.i18n_middleware import load_translations as load_specific_translations_common
+if TYPE_CHECKING:
+    from supabase import Client as SupabaseClient
 
-common_router = Router()
+common_router = Router(name="common")
+
+# group_id -> waktu monotonic sampai mode tenang welcome berakhir
+welcome_quiet_until: dict[int, float] = {}
 
 HELP_CAT_PREFIX = "help_cat:"
 HELP_CMD_PREFIX = "help_cmd:"
@@ -32,7 +40,8 @@ ADMIN_COMMANDS_HELP = [
     ("newchat", "help_btn_newchat"),
     ("set_ai_triggers", "help_btn_set_ai_triggers"),
     ("set_welcome", "help_btn_set_welcome"),
-    ("set_moderation", "help_btn_set_moderation")
+    ("set_moderation", "help_btn_set_moderation"),
+    ("set_quota", "help_btn_set_quota")
 ]
 
 USER_COMMANDS_HELP = [
@@ -283,19 +292,6 @@ async def cmd_set_language(message: types.Message, _: callable, supabase_client:
     if not (member.status == ChatMemberStatus.ADMINISTRATOR or member.status == ChatMemberStatus.CREATOR):
         await message.answer(_("admin_only_command"))
         return
-    current_lang_code_for_buttons = DEFAULT_LANGUAGE
-    try:
-        group_lang_response = await asyncio.to_thread(
-            supabase_client.table("group_configs")
-            .select("language_code")
-            .eq("group_id", message.chat.id)
-            .maybe_single()
-            .execute
-        )
-        if group_lang_response.data and group_lang_response.data.get("language_code"):
-             current_lang_code_for_buttons = group_lang_response.data.get("language_code")
-    except Exception as e:
-        print(f"Error fetching language for buttons, defaulting to '{DEFAULT_LANGUAGE}'. Group ID: {message.chat.id}. Error: {repr(e)}")
     builder = InlineKeyboardBuilder()
     for code, name in AVAILABLE_LANGUAGES.items():
         builder.button(text=f"{name} ({code})", callback_data=f"setlang_{code}")
@@ -323,19 +319,7 @@ async def cq_set_language(callback_query: types.CallbackQuery, _: callable, supa
             await callback_query.message.edit_text(get_new_lang_text("language_set_success", language_name=AVAILABLE_LANGUAGES[lang_code]))
             await callback_query.answer()
         else:
-            current_lang_code_for_error = DEFAULT_LANGUAGE
-            try:
-                group_lang_resp_err = await asyncio.to_thread(
-                    supabase_client.table("group_configs")
-                    .select("language_code")
-                    .eq("group_id", group_id)
-                    .maybe_single()
-                    .execute
-                )
-                if group_lang_resp_err.data and group_lang_resp_err.data.get("language_code"):
-                    current_lang_code_for_error = group_lang_resp_err.data.get("language_code")
-            except Exception as e:
-                 print(f"Error fetching language for error message, defaulting to '{DEFAULT_LANGUAGE}'. Group ID: {group_id}. Error: {repr(e)}")
+            current_lang_code_for_error = await get_group_language(supabase_client, group_id)
             error_translations = load_specific_translations_common(current_lang_code_for_error)
             def get_error_text(key, **kwargs):
                  return error_translations.get(key, f"[{key}]").format(**kwargs)
@@ -354,7 +338,8 @@ async def cmd_newchat(message: types.Message, supabase_client: SupabaseClient, _
         await message.answer(_("admin_only_command"))
         return
     group_id = message.chat.id
-    success = await clear_conversation_history(supabase_client, group_id)
+    # Di grup forum, /newchat hanya membersihkan history topik tempat perintah dikirim
+    success = await clear_conversation_history(supabase_client, group_id, get_topic_id(message))
     if success:
         await message.reply(_("conversation_history_cleared"))
     else:
@@ -365,7 +350,20 @@ async def on_user_join(event: types.ChatMemberUpdated, supabase_client: Supabase
     group_id = event.chat.id
     new_user = event.new_chat_member.user
     chat_title = event.chat.title if event.chat.title else "this group"
-    logging.info(f"ON_USER_JOIN: User {new_user.id} ({new_user.full_name}) joined group {group_id} ('{chat_title}'). Fetching config.")
+    logging.info(f"ON_USER_JOIN: User {new_user.id} ({new_user.full_name}) joined group {group_id} ('{chat_title}'). Queued for batched welcome.")
+    # Join yang berdekatan digabung: satu fetch config, paling banyak satu template, satu pesan
+    join_aggregator.add(group_id, new_user, {
+        "supabase_client": supabase_client, "bot": bot,
+        "crypto_util": crypto_util, "chat_title": chat_title
+    })
+
+
+async def send_batched_welcome(group_id: int, new_users: list[types.User], context: dict):
+    supabase_client: SupabaseClient = context["supabase_client"]
+    bot: Bot = context["bot"]
+    crypto_util: CryptoUtil = context["crypto_util"]
+    chat_title = context["chat_title"]
+    logging.info(f"ON_USER_JOIN: Sending welcome for {len(new_users)} new member(s) in group {group_id}. Fetching config.")
     config = await get_ai_config(supabase_client, group_id)
 
     if not config:
@@ -375,127 +373,70 @@ async def on_user_join(event: types.ChatMemberUpdated, supabase_client: Supabase
         logging.info(f"ON_USER_JOIN: Welcome messages disabled for group {group_id}. Skipping.")
         return
 
-    user_mention_html = f"<a href='tg://user?id={new_user.id}'>{escape_html_tags(new_user.full_name)}</a>"
-    user_first_name = escape_html_tags(new_user.first_name)
-    user_last_name = escape_html_tags(new_user.last_name) if new_user.last_name else ""
-    user_full_name = escape_html_tags(new_user.full_name)
-    safe_group_name = escape_html_tags(chat_title)
-    formatted_message = ""
-
-    default_ai_welcome_prompt_template = (
-        f"You are a friendly greeter bot for a Telegram group named '{{{{group_name}}}}'. "
-        f"A new user, {{{{user_full_name_placeholder}}}}, has just joined. "
-        f"Craft a unique, warm, and welcoming message for them. "
-        f"You MUST use ALL of the following placeholders in your response exactly as they are written: "
-        f"{{{{user_mention}}}}, {{{{user_first_name}}}}, {{{{user_last_name}}}}, {{{{user_full_name}}}}, {{{{group_name}}}}. "
-        f"Do not add any extra text before or after the welcome message itself. Only the welcome message. "
-        f"Make the message concise and engaging. Example: 'Hey {{{{user_mention}}}}, welcome to {{{{group_name}}}}! So glad to have you, {{{{user_first_name}}}}!' "
-    )
+    # Mode tenang saat raid / lonjakan invite link: satu ringkasan, lalu diam selama WELCOME_QUIET_MODE_SECONDS
+    now = time.monotonic()
+    if welcome_quiet_until.get(group_id, 0) > now:
+        logging.info(f"ON_USER_JOIN: Group {group_id} is in quiet mode. Skipping welcome for {len(new_users)} member(s).")
+        if len(new_users) > WELCOME_BURST_QUIET_THRESHOLD:
+            welcome_quiet_until[group_id] = now + WELCOME_QUIET_MODE_SECONDS
+        return
+    if len(new_users) > WELCOME_BURST_QUIET_THRESHOLD:
+        welcome_quiet_until[group_id] = now + WELCOME_QUIET_MODE_SECONDS
+        group_translations = load_specific_translations_common(config.get("language_code") or DEFAULT_LANGUAGE)
+        quiet_text = group_translations.get("welcome_burst_quiet_mode", "👋 Welcome to the {count} new members of {group_name}!").format(
+            count=len(new_users), group_name=escape_html_tags(chat_title)
+        )
+        logging.warning(f"ON_USER_JOIN: Join burst of {len(new_users)} in group {group_id}. Switching to quiet mode.")
+        try:
+            await bot.send_message(chat_id=group_id, text=quiet_text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+        except Exception as e:
+            logging.error(f"ON_USER_JOIN: Error sending quiet-mode welcome to group {group_id}: {repr(e)}")
+        return
+
+    welcome_values = build_welcome_values(new_users, chat_title)
+    custom_message_text = config.get('custom_welcome_message')
+    compiled_template: CompiledTemplate | None = None
 
     if config.get('welcome_message_ai_enabled', False):
-        logging.info(f"ON_USER_JOIN: AI welcome message enabled for group {group_id}. Generating message...")
+        logging.info(f"ON_USER_JOIN: AI welcome message enabled for group {group_id}. Taking template from pool...")
         if not config.get("encrypted_groq_api_key") or not config.get("is_active"):
             logging.warning(f"ON_USER_JOIN: AI welcome is ON for group {group_id} but AI (Groq) is not configured or inactive. Falling back to manual if available.")
-            if config.get('custom_welcome_message'):
-                custom_message_template = config.get('custom_welcome_message')
-                formatted_message = custom_message_template.replace("{{user_mention}}", user_mention_html)
-                formatted_message = formatted_message.replace("{{user_first_name}}", user_first_name)
-                formatted_message = formatted_message.replace("{{user_last_name}}", user_last_name)
-                formatted_message = formatted_message.replace("{{user_full_name}}", user_full_name)
-                formatted_message = formatted_message.replace("{{group_name}}", safe_group_name)
-            else:
-                logging.info(f"ON_USER_JOIN: No manual fallback for AI welcome in group {group_id}.")
-                return
         else:
             decrypted_api_key = crypto_util.decrypt_data(config.get("encrypted_groq_api_key"))
             if not decrypted_api_key:
                 logging.error(f"ON_USER_JOIN: Failed to decrypt API key for AI welcome message in group {group_id}.")
                 return
-
-            ai_system_prompt_template_db = config.get('ai_welcome_system_prompt')
-            current_ai_system_prompt = default_ai_welcome_prompt_template
-            if ai_system_prompt_template_db and ai_system_prompt_template_db.strip():
-                current_ai_system_prompt = ai_system_prompt_template_db
-                logging.info(f"ON_USER_JOIN: Using custom AI welcome prompt for group {group_id}.")
-            else:
-                logging.info(f"ON_USER_JOIN: Using default AI welcome prompt for group {group_id}.")
-
-            final_ai_system_prompt = current_ai_system_prompt.replace("{{group_name}}", safe_group_name)
-            final_ai_system_prompt = final_ai_system_prompt.replace("{{user_full_name_placeholder}}", user_full_name)
-
-            welcome_ai_model_id = "gemma2-9b-it"
-            logging.info(f"ON_USER_JOIN: Using model '{welcome_ai_model_id}' for AI welcome. System prompt: '{final_ai_system_prompt[:150]}...'")
-
-            ai_user_prompt = "Generate a short and friendly welcome message now, using the required placeholders."
             try:
-                ai_response_data = await get_groq_completion(
-                    api_key=decrypted_api_key, model=welcome_ai_model_id,
-                    system_prompt_for_call=final_ai_system_prompt, user_prompt_for_call=ai_user_prompt,
-                    full_messages_list=[
-                        {"role": "system", "content": final_ai_system_prompt},
-                        {"role": "user", "content": ai_user_prompt}
-                    ]
-                )
-                if ai_response_data and ai_response_data.get("main_response"):
-                    ai_generated_template = ai_response_data.get("main_response").strip()
-                    logging.info(f"ON_USER_JOIN: AI generated welcome template for group {group_id}: '{ai_generated_template}'")
-
-                    temp_message = ai_generated_template.replace("{{user_mention}}", user_mention_html)
-                    temp_message = temp_message.replace("{{user_first_name}}", user_first_name)
-                    temp_message = temp_message.replace("{{user_last_name}}", user_last_name)
-                    temp_message = temp_message.replace("{{user_full_name}}", user_full_name)
-                    temp_message = temp_message.replace("{{group_name}}", safe_group_name)
-                    formatted_message = temp_message
-                    logging.info(f"ON_USER_JOIN: After AI placeholder replacement, message: '{formatted_message}'")
-                else:
-                    logging.error(f"ON_USER_JOIN: AI failed to generate welcome message for group {group_id}. Response: {ai_response_data}")
-                    if config.get('custom_welcome_message'):
-                        custom_message_template = config.get('custom_welcome_message')
-                        formatted_message = custom_message_template.replace("{{user_mention}}", user_mention_html)
-                        formatted_message = formatted_message.replace("{{user_first_name}}", user_first_name)
-                        formatted_message = formatted_message.replace("{{user_last_name}}", user_last_name)
-                        formatted_message = formatted_message.replace("{{user_full_name}}", user_full_name)
-                        formatted_message = formatted_message.replace("{{group_name}}", safe_group_name)
-                    else: return
+                compiled_template = await take_welcome_template(group_id, config, chat_title, welcome_values["group_name"], decrypted_api_key)
+                if not compiled_template:
+                    logging.error(f"ON_USER_JOIN: No AI welcome template available for group {group_id}.")
             except Exception as e_ai:
                 logging.error(f"ON_USER_JOIN: Exception during AI welcome generation for group {group_id}: {repr(e_ai)}")
-                if config.get('custom_welcome_message'):
-                    custom_message_template = config.get('custom_welcome_message')
-                    formatted_message = custom_message_template.replace("{{user_mention}}", user_mention_html)
-                    formatted_message = formatted_message.replace("{{user_first_name}}", user_first_name)
-                    formatted_message = formatted_message.replace("{{user_last_name}}", user_last_name)
-                    formatted_message = formatted_message.replace("{{user_full_name}}", user_full_name)
-                    formatted_message = formatted_message.replace("{{group_name}}", safe_group_name)
-                else: return
-    elif config.get('custom_welcome_message'):
+        if not compiled_template and not custom_message_text:
+            logging.info(f"ON_USER_JOIN: No manual fallback for AI welcome in group {group_id}.")
+            return
+    elif custom_message_text:
         logging.info(f"ON_USER_JOIN: Using manual custom welcome message for group {group_id}.")
-        custom_message_template = config.get('custom_welcome_message')
-        formatted_message = custom_message_template.replace("{{user_mention}}", user_mention_html)
-        formatted_message = formatted_message.replace("{{user_first_name}}", user_first_name)
-        formatted_message = formatted_message.replace("{{user_last_name}}", user_last_name)
-        formatted_message = formatted_message.replace("{{user_full_name}}", user_full_name)
-        formatted_message = formatted_message.replace("{{group_name}}", safe_group_name)
     else:
         logging.info(f"ON_USER_JOIN: No welcome message (manual or AI) configured or enabled to be sent for group {group_id}.")
         return
 
-    if formatted_message and formatted_message.strip():
+    if compiled_template is None:
+        compiled_template = get_compiled_custom_template(group_id, custom_message_text)
+    formatted_message = compiled_template.render(welcome_values)
+
+    if formatted_message:
         logging.info(f"ON_USER_JOIN: Attempting to send welcome message to group {group_id}: '{formatted_message[:200]}...'")
         try:
-            if "<think>" in formatted_message.lower() or "</think>" in formatted_message.lower():
-                logging.warning(f"ON_USER_JOIN: Detected <think> tags in final welcome. Cleaning. Original: '{formatted_message}'")
-                formatted_message = re.sub(r"<think>.*?</think>", "", formatted_message, flags=re.DOTALL | re.IGNORECASE).strip()
-                logging.info(f"ON_USER_JOIN: After think tag removal: '{formatted_message}'")
-
-            if formatted_message and formatted_message.strip():
-                await bot.send_message(chat_id=group_id, text=formatted_message, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
-                logging.info(f"ON_USER_JOIN: Successfully sent welcome message to group {group_id}.")
-            else:
-                logging.warning(f"ON_USER_JOIN: Formatted welcome message became empty after all processing for group {group_id}. Not sending.")
+            await bot.send_message(chat_id=group_id, text=formatted_message, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+            logging.info(f"ON_USER_JOIN: Successfully sent welcome message to group {group_id}.")
         except Exception as e:
             logging.error(f"ON_USER_JOIN: Error sending welcome message to group {group_id}: {repr(e)}. Formatted message was: '{formatted_message}'")
     else:
-        logging.warning(f"ON_USER_JOIN: Formatted_message was empty or None before attempting to send for group {group_id}.")
+        logging.warning(f"ON_USER_JOIN: Formatted welcome message was empty for group {group_id}. Not sending.")
+
+
+join_aggregator = JoinAggregator(WELCOME_JOIN_WINDOW_SECONDS, send_batched_welcome)
 
 
 @common_router.message(F.photo)
@@ -1,16 +1,19 @@
+from __future__ import annotations
 from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command, StateFilter
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from supabase import Client as SupabaseClient
+from typing import TYPE_CHECKING
 from states.setup_states import AISetupStates
 from utils.supabase_interface import save_ai_config, get_group_language 
 from utils.groq_interface import validate_groq_api_key
 from utils.crypto_interface import CryptoUtil
 from bot_config import DEFAULT_GROQ_MODEL, DEFAULT_LANGUAGE, AVAILABLE_GROQ_MODELS, get_model_display_name
 from utils.helpers import escape_html_tags 
+if TYPE_CHECKING:
+    from supabase import Client as SupabaseClient
 
-fsm_router = Router()
+fsm_router = Router(name="fsm")
 
 MODEL_CALLBACK_PREFIX = "select_model:"
 
@@ -7,7 +7,7 @@ from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
 from utils.helpers import escape_html_tags
 
 
-message_sending_router = Router()
+message_sending_router = Router(name="message_sending")
 
 async def is_user_chat_admin(bot_instance: Bot, chat_id: int, user_id: int) -> bool:
     try:
@@ -1,19 +1,27 @@
+from __future__ import annotations
 import logging
+import random
 from aiogram import Router, types, F, Bot
 from aiogram.exceptions import TelegramForbiddenError
-from supabase import Client as SupabaseClient
+from typing import TYPE_CHECKING
 from utils.supabase_interface import get_ai_config, get_group_language
 from utils.crypto_interface import CryptoUtil
-from utils.groq_interface import get_groq_completion
+from utils.groq_interface import get_task_completion
 from utils.helpers import escape_html_tags
 from bot_config import (
-    DEFAULT_GROQ_MODEL, MODERATION_LEVELS, DEFAULT_MODERATION_LEVEL,
-    DEFAULT_LANGUAGE
+    MODERATION_LEVELS, DEFAULT_MODERATION_LEVEL,
+    DEFAULT_LANGUAGE, USAGE_OVER_QUOTA_MODERATION_SAMPLE_RATE
 )
 from middlewares.i18n_middleware import load_translations
+from utils.metrics import MODERATION_VERDICTS, QUOTA_DEGRADED
+from utils.usage_tracker import usage_tracker
 from handlers.ai_response_handlers import process_ai_request
+from utils.reply_threads import get_thread_context
+if TYPE_CHECKING:
+    from supabase import Client as SupabaseClient
 
-moderation_router = Router()
+moderation_router = Router(name="moderation")
+logger = logging.getLogger("wisedebot.moderation")
 
 async def perform_text_moderation(
     bot: Bot,
@@ -35,37 +43,36 @@ async def perform_text_moderation(
         decrypted_api_key = crypto_util.decrypt_data(config.get("encrypted_groq_api_key"))
 
     if not decrypted_api_key:
-        logging.warning(f"PERFORM_MOD: API Key not available or decryption failed for group {group_id}. Skipping.")
+        logger.warning("PERFORM_MOD: API key not available or decryption failed for group %s. Skipping.", group_id, extra={"group_id": group_id})
         return False
 
     if current_moderation_level == DEFAULT_MODERATION_LEVEL:
-        logging.info(f"PERFORM_MOD: Moderation for group {group_id} is effectively disabled (level: {current_moderation_level}). Skipping text: '{message_text[:50]}...'")
+        logger.debug("PERFORM_MOD: Moderation for group %s is effectively disabled (level: %s). Skipping.", group_id, current_moderation_level)
         return False
 
     moderation_prompt_level_text = current_moderation_level
     moderation_prompt = f"You are a content moderation AI. Analyze the following text, in any language, for any forbidden content. This includes, but is not limited to: profanity (e.g., 'kata kotor' in Indonesian; Javanese swear words like 'asu', 'dck', and similar terms; swear words in any other language), hate speech, explicit adult content, severe violence, self-harm encouragement, harassment, or illegal activities. Respond with ONLY 'FLAGGED: [REASON]' if it violates policies, or 'SAFE' if it does not. Be more sensitive if the requested level is higher. Current Level: {moderation_prompt_level_text}. Text to analyze: \"{message_text}\""
-    moderation_model = config.get("groq_model", DEFAULT_GROQ_MODEL)
 
-    logging.info(f"PERFORM_MOD: Attempting moderation for group {group_id} with level '{current_moderation_level}' for text: '{message_text[:50]}...'")
+    logger.debug("PERFORM_MOD: Moderating text in group %s with level '%s'.", group_id, current_moderation_level)
     action_taken = False
     try:
-        response_data = await get_groq_completion(
+        response_data = await get_task_completion(
             api_key=decrypted_api_key,
-            model=moderation_model,
-            system_prompt_for_call="You are an AI content moderator.",
-            user_prompt_for_call=moderation_prompt,
-            full_messages_list=[
+            task="moderation",
+            messages=[
                 {"role": "system", "content": "You are an AI content moderator. Your task is to analyze text based on the user's instructions and determine if it should be flagged."},
                 {"role": "user", "content": moderation_prompt}
-            ]
+            ],
+            group_config=config,
+            group_id=group_id
         )
-        logging.info(f"PERFORM_MOD: Raw Groq moderation response_data for group {group_id}: {response_data}")
 
         if response_data and response_data.get("main_response"):
             ai_decision_raw = response_data.get("main_response").strip()
-            logging.info(f"PERFORM_MOD: Moderation AI decision for group {group_id}, level {current_moderation_level}: '{ai_decision_raw}' for text: '{message_text[:100]}...'")
+            logger.debug("PERFORM_MOD: Moderation decision for group %s at level %s: %.80s", group_id, current_moderation_level, ai_decision_raw)
 
             if ai_decision_raw.startswith("FLAGGED:"):
+                MODERATION_VERDICTS.inc("flagged")
                 action_taken = True
                 reason_raw = ai_decision_raw.split("FLAGGED:", 1)[1].strip()
                 reason_text = reason_raw if reason_raw else _("moderation_reason_suspicious_text")
@@ -78,9 +85,9 @@ async def perform_text_moderation(
                 user_warning_text = specific_translations.get(warning_message_key, "Warning: Your message was flagged.").format(**warning_text_params)
                 try:
                     await bot.send_message(chat_id=group_id, text=user_warning_text, reply_to_message_id=original_message_id)
-                    logging.info(f"PERFORM_MOD: Moderation warning sent to user {user_id} in group {group_id} for reason: {reason}")
+                    logger.info("PERFORM_MOD: Moderation warning sent to user %s in group %s.", user_id, group_id, extra={"group_id": group_id, "user_id": user_id, "reason": reason})
                 except Exception as e_send_user_warn:
-                    logging.error(f"PERFORM_MOD: Failed to send moderation warning to user in group {group_id}: {e_send_user_warn}")
+                    logger.error("PERFORM_MOD: Failed to send moderation warning to user in group %s: %r", group_id, e_send_user_warn)
 
                 try:
                     chat_admins = await bot.get_chat_administrators(chat_id=group_id)
@@ -99,21 +106,25 @@ async def perform_text_moderation(
                                 admin_message_text = admin_translations.get(admin_notification_text_key, "Moderation Alert").format(**admin_notification_params)
                                 await bot.send_message(chat_id=admin.user.id, text=admin_message_text)
                                 await bot.forward_message(chat_id=admin.user.id, from_chat_id=group_id, message_id=original_message_id)
-                                logging.info(f"PERFORM_MOD: Violation forwarded to admin {admin.user.id} for group {group_id}")
+                                logger.info("PERFORM_MOD: Violation forwarded to admin %s for group %s.", admin.user.id, group_id)
                             except TelegramForbiddenError:
-                                logging.warning(f"PERFORM_MOD: Could not forward violation to admin {admin.user.id}. Bot might be blocked or chat not initiated.")
+                                logger.warning("PERFORM_MOD: Could not forward violation to admin %s. Bot might be blocked or chat not initiated.", admin.user.id)
                             except Exception as e_fwd:
-                                logging.error(f"PERFORM_MOD: Failed to forward violation to admin {admin.user.id}: {e_fwd}")
+                                logger.error("PERFORM_MOD: Failed to forward violation to admin %s: %r", admin.user.id, e_fwd)
                 except Exception as e_get_admins:
-                    logging.error(f"PERFORM_MOD: Could not get chat administrators for group {group_id}: {e_get_admins}")
+                    logger.error("PERFORM_MOD: Could not get chat administrators for group %s: %r", group_id, e_get_admins)
             elif ai_decision_raw.upper() == 'SAFE':
-                logging.info(f"PERFORM_MOD: Moderation AI for group {group_id} deemed text SAFE: '{message_text[:100]}...'")
+                MODERATION_VERDICTS.inc("safe")
+                logger.debug("PERFORM_MOD: Moderation AI for group %s deemed text SAFE.", group_id)
             else:
-                logging.warning(f"PERFORM_MOD: Moderation AI for group {group_id} returned an unexpected decision: '{ai_decision_raw}' for text: '{message_text[:100]}...'")
+                MODERATION_VERDICTS.inc("unexpected")
+                logger.warning("PERFORM_MOD: Moderation AI for group %s returned an unexpected decision: %.100r", group_id, ai_decision_raw, extra={"group_id": group_id})
         else:
-            logging.warning(f"PERFORM_MOD: Moderation AI for group {group_id} returned no response_data or empty main_response.")
+            MODERATION_VERDICTS.inc("empty")
+            logger.warning("PERFORM_MOD: Moderation AI for group %s returned no response_data or empty main_response.", group_id)
     except Exception as e:
-        logging.error(f"PERFORM_MOD: Error during text moderation for group {group_id}: {e}")
+        MODERATION_VERDICTS.inc("error")
+        logger.error("PERFORM_MOD: Error during text moderation for group %s: %r", group_id, e, extra={"group_id": group_id})
     return action_taken
 
 
@@ -130,17 +141,21 @@ async def handle_group_text_message(
     user = message.from_user
     config = await get_ai_config(supabase_client, group_id)
 
-    logging.info(f"MOD_ INTEGRATED_HANDLER: Received non-command text in group {group_id} from user {user.id} ('{message.text[:50]}...').")
+    logger.debug("MOD_INTEGRATED_HANDLER: Non-command text in group %s from user %s.", group_id, user.id)
 
     if not config:
-        logging.info(f"MOD_ INTEGRATED_HANDLER: No config found for group {group_id}. Skipping all processing for this message.")
+        logger.debug("MOD_INTEGRATED_HANDLER: No config found for group %s. Skipping.", group_id)
         return
 
     # --- 1. Moderation Part ---
     moderation_performed_action = False # Untuk melacak apakah moderasi melakukan sesuatu
     if config.get('moderation_level', DEFAULT_MODERATION_LEVEL) != DEFAULT_MODERATION_LEVEL:
-        if not (user.is_bot and user.id == bot.id):
-            logging.info(f"MOD_ INTEGRATED_HANDLER: Moderation is active for group {group_id}. Calling perform_text_moderation.")
+        if usage_tracker.quota_exhausted(group_id, config) and random.random() >= USAGE_OVER_QUOTA_MODERATION_SAMPLE_RATE:
+            # Kuota harian habis: hanya sampel kecil pesan yang tetap dimoderasi
+            QUOTA_DEGRADED.inc("moderation")
+            logger.debug("MOD_INTEGRATED_HANDLER: Daily quota exhausted for group %s; message not sampled for moderation.", group_id)
+        elif not (user.is_bot and user.id == bot.id):
+            logger.debug("MOD_INTEGRATED_HANDLER: Moderation is active for group %s.", group_id)
             moderation_performed_action = await perform_text_moderation(
                 bot=bot, message_text=message.text, group_id=group_id,
                 group_name=message.chat.title or "this group", user_id=user.id,
@@ -149,9 +164,9 @@ async def handle_group_text_message(
                 original_message_id=message.message_id
             )
         else:
-            logging.info(f"MOD_ INTEGRATED_HANDLER: Message from our bot in group {group_id}. Skipping moderation part.")
+            logger.debug("MOD_INTEGRATED_HANDLER: Message from our bot in group %s. Skipping moderation.", group_id)
     else:
-        logging.info(f"MOD_ INTEGRATED_HANDLER: Moderation is disabled for group {group_id}. Skipping moderation part.")
+        logger.debug("MOD_INTEGRATED_HANDLER: Moderation is disabled for group %s.", group_id)
 
     # --- 2. AI Response Part (Mention & Custom Prefix) ---
     user_question_for_ai = None
@@ -173,6 +188,11 @@ async def handle_group_text_message(
                         if mention_text_in_message.lower() == f"@{bot_username_lower}":
                             temp_question = message.text[entity.offset + entity.length :].strip()
                             break
+            # Membalas jawaban AI dari bot juga dihitung sebagai mention, supaya percakapan bisa berlanjut di thread
+            reply_target = message.reply_to_message
+            if not temp_question and reply_target and reply_target.from_user and reply_target.from_user.id == bot.id:
+                if await get_thread_context(supabase_client, group_id, reply_target.message_id):
+                    temp_question = message.text.strip()
             if temp_question:
                 user_question_for_ai = temp_question
                 ai_trigger_type = "mention"
@@ -186,10 +206,10 @@ async def handle_group_text_message(
                     ai_trigger_type = "custom_prefix"
 
         if user_question_for_ai:
-            logging.info(f"MOD_ INTEGRATED_HANDLER: AI Q&A triggered by {ai_trigger_type} for group {group_id}. Question: '{user_question_for_ai[:50]}...'")
+            logger.info("MOD_INTEGRATED_HANDLER: AI Q&A triggered by %s in group %s.", ai_trigger_type, group_id, extra={"group_id": group_id, "trigger": ai_trigger_type})
             await process_ai_request(message, user_question_for_ai, supabase_client, crypto_util, _)
         else:
             if not moderation_performed_action:
-                 logging.info(f"MOD_ INTEGRATED_HANDLER: Message in group {group_id} was not a command, and not an AI mention/prefix. Moderation also took no action or was off.")
+                 logger.debug("MOD_INTEGRATED_HANDLER: Message in group %s needed no action.", group_id)
     else:
-        logging.info(f"MOD_ INTEGRATED_HANDLER: AI Q&A is inactive for group {group_id}.")
+        logger.debug("MOD_INTEGRATED_HANDLER: AI Q&A is inactive for group %s.", group_id)
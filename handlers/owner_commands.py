@@ -0,0 +1,95 @@
+import time
+from aiogram import Router, types, F
+from aiogram.filters import Command
+
+from middlewares.i18n_middleware import translations_cache
+from middlewares.metrics_middleware import TelegramApiMetricsMiddleware
+from utils.answer_cache import answer_cache_size
+from utils.config_store import group_config_store
+from utils.groq_interface import groq_key_load, hedge_stats
+from utils.loop_monitor import loop_monitor
+from utils.helpers import escape_html_tags
+from utils.metrics import CACHE_REQUESTS, SUPABASE_CALL_SECONDS
+from utils.perf_stats import measure_loop_lag, process_rss_bytes, log_queue_depth
+from utils.rate_limiter import ai_rate_limiter
+from utils.startup_timing import startup_timer
+from utils.telegram_render import split_telegram_html
+from utils.thoughts_store import thoughts_store
+from utils.usage_tracker import usage_tracker
+
+owner_router = Router(name="owner")
+
+# Fungsi Supabase yang ditampilkan, diurutkan dari yang paling sering dipanggil
+PERFSTATS_SUPABASE_TOP_N = 10
+
+
+def _mb(value: int | None) -> str:
+    return f"{value / (1024 * 1024):.1f} MB" if value is not None else "n/a"
+
+
+def _ms(seconds: float | None) -> str:
+    return f"{seconds * 1000:.1f}" if seconds is not None else "-"
+
+
+def _cache_ratios() -> list[str]:
+    by_cache: dict[str, dict[str, float]] = {}
+    for (cache, result), value in CACHE_REQUESTS.series().items():
+        by_cache.setdefault(cache, {})[result] = value
+    lines = []
+    for cache, results in sorted(by_cache.items()):
+        hits, misses = results.get("hit", 0), results.get("miss", 0)
+        ratio = f"{hits / (hits + misses):.1%}" if hits + misses else "-"
+        lines.append(f"  {cache}: hit {ratio} ({int(hits)}/{int(hits + misses)}), evicted {int(results.get('evicted', 0))}")
+    return lines
+
+
+async def build_perf_report() -> str:
+    loop_lag = await measure_loop_lag()
+    rss, peak_rss = process_rss_bytes()
+    lines = [
+        f"uptime {time.perf_counter() - startup_timer.started_at:.0f}s, rss {_mb(rss)} (peak {_mb(peak_rss)})",
+        f"event loop lag now {_ms(loop_lag)} ms, recent p50 {_ms(loop_monitor.lag_percentile(0.5))} / "
+        f"p99 {_ms(loop_monitor.lag_percentile(0.99))} / max {_ms(loop_monitor.lag_percentile(1.0))} ms, stalls {loop_monitor.stalls}",
+        f"handlers running {loop_monitor.running_handlers()}",
+        "",
+        "groq completions in flight:",
+    ]
+    key_load = groq_key_load()
+    for fingerprint, in_flight in sorted(key_load.items(), key=lambda item: -item[1]):
+        lines.append(f"  key {fingerprint[:8]}: {in_flight}")
+    if not key_load:
+        lines.append("  idle")
+    lines.append(f"  hedges fired {hedge_stats['fired']}, secondary wins {hedge_stats['secondary_wins']}")
+
+    lines += ["", "supabase p50 / p95 / p99 ms (calls):"]
+    series = sorted(SUPABASE_CALL_SECONDS.series().items(), key=lambda item: -item[1][2])
+    for (function,), (_counts, _total, count) in series[:PERFSTATS_SUPABASE_TOP_N]:
+        quantiles = " / ".join(_ms(SUPABASE_CALL_SECONDS.quantile(q, function)) for q in (0.5, 0.95, 0.99))
+        lines.append(f"  {function}: {quantiles} ({count})")
+    if not series:
+        lines.append("  no calls yet")
+
+    lines += ["", "caches:"]
+    lines += _cache_ratios()
+    log_depth = log_queue_depth()
+    lines += [
+        f"  sizes: group configs {len(group_config_store)} (+{group_config_store.known_missing_count} missing), "
+        f"answers {answer_cache_size()}, thoughts {len(thoughts_store)} ({_mb(thoughts_store.total_bytes)}), "
+        f"translations {len(translations_cache)}, rate limiter keys {ai_rate_limiter.tracked_keys()}",
+        "",
+        "queues:",
+        f"  telegram requests in flight {TelegramApiMetricsMiddleware.in_flight}",
+        f"  usage rows pending flush {usage_tracker.pending_rows()}",
+        f"  log records queued {log_depth if log_depth is not None else 'n/a'}",
+    ]
+    return "\n".join(lines)
+
+
+@owner_router.message(Command("perfstats"), F.chat.type == "private")
+async def cmd_perfstats(message: types.Message, bot_owner_id: int | None = None):
+    # Hanya untuk pemilik bot (env BOT_OWNER_ID); user lain tidak mendapat balasan apa pun
+    if not bot_owner_id or not message.from_user or message.from_user.id != bot_owner_id:
+        return
+    report = await build_perf_report()
+    for chunk in split_telegram_html(f"<pre>{escape_html_tags(report)}</pre>"):
+        await message.answer(chunk)
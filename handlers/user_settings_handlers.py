@@ -1,16 +1,19 @@
+from __future__ import annotations
 import logging
 from aiogram import Router, types, F, Bot
 from aiogram.filters import Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from supabase import Client as SupabaseClient
+from typing import TYPE_CHECKING
 from aiogram.enums import ContentType, ParseMode 
 from bot_config import AVAILABLE_LANGUAGES, DEFAULT_LANGUAGE
 from utils.supabase_interface import set_user_language, get_user_language
 from middlewares.i18n_middleware import load_translations
+if TYPE_CHECKING:
+    from supabase import Client as SupabaseClient
 
 USER_SETTINGS_CALLBACK_PREFIX = "userset:"
 
-user_settings_router = Router()
+user_settings_router = Router(name="user_settings")
 
 async def get_language_selection_keyboard(user_id: int, supabase_client: SupabaseClient, current_lang_for_buttons: str) -> InlineKeyboardBuilder:
     lang_for_button_text = current_lang_for_buttons
@@ -1,3 +1,4 @@
+from __future__ import annotations
 import logging
 from aiogram import Router, types, F, Bot
 from aiogram.filters import Command, StateFilter
@@ -5,14 +6,18 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.base import StorageKey
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.enums import ChatMemberStatus
-from supabase import Client as SupabaseClient
+from typing import TYPE_CHECKING
 from states.setup_states import AISetupStates
 from utils.supabase_interface import get_ai_config, save_ai_config, get_group_language
 from utils.helpers import escape_html_tags
+from utils.welcome_pool import invalidate_welcome_pool
+from utils.welcome_template import WELCOME_PLACEHOLDERS, find_invalid_placeholders
 from bot_config import DEFAULT_LANGUAGE
 from middlewares.i18n_middleware import load_translations as load_specific_translations
+if TYPE_CHECKING:
+    from supabase import Client as SupabaseClient
 
-welcome_router = Router()
+welcome_router = Router(name="welcome")
 
 WELCOME_CALLBACK_PREFIX = "wm_cfg:"
 
@@ -225,6 +230,10 @@ async def cq_welcome_message_handler(callback_query: types.CallbackQuery, state:
         logging.info(f"cq_welcome_message_handler: Action 'done'. State cleared.") #
         return
 
+    if success and action in ["enable", "disable", "remove", "toggle_ai"]:
+        # Template welcome AI yang sudah di-generate dibuang; pool dibuat ulang saat join berikutnya
+        invalidate_welcome_pool(group_id)
+
     if not success and action in ["enable", "disable", "remove", "toggle_ai"]: #
         logging.error(f"cq_welcome_message_handler: Save operation failed for action '{action}'.") #
         await callback_query.answer(get_dm_text("generic_error"), show_alert=True) #
@@ -269,11 +278,22 @@ async def process_custom_welcome_message(message: types.Message, state: FSMConte
         await message.answer(prompt_text) #
         return
 
+    invalid_placeholders = find_invalid_placeholders(custom_message_text)
+    if invalid_placeholders:
+        logging.info(f"process_custom_welcome_message: Invalid placeholders {invalid_placeholders} in custom message.")
+        await message.answer(get_dm_text(
+            "welcome_message_invalid_placeholders_dm",
+            placeholders=", ".join(invalid_placeholders),
+            allowed=", ".join(f"{{{{{name}}}}}" for name in WELCOME_PLACEHOLDERS)
+        ))
+        return
+
     logging.info(f"process_custom_welcome_message: Saving custom message: '{custom_message_text}' for group {group_id}") #
     success = await save_ai_config(supabase_client, group_id, admin_user_id, custom_welcome_message=custom_message_text) #
 
     if success: #
         logging.info(f"process_custom_welcome_message: Custom message saved successfully.") #
+        invalidate_welcome_pool(group_id)
         await message.answer(get_dm_text("welcome_message_set_success_dm", group_name=raw_group_name, message_text=escape_html_tags(custom_message_text))) #
         await state.set_state(AISetupStates.awaiting_welcome_message_status) #
         logging.info(f"process_custom_welcome_message: State set back to awaiting_welcome_message_status.") #
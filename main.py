@@ -1,28 +1,84 @@
+from __future__ import annotations
+from utils.startup_timing import startup_timer
 import asyncio
 import os
 import logging
-import httpx
+from typing import TYPE_CHECKING
 from aiogram import Bot, Dispatcher, types
 from aiogram.fsm.storage.memory import MemoryStorage
 from dotenv import load_dotenv
-from supabase import create_client, Client as SupabaseClient
 from aiogram.enums import ParseMode
 from middlewares.i18n_middleware import I18nMiddleware
-from handlers.common_handlers import common_router
-from handlers.admin_commands import admin_router
-from handlers.fsm_handlers import fsm_router
-from handlers.ai_response_handlers import ai_response_router
-from handlers.user_settings_handlers import user_settings_router
-from handlers.moderation_handlers import moderation_router 
-from handlers.message_sending_handlers import message_sending_router 
+from middlewares.tracing_middleware import TracingMiddleware
+from middlewares.idle_group_middleware import IdleGroupFilterMiddleware
+from middlewares.metrics_middleware import HandlerMetricsMiddleware, TelegramApiMetricsMiddleware, FirstUpdateTimingMiddleware
 from utils.crypto_interface import CryptoUtil
 from aiogram.client.default import DefaultBotProperties
-from handlers.welcome_handlers import welcome_router
+from utils.metrics import start_metrics_server, registry
+from utils.tracing import configure_tracing
+from utils.log_pipeline import setup_logging
+from utils.thoughts_store import thoughts_store
+from utils.groq_interface import warm_groq_sdk, close_groq_clients
+from utils.config_store import group_config_store
+from utils.usage_tracker import usage_tracker
+from utils.loop_monitor import loop_monitor
+if TYPE_CHECKING:
+    from supabase import Client as SupabaseClient
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+startup_timer.mark("core imports")
+
+# (modul, nama router) sesuai urutan include; modul handler di-import saat dispatcher
+# dirakit supaya waktu import tiap modul tercatat di laporan startup
+ROUTER_MODULES = (
+    ("handlers.owner_commands", "owner_router"),
+    ("handlers.welcome_handlers", "welcome_router"),
+    ("handlers.user_settings_handlers", "user_settings_router"),
+    ("handlers.moderation_handlers", "moderation_router"),
+    ("handlers.common_handlers", "common_router"),
+    ("handlers.admin_commands", "admin_router"),
+    ("handlers.message_sending_handlers", "message_sending_router"),
+    ("handlers.ai_response_handlers", "ai_response_router"),
+    ("handlers.fsm_handlers", "fsm_router"),
+)
+
+registry.gauge_callback(
+    "wisedebot_startup_seconds", "Duration of each startup phase, plus time to the first handled update.",
+    lambda: {(phase,): seconds for phase, seconds in startup_timer.report().items()}, ("phase",)
+)
+
+def _create_supabase_client(supabase_url: str, supabase_key: str) -> SupabaseClient:
+    # Import supabase (beserta postgrest/auth/storage) cukup berat; dijalankan di thread startup
+    from supabase import create_client
+    return create_client(supabase_url, supabase_key)
+
+def build_dispatcher(supabase_client: SupabaseClient, crypto_util: CryptoUtil, storage=None, bot_owner_id: int | None = None) -> Dispatcher:
+    """
+    Merakit Dispatcher lengkap (middleware + semua router). Dipakai oleh main()
+    dan oleh benchmarks/replay_dispatcher.py supaya keduanya menguji susunan yang sama.
+    """
+    workflow_data_for_dp = {
+        "supabase_client": supabase_client,
+        "crypto_util": crypto_util,
+        "bot_owner_id": bot_owner_id
+    }
+    dp = Dispatcher(storage=storage or MemoryStorage(), **workflow_data_for_dp)
+
+    dp.update.outer_middleware(FirstUpdateTimingMiddleware())
+    # Chatter di grup tanpa fitur aktif dibuang sebelum tracing dan lookup bahasa
+    dp.update.outer_middleware(IdleGroupFilterMiddleware())
+    # Tracing didaftarkan lebih dulu supaya waktu I18nMiddleware ikut masuk ke trace
+    dp.update.outer_middleware(TracingMiddleware())
+    dp.update.outer_middleware(I18nMiddleware())
+
+    handler_metrics = HandlerMetricsMiddleware()
+    for observer in (dp.message, dp.callback_query, dp.chat_member, dp.my_chat_member):
+        observer.middleware(handler_metrics)
+
+    for module_name, router_name in ROUTER_MODULES:
+        dp.include_router(getattr(startup_timer.import_module(module_name), router_name))
+    return dp
 
 async def main():
-    load_dotenv()
     bot_token = os.environ.get("BOT_TOKEN")
     supabase_url = os.environ.get("SUPABASE_URL")
     supabase_key = os.environ.get("SUPABASE_SERVICE_KEY")
@@ -44,44 +100,86 @@ async def main():
         logging.error(f"FATAL: Failed to initialize CryptoUtil: {e}. Check your ENCRYPTION_KEY.")
         return
 
+    trace_threshold = os.environ.get("TRACE_SLOW_THRESHOLD_SECONDS")
+    configure_tracing(
+        slow_threshold_seconds=float(trace_threshold) if trace_threshold else None,
+        export_path=os.environ.get("TRACE_EXPORT_PATH")
+    )
+    thoughts_store_path = os.environ.get("THOUGHTS_STORE_PATH")
+    if thoughts_store_path:
+        thoughts_store.configure_persistence(thoughts_store_path)
+    # Pemilik bot (Telegram user id) yang boleh memakai /perfstats di DM
+    bot_owner_id = os.environ.get("BOT_OWNER_ID")
+
     storage = MemoryStorage()
     default_props = DefaultBotProperties(parse_mode=ParseMode.HTML)
     bot = Bot(token=bot_token, default=default_props)
+    bot.session.middleware(TelegramApiMetricsMiddleware())
 
+    # Client Supabase, SDK Groq dan getMe (di-cache oleh Bot, dipakai lagi oleh start_polling)
+    # disiapkan bersamaan, bukan berurutan
+    with startup_timer.phase("client init"):
+        supabase_client, _, _ = await asyncio.gather(
+            asyncio.to_thread(_create_supabase_client, supabase_url, supabase_key),
+            asyncio.to_thread(warm_groq_sdk),
+            bot.me()
+        )
+    # Untuk load test: SUPABASE_URL dan GROQ_BASE_URL (dibaca langsung oleh SDK groq)
+    # bisa diarahkan ke benchmarks/postgrest_stub.py dan benchmarks/groq_stub.py
+    groq_base_url = os.environ.get("GROQ_BASE_URL")
+    if groq_base_url:
+        logging.warning(f"GROQ_BASE_URL is set: Groq requests go to {groq_base_url}")
 
-    supabase_client: SupabaseClient = create_client(supabase_url, supabase_key)
-
-    workflow_data_for_dp = {
-        "supabase_client": supabase_client,
-        "crypto_util": crypto_util
-    }
-    dp = Dispatcher(storage=storage, **workflow_data_for_dp)
-
-    dp.update.outer_middleware(I18nMiddleware())
+    with startup_timer.phase("group config preload"):
+        await group_config_store.preload(supabase_client)
+        await usage_tracker.load_today(supabase_client)
+    config_refresh_task = asyncio.create_task(group_config_store.run_refresh_loop(supabase_client))
+    usage_flush_task = asyncio.create_task(usage_tracker.run_flush_loop(supabase_client))
+    loop_monitor.start()
 
-    dp.include_router(welcome_router)
-    dp.include_router(user_settings_router)
-    dp.include_router(moderation_router)
-    dp.include_router(common_router)
-    dp.include_router(admin_router)
-    dp.include_router(message_sending_router)
-    dp.include_router(ai_response_router)
-    dp.include_router(fsm_router)
+    with startup_timer.phase("build dispatcher"):
+        dp = build_dispatcher(supabase_client, crypto_util, storage, int(bot_owner_id) if bot_owner_id else None)
 
-    
+    metrics_runner = None
+    metrics_port = os.environ.get("METRICS_PORT")
+    if metrics_port:
+        # /metrics tanpa autentikasi: default hanya localhost. Set METRICS_HOST=0.0.0.0 secara eksplisit
+        # untuk membukanya ke semua interface (mis. di belakang jaringan internal scraper).
+        metrics_host = os.environ.get("METRICS_HOST", "127.0.0.1")
+        if metrics_host not in ("127.0.0.1", "localhost", "::1"):
+            logging.warning(f"Metrics endpoint exposed on {metrics_host} without authentication")
+        metrics_runner = await start_metrics_server(metrics_host, int(metrics_port))
 
+    startup_timer.mark("ready to poll")
     logging.info("Bot is starting...")
     try:
         await dp.start_polling(bot)
     finally:
         logging.info("Bot is shutting down...")
+        config_refresh_task.cancel()
+        usage_flush_task.cancel()
+        await loop_monitor.stop()
+        # Pemakaian yang belum ter-flush ditulis sekali lagi supaya kuota tidak kehilangan data
+        await usage_tracker.flush(supabase_client)
+        await close_groq_clients()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
         await bot.session.close()
         logging.info("Bot session closed.")
 
 if __name__ == "__main__":
+    load_dotenv()
+    log_listener = setup_logging(
+        level=os.environ.get("LOG_LEVEL"),
+        log_format=os.environ.get("LOG_FORMAT"),
+        category_levels=os.environ.get("LOG_LEVELS")
+    )
     try:
         asyncio.run(main())
     except (KeyboardInterrupt, SystemExit):
         logging.info("Bot stopped by admin (KeyboardInterrupt or SystemExit).")
     except Exception as e:
         logging.error(f"An unexpected error occurred at the top level: {e}", exc_info=True)
+    finally:
+        # Flush antrian log sebelum proses keluar
+        log_listener.stop()
@@ -1,13 +1,18 @@
+from __future__ import annotations
 import json
 import os
 import logging # Tambahkan logging
-from typing import Callable, Dict, Any, Awaitable
+from typing import Callable, Dict, Any, Awaitable, TYPE_CHECKING
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject, Chat, User # Impor User
-from supabase import Client as SupabaseClient
 
 from bot_config import DEFAULT_LANGUAGE, AVAILABLE_LANGUAGES, LOCALES_DIR
 from utils.supabase_interface import get_group_language, get_user_language # Impor get_user_language
+from utils.metrics import CACHE_REQUESTS
+if TYPE_CHECKING:
+    from supabase import Client as SupabaseClient
+
+logger = logging.getLogger("wisedebot.i18n")
 
 translations_cache: Dict[str, Dict[str, str]] = {}
 
@@ -16,7 +21,9 @@ def load_translations(lang_code: str) -> Dict[str, str]:
         lang_code = DEFAULT_LANGUAGE
 
     if lang_code in translations_cache:
+        CACHE_REQUESTS.inc("translations", "hit")
         return translations_cache[lang_code]
+    CACHE_REQUESTS.inc("translations", "miss")
 
     file_path = os.path.join(LOCALES_DIR, f"{lang_code}.json")
     try:
@@ -51,28 +58,28 @@ class I18nMiddleware(BaseMiddleware):
             lang_code_from_fsm = fsm_data.get('lang_code')
             if lang_code_from_fsm and lang_code_from_fsm in AVAILABLE_LANGUAGES:
                 lang_code_to_use = lang_code_from_fsm
-                logging.debug(f"I18nMiddleware: Using language from FSM: {lang_code_to_use}")
+                logger.debug("I18nMiddleware: Using language from FSM: %s", lang_code_to_use)
 
         # 2. Jika tidak ada dari FSM, coba dari preferensi pengguna (jika ada user_obj dan di DM atau belum ada dari grup)
         if not lang_code_to_use and user_obj and supabase_client:
-            logging.debug(f"I18nMiddleware: Attempting to get lang for user ID: {user_obj.id}")
+            logger.debug("I18nMiddleware: Attempting to get lang for user ID: %s", user_obj.id)
             lang_code_from_user_db = await get_user_language(supabase_client, user_obj.id)
             if lang_code_from_user_db and lang_code_from_user_db in AVAILABLE_LANGUAGES:
                 lang_code_to_use = lang_code_from_user_db
-                logging.debug(f"I18nMiddleware: Using language from user_preferences: {lang_code_to_use} for user {user_obj.id}")
+                logger.debug("I18nMiddleware: Using language from user_preferences: %s for user %s", lang_code_to_use, user_obj.id)
 
         # 3. Jika masih belum ada (terutama untuk konteks grup), coba dari pengaturan grup
         if not lang_code_to_use and chat_obj and chat_obj.type != 'private' and supabase_client:
-            logging.debug(f"I18nMiddleware: Attempting to get lang for group chat ID: {chat_obj.id}")
+            logger.debug("I18nMiddleware: Attempting to get lang for group chat ID: %s", chat_obj.id)
             lang_code_from_db = await get_group_language(supabase_client, chat_obj.id)
-            logging.debug(f"I18nMiddleware: Language from group_configs DB: {lang_code_from_db} for group {chat_obj.id}")
+            logger.debug("I18nMiddleware: Language from group_configs DB: %s for group %s", lang_code_from_db, chat_obj.id)
             if lang_code_from_db and lang_code_from_db in AVAILABLE_LANGUAGES:
                 lang_code_to_use = lang_code_from_db
 
         # 4. Jika semua gagal, fallback ke DEFAULT_LANGUAGE
         if not lang_code_to_use or lang_code_to_use not in AVAILABLE_LANGUAGES:
             lang_code_to_use = DEFAULT_LANGUAGE
-            logging.debug(f"I18nMiddleware: Falling back to DEFAULT_LANGUAGE: {lang_code_to_use}")
+            logger.debug("I18nMiddleware: Falling back to DEFAULT_LANGUAGE: %s", lang_code_to_use)
 
         current_translations = load_translations(lang_code_to_use)
 
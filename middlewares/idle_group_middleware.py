@@ -0,0 +1,37 @@
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from utils.config_store import group_has_features
+from utils.metrics import DROPPED_UPDATES
+from utils.supabase_interface import get_ai_config
+
+
+class IdleGroupFilterMiddleware(BaseMiddleware):
+    """
+    Outer middleware pada dp.update, dipasang sebelum tracing dan I18nMiddleware: pesan teks
+    biasa (bukan command) di grup yang tidak mengaktifkan fitur apa pun dibuang di sini,
+    sebelum ada lookup bahasa user/grup. Command, callback dan update anggota tetap diteruskan,
+    jadi /setup_ai dan alur lain tetap berjalan; setelah grup di-setup, save_ai_config
+    memperbarui snapshot config dan pesan berikutnya langsung lolos.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        message = event.message if isinstance(event, Update) else None
+        supabase_client = data.get("supabase_client")
+        if (
+            message is not None
+            and supabase_client is not None
+            and message.chat.type in ("group", "supergroup")
+            and message.text
+            and not message.text.startswith("/")
+            and not group_has_features(await get_ai_config(supabase_client, message.chat.id))
+        ):
+            DROPPED_UPDATES.inc("idle_group")
+            return None
+        return await handler(event, data)
@@ -0,0 +1,92 @@
+import time
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType, Response
+from aiogram.types import TelegramObject
+
+from utils.metrics import HANDLER_SECONDS, TELEGRAM_API_SECONDS, ERRORS, registry
+from utils.tracing import span
+from utils.startup_timing import startup_timer
+from utils.loop_monitor import loop_monitor
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner middleware: mengukur durasi handler per router/handler yang benar-benar terpilih,
+    dan mendaftarkannya ke loop_monitor supaya kemacetan loop bisa dikaitkan ke handler dan update.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        started_at = time.perf_counter()
+        router = data.get("event_router")
+        handler_object = data.get("handler")
+        router_name = getattr(router, "name", None) or "unknown"
+        handler_name = getattr(getattr(handler_object, "callback", None), "__name__", None) or "unknown"
+        update = data.get("event_update")
+        chat = data.get("event_chat")
+        monitor_token = loop_monitor.handler_started(
+            router_name, handler_name, getattr(update, "update_id", None), getattr(chat, "id", None)
+        )
+        try:
+            with span("handler", router=router_name, handler=handler_name):
+                return await handler(event, data)
+        except Exception as e:
+            ERRORS.inc("handler", type(e).__name__)
+            raise
+        finally:
+            loop_monitor.handler_finished(monitor_token)
+            HANDLER_SECONDS.observe(time.perf_counter() - started_at, router_name, handler_name)
+
+
+class TelegramApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Request middleware pada session bot: mengukur setiap panggilan Bot API per method dan
+    menghitung panggilan yang sedang berjalan (antrean keluar ke Telegram).
+    """
+
+    in_flight = 0
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        started_at = time.perf_counter()
+        api_method = getattr(method, "__api_method__", type(method).__name__)
+        TelegramApiMetricsMiddleware.in_flight += 1
+        try:
+            with span(f"telegram.{api_method}"):
+                return await make_request(bot, method)
+        except Exception as e:
+            ERRORS.inc("telegram", type(e).__name__)
+            raise
+        finally:
+            TelegramApiMetricsMiddleware.in_flight -= 1
+            TELEGRAM_API_SECONDS.observe(time.perf_counter() - started_at, api_method)
+
+
+class FirstUpdateTimingMiddleware(BaseMiddleware):
+    """Outer middleware: menandai update pertama yang selesai ditangani untuk laporan startup."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            if startup_timer.first_update_seconds is None:
+                startup_timer.mark_first_update()
+
+
+registry.gauge_callback("wisedebot_telegram_requests_in_flight", "Bot API requests currently waiting for a response.", lambda: TelegramApiMetricsMiddleware.in_flight)
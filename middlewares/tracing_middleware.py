@@ -0,0 +1,32 @@
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from utils.tracing import start_trace, finish_trace
+
+
+class TracingMiddleware(BaseMiddleware):
+    """
+    Outer middleware pada dp.update: membuka root span untuk setiap update.
+    Span anak (Supabase, Groq, crypto, Bot API, handler) menempel lewat contextvar.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        attrs = {}
+        if isinstance(event, Update):
+            attrs["update_id"] = event.update_id
+            attrs["event_type"] = event.event_type
+        root = start_trace("update", **attrs)
+        error = None
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            finish_trace(root, error)
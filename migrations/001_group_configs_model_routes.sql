@@ -0,0 +1,4 @@
+-- Per-group overrides for the task model routing table (bot_config.TASK_MODEL_ROUTES).
+-- Example value: {"moderation": {"model": "gemma2-9b-it", "max_tokens": 32}}
+alter table group_configs
+    add column if not exists model_routes jsonb not null default '{}'::jsonb;
@@ -0,0 +1,4 @@
+-- Opt-in exact-match answer cache for /ask_ai, mentions and custom prefixes.
+alter table group_configs
+    add column if not exists answer_cache_enabled boolean not null default false,
+    add column if not exists answer_cache_history_scoped boolean not null default false;
@@ -0,0 +1,10 @@
+-- Reply-chain scoped context. Both rows of a turn (user + assistant) carry the
+-- Telegram message_id of the bot's answer; reply_to_message_id points at the
+-- bot answer the user replied to, i.e. the parent turn in the thread.
+alter table conversation_history
+    add column if not exists message_id bigint,
+    add column if not exists reply_to_message_id bigint;
+
+create index if not exists conversation_history_group_message_idx
+    on conversation_history (group_id, message_id)
+    where message_id is not null;
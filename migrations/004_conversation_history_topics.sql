@@ -0,0 +1,7 @@
+-- Topic-aware history for forum supergroups. Rows outside a forum topic keep
+-- message_thread_id = NULL, so existing history stays with the main chat.
+alter table conversation_history
+    add column if not exists message_thread_id bigint;
+
+create index if not exists conversation_history_group_topic_ts_idx
+    on conversation_history (group_id, message_thread_id, "timestamp" desc);
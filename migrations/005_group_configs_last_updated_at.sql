@@ -0,0 +1,26 @@
+-- Delta refresh for the local group config snapshot (utils/config_store.py) polls
+-- rows with last_updated_at >= the last value it saw. Stamp the column on the
+-- database side so edits made directly in SQL or the dashboard are picked up too,
+-- and so the watermark follows a single clock.
+alter table group_configs
+    alter column last_updated_at set default now();
+
+update group_configs set last_updated_at = now() where last_updated_at is null;
+
+create or replace function group_configs_touch_last_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.last_updated_at := now();
+    return new;
+end;
+$$;
+
+drop trigger if exists group_configs_touch_last_updated_at on group_configs;
+create trigger group_configs_touch_last_updated_at
+    before insert or update on group_configs
+    for each row execute function group_configs_touch_last_updated_at();
+
+create index if not exists group_configs_last_updated_at_idx
+    on group_configs (last_updated_at);
@@ -0,0 +1,52 @@
+-- Per-group Groq usage accounting (utils/usage_tracker.py) and optional daily
+-- quotas. The bot aggregates usage in memory and flushes it in batches through
+-- increment_group_usage(), which adds to the day's counters and returns the
+-- day totals per group so every replica converges on the same quota state.
+alter table group_configs
+    add column if not exists daily_token_quota bigint,
+    add column if not exists daily_request_quota integer;
+
+create table if not exists group_usage_daily (
+    group_id bigint not null,
+    usage_date date not null,
+    task text not null,
+    requests bigint not null default 0,
+    prompt_tokens bigint not null default 0,
+    completion_tokens bigint not null default 0,
+    latency_ms_total bigint not null default 0,
+    primary key (group_id, usage_date, task)
+);
+
+create index if not exists group_usage_daily_usage_date_idx
+    on group_usage_daily (usage_date);
+
+create or replace function increment_group_usage(rows jsonb)
+returns table (group_id bigint, usage_date date, requests bigint, total_tokens bigint)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+    insert into group_usage_daily as u
+        (group_id, usage_date, task, requests, prompt_tokens, completion_tokens, latency_ms_total)
+    select r.group_id, r.usage_date, r.task, r.requests, r.prompt_tokens, r.completion_tokens, r.latency_ms_total
+    from jsonb_to_recordset(rows) as r(
+        group_id bigint, usage_date date, task text, requests bigint,
+        prompt_tokens bigint, completion_tokens bigint, latency_ms_total bigint
+    )
+    on conflict (group_id, usage_date, task) do update set
+        requests = u.requests + excluded.requests,
+        prompt_tokens = u.prompt_tokens + excluded.prompt_tokens,
+        completion_tokens = u.completion_tokens + excluded.completion_tokens,
+        latency_ms_total = u.latency_ms_total + excluded.latency_ms_total;
+
+    return query
+        select u.group_id, u.usage_date, sum(u.requests)::bigint,
+               sum(u.prompt_tokens + u.completion_tokens)::bigint
+        from group_usage_daily u
+        where (u.group_id, u.usage_date) in (
+            select distinct (x ->> 'group_id')::bigint, (x ->> 'usage_date')::date
+            from jsonb_array_elements(rows) as x
+        )
+        group by u.group_id, u.usage_date;
+end;
+$$;
@@ -0,0 +1,4 @@
+-- Per-group sliding-window limit for AI triggers (utils/rate_limiter.py).
+-- Values are keys of AI_RATE_LIMIT_LEVELS in bot_config.py; NULL means the default level.
+alter table group_configs
+    add column if not exists ai_rate_limit_level text;
@@ -0,0 +1,51 @@
+import pytest
+
+from utils.rate_limiter import SlidingWindowCounter
+
+# Window dan limit dipilih supaya (limit - 1) / limit dan pembagian oleh window persis di floating point
+WINDOW = 64.0
+LIMIT = 4
+
+
+def _counter() -> SlidingWindowCounter:
+    # Sweep pertama dijadwalkan dari time.monotonic(); dengan jeda sebesar ini ia tidak jalan selama tes
+    return SlidingWindowCounter(window_seconds=WINDOW, sweep_seconds=10_000_000)
+
+
+def _fill(counter: SlidingWindowCounter, key, times):
+    for now in times:
+        assert counter.retry_after(key, LIMIT, now) == 0.0
+        counter.hit(key, now)
+
+
+def test_full_current_window_waits_until_it_has_decayed():
+    counter = _counter()
+    _fill(counter, "k", [1.0, 2.0, 3.0, 4.0])
+    now = 8.0
+    wait = counter.retry_after("k", LIMIT, now)
+    # Sisa window ini (56 detik) ditambah seperempat window berikutnya supaya 4 hit meluruh ke 3
+    assert wait == pytest.approx((WINDOW - now) + WINDOW / 4)
+    assert counter.retry_after("k", LIMIT, now + wait - 0.01) > 0
+    assert counter.retry_after("k", LIMIT, now + wait) == 0.0
+
+
+def test_previous_window_decay_wait_is_exact():
+    counter = _counter()
+    _fill(counter, "k", [10.0, 11.0, 12.0, 13.0])
+    now = WINDOW
+    wait = counter.retry_after("k", LIMIT, now)
+    assert wait == pytest.approx(WINDOW / 4)
+    assert counter.retry_after("k", LIMIT, now + wait - 0.01) > 0
+    assert counter.retry_after("k", LIMIT, now + wait) == 0.0
+
+
+def test_window_roll_over_keeps_only_the_adjacent_window():
+    counter = _counter()
+    _fill(counter, "adjacent", [10.0, 11.0, 12.0, 13.0])
+    _fill(counter, "stale", [10.0, 11.0, 12.0, 13.0])
+    # Tepat satu window kemudian: hit lama jadi "sebelumnya" dan masih menahan
+    assert counter.retry_after("adjacent", LIMIT, WINDOW + 1) > 0
+    # Lebih dari satu window kemudian: hit lama dibuang seluruhnya
+    assert counter.retry_after("stale", LIMIT, 2 * WINDOW + 1) == 0.0
+    _fill(counter, "stale", [2 * WINDOW + 1, 2 * WINDOW + 2, 2 * WINDOW + 3, 2 * WINDOW + 4])
+    assert counter.retry_after("stale", LIMIT, 2 * WINDOW + 5) > 0
@@ -0,0 +1,76 @@
+import html
+import re
+
+from utils.telegram_render import TELEGRAM_TEXT_LIMIT, render_for_telegram, render_inline, split_telegram_html, utf16_len
+
+_TAG = re.compile(r"<(/?)([a-zA-Z][\w-]*)[^>]*>")
+
+
+def _visible_text(chunk: str) -> str:
+    # Telegram menghitung batas pada teks setelah tag dibuang dan entity di-decode
+    return html.unescape(_TAG.sub("", chunk))
+
+
+def _assert_balanced(chunk: str):
+    stack = []
+    for match in _TAG.finditer(chunk):
+        closing, name = match.group(1), match.group(2)
+        if closing:
+            assert stack and stack[-1] == name, f"unexpected </{name}> in {chunk[:80]!r}"
+            stack.pop()
+        else:
+            stack.append(name)
+    assert not stack, f"unclosed {stack} in chunk"
+
+
+def _assert_valid_chunks(chunks: list[str]):
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert utf16_len(_visible_text(chunk)) <= TELEGRAM_TEXT_LIMIT
+        _assert_balanced(chunk)
+        # Gagal jika ada surrogate yang terpotong setengah
+        chunk.encode("utf-16-le")
+
+
+def test_dunder_identifiers_are_not_bold():
+    assert render_inline("Use the __init__ method and __main__ guard") == "Use the __init__ method and __main__ guard"
+    assert render_inline("see __init__.py") == "see __init__.py"
+
+
+def test_underscores_inside_words_are_not_bold():
+    assert render_inline("foo__bar__baz") == "foo__bar__baz"
+    assert render_inline("my_var_name") == "my_var_name"
+
+
+def test_double_underscore_and_asterisk_bold():
+    assert render_inline("__very important__ text") == "<b>very important</b> text"
+    assert render_inline("**bold** and __also bold__") == "<b>bold</b> and <b>also bold</b>"
+
+
+def test_long_code_block_is_reopened_in_every_chunk():
+    code = "\n".join(f"x_{i} = compute({i}) < {i + 1} & True" for i in range(600))
+    source = f"Intro\n\n```python\n{code}\n```\n\nOutro"
+    chunks = render_for_telegram(source)
+    _assert_valid_chunks(chunks)
+    for chunk in chunks[1:-1]:
+        assert chunk.startswith('<pre><code class="language-python">')
+        assert chunk.endswith("</code></pre>")
+    joined = "".join(_visible_text(chunk) for chunk in chunks)
+    assert code in joined
+
+
+def test_emoji_are_never_split_across_chunks():
+    text = "😀" * 5000
+    chunks = split_telegram_html(text)
+    _assert_valid_chunks(chunks)
+    assert "".join(chunks) == text
+
+
+def test_nested_tags_are_closed_and_reopened():
+    body = " ".join(f"word{i}" for i in range(1500))
+    markup = f"<b>bold <i>italic <u>{body}</u> tail</i></b> end"
+    chunks = split_telegram_html(markup)
+    _assert_valid_chunks(chunks)
+    for chunk in chunks[1:]:
+        assert chunk.startswith("<b><i>")
+    assert "".join(_visible_text(chunk) for chunk in chunks) == _visible_text(markup)
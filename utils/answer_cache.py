@@ -0,0 +1,85 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from bot_config import ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_ENTRIES
+from utils.metrics import CACHE_REQUESTS, registry
+
+# key -> (expires_at, {"main_response": ..., "thoughts": ...})
+_answer_cache: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+# group_id -> set of keys, supaya invalidasi per grup tidak perlu scan seluruh cache
+_group_keys: dict[int, set[tuple]] = {}
+
+registry.gauge_callback("wisedebot_answer_cache_entries", "Entries in the exact-match answer cache.", lambda: len(_answer_cache))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_question(question: str) -> str:
+    normalized = _WHITESPACE_RE.sub(" ", question.strip().lower())
+    return normalized.rstrip("?!.。！？ ")
+
+def fingerprint_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+def fingerprint_history(history_messages: list[dict]) -> str:
+    joined = "\x1e".join(f"{m.get('role')}\x1f{m.get('content')}" for m in history_messages)
+    return fingerprint_text(joined)
+
+def build_answer_cache_key(
+    group_id: int,
+    message_thread_id: int | None,
+    system_prompt: str,
+    model: str,
+    question: str,
+    history_fingerprint: str | None = None
+) -> tuple:
+    return (group_id, message_thread_id, fingerprint_text(system_prompt or ""), model, normalize_question(question), history_fingerprint)
+
+def get_cached_answer(key: tuple) -> dict | None:
+    entry = _answer_cache.get(key)
+    if entry is None:
+        CACHE_REQUESTS.inc("answer", "miss")
+        return None
+    expires_at, answer = entry
+    if expires_at <= time.monotonic():
+        _remove_key(key)
+        CACHE_REQUESTS.inc("answer", "miss")
+        return None
+    _answer_cache.move_to_end(key)
+    CACHE_REQUESTS.inc("answer", "hit")
+    return answer
+
+def store_answer(key: tuple, main_response: str, thoughts: str | None):
+    if key in _answer_cache:
+        _answer_cache.move_to_end(key)
+    _answer_cache[key] = (time.monotonic() + ANSWER_CACHE_TTL_SECONDS, {"main_response": main_response, "thoughts": thoughts})
+    _group_keys.setdefault(key[0], set()).add(key)
+    while len(_answer_cache) > ANSWER_CACHE_MAX_ENTRIES:
+        oldest_key, _ = _answer_cache.popitem(last=False)
+        _forget_group_key(oldest_key)
+        CACHE_REQUESTS.inc("answer", "evicted")
+
+def invalidate_group_answers(group_id: int):
+    for key in _group_keys.pop(group_id, set()):
+        _answer_cache.pop(key, None)
+
+def invalidate_topic_answers(group_id: int, message_thread_id: int | None):
+    keys = _group_keys.get(group_id)
+    if not keys:
+        return
+    for key in [k for k in keys if k[1] == message_thread_id]:
+        _remove_key(key)
+
+def answer_cache_size() -> int:
+    return len(_answer_cache)
+
+def _remove_key(key: tuple):
+    _answer_cache.pop(key, None)
+    _forget_group_key(key)
+
+def _forget_group_key(key: tuple):
+    keys = _group_keys.get(key[0])
+    if keys is not None:
+        keys.discard(key)
+        if not keys:
+            _group_keys.pop(key[0], None)
@@ -0,0 +1,215 @@
+from __future__ import annotations
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
+from bot_config import (
+    DEFAULT_MODERATION_LEVEL, DEFAULT_AI_RATE_LIMIT_LEVEL, GROUP_CONFIG_PRELOAD_PAGE_SIZE,
+    GROUP_CONFIG_REFRESH_SECONDS, GROUP_CONFIG_DELTA_OVERLAP_SECONDS,
+    GROUP_CONFIG_NEGATIVE_TTL_SECONDS, GROUP_CONFIG_NEGATIVE_MAX_ENTRIES
+)
+from utils.metrics import observe_supabase_call, registry, CACHE_REQUESTS
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger("wisedebot.supabase")
+
+GROUP_CONFIG_COLUMNS = (
+    "group_id, encrypted_groq_api_key, system_prompt, groq_model, "
+    "configured_by_user_id, last_updated_at, is_active, language_code, "
+    "ai_trigger_command_enabled, ai_trigger_mention_enabled, ai_trigger_custom_prefix, "
+    "welcome_message_enabled, custom_welcome_message, welcome_message_ai_enabled, "
+    "moderation_level, moderation_action, moderation_text_categories, moderation_image_categories, "
+    "model_routes, answer_cache_enabled, answer_cache_history_scoped, "
+    "daily_token_quota, daily_request_quota, ai_rate_limit_level"
+)
+
+
+def apply_config_defaults(config: dict) -> dict:
+    config.setdefault('ai_trigger_command_enabled', True)
+    config.setdefault('ai_trigger_mention_enabled', True)
+    config.setdefault('ai_trigger_custom_prefix', None)
+    config.setdefault('welcome_message_enabled', False)
+    config.setdefault('custom_welcome_message', None)
+    config.setdefault('welcome_message_ai_enabled', False)
+    config.setdefault('moderation_level', DEFAULT_MODERATION_LEVEL)
+    config.setdefault('moderation_action', 'warn')
+    config.setdefault('moderation_text_categories', [])
+    config.setdefault('moderation_image_categories', [])
+    config.setdefault('answer_cache_enabled', False)
+    config.setdefault('answer_cache_history_scoped', False)
+    config.setdefault('daily_token_quota', None)
+    config.setdefault('daily_request_quota', None)
+    if not config.get('ai_rate_limit_level'):
+        config['ai_rate_limit_level'] = DEFAULT_AI_RATE_LIMIT_LEVEL
+    if not config.get('model_routes'):
+        config['model_routes'] = {}
+    return config
+
+
+def group_has_features(config: dict | None) -> bool:
+    """False jika di grup ini tidak ada yang perlu dikerjakan bot untuk pesan biasa: AI tidak aktif, moderasi mati, welcome mati."""
+    if not config:
+        return False
+    return bool(
+        config.get("is_active")
+        or config.get("moderation_level", DEFAULT_MODERATION_LEVEL) != DEFAULT_MODERATION_LEVEL
+        or config.get("welcome_message_enabled")
+    )
+
+
+def _parse_timestamp(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+@observe_supabase_call
+async def fetch_group_configs_page(supabase: Client, offset: int, page_size: int, updated_since: str | None = None) -> list[dict]:
+    query = supabase.table("group_configs").select(GROUP_CONFIG_COLUMNS)
+    if updated_since:
+        query = query.gte("last_updated_at", updated_since)
+    response = await asyncio.to_thread(
+        query.order("group_id").range(offset, offset + page_size - 1).execute
+    )
+    return response.data or []
+
+
+class GroupConfigStore:
+    """
+    Salinan lokal seluruh tabel group_configs. preload() membaca semua baris per halaman saat
+    startup; setelah itu run_refresh_loop() hanya mengambil baris yang last_updated_at-nya
+    lebih baru dari sinkronisasi terakhir, jadi perubahan dari replika lain atau langsung di
+    database sampai ke sini dalam beberapa detik. Selama store belum termuat (mis. preload gagal),
+    pemanggil tetap membaca langsung dari Supabase.
+    """
+
+    def __init__(self, page_size: int = GROUP_CONFIG_PRELOAD_PAGE_SIZE):
+        self.page_size = page_size
+        self.loaded = False
+        self.last_synced_at: float | None = None
+        self._rows: dict[int, dict] = {}
+        # last_updated_at terbesar yang pernah dilihat; jam database, bukan jam bot
+        self._watermark: datetime | None = None
+        # group_id -> waktu monotonic kedaluwarsa; grup yang barisnya tidak ada di database
+        self._missing_until: OrderedDict[int, float] = OrderedDict()
+
+    def get(self, group_id: int) -> dict | None:
+        row = self._rows.get(group_id)
+        if row is None:
+            return None
+        # Salinan, supaya handler yang mengubah dict hasil tidak mengotori store
+        return apply_config_defaults({key: value for key, value in row.items() if key != "group_id"})
+
+    def is_known_missing(self, group_id: int) -> bool:
+        until = self._missing_until.get(group_id)
+        if until is None:
+            return False
+        if until <= time.monotonic():
+            del self._missing_until[group_id]
+            return False
+        CACHE_REQUESTS.inc("group_config_negative", "hit")
+        return True
+
+    def remember_missing(self, group_id: int):
+        self._missing_until[group_id] = time.monotonic() + GROUP_CONFIG_NEGATIVE_TTL_SECONDS
+        self._missing_until.move_to_end(group_id)
+        while len(self._missing_until) > GROUP_CONFIG_NEGATIVE_MAX_ENTRIES:
+            self._missing_until.popitem(last=False)
+            CACHE_REQUESTS.inc("group_config_negative", "evicted")
+
+    def forget_missing(self, group_id: int):
+        self._missing_until.pop(group_id, None)
+
+    def apply_row(self, row: dict, advance_watermark: bool = True):
+        group_id = row.get("group_id")
+        if group_id is None:
+            return
+        self._missing_until.pop(group_id, None)
+        existing = self._rows.get(group_id)
+        if existing is None:
+            self._rows[group_id] = dict(row)
+        else:
+            existing.update(row)
+        updated_at = _parse_timestamp(row.get("last_updated_at")) if advance_watermark else None
+        if updated_at is not None and (self._watermark is None or updated_at > self._watermark):
+            self._watermark = updated_at
+
+    def apply_local_write(self, group_id: int, changes: dict, create: bool = True):
+        # Write-through setelah upsert/update yang berhasil, supaya replika ini langsung konsisten.
+        # Timestamp dari jam bot tidak boleh memajukan watermark: delta dari replika lain bisa terlewat.
+        # create=False untuk UPDATE biasa, yang tidak membuat baris baru di database.
+        if create:
+            self.forget_missing(group_id)
+        if self.loaded and (create or group_id in self._rows):
+            self.apply_row({**changes, "group_id": group_id}, advance_watermark=False)
+
+    async def _read_all(self, supabase: Client, updated_since: str | None = None) -> int:
+        offset = 0
+        applied = 0
+        while True:
+            page = await fetch_group_configs_page(supabase, offset, self.page_size, updated_since)
+            for row in page:
+                self.apply_row(row)
+            applied += len(page)
+            if len(page) < self.page_size:
+                return applied
+            offset += self.page_size
+
+    async def preload(self, supabase: Client) -> bool:
+        started_at = time.perf_counter()
+        try:
+            count = await self._read_all(supabase)
+        except Exception as e:
+            logger.error(f"Group config preload failed, falling back to per-group queries: {repr(e)}")
+            return False
+        self.loaded = True
+        self.last_synced_at = time.monotonic()
+        logger.info(f"Preloaded {count} group configs in {time.perf_counter() - started_at:.2f}s")
+        return True
+
+    async def refresh(self, supabase: Client) -> int:
+        if not self.loaded:
+            await self.preload(supabase)
+            return len(self._rows)
+        updated_since = None
+        if self._watermark is not None:
+            # Jendela tumpang-tindih: baris yang ditulis dengan timestamp sedikit di belakang
+            # watermark (transaksi yang commit belakangan) tetap terambil; menerapkan ulang aman
+            updated_since = (self._watermark - timedelta(seconds=GROUP_CONFIG_DELTA_OVERLAP_SECONDS)).isoformat()
+        count = await self._read_all(supabase, updated_since)
+        self.last_synced_at = time.monotonic()
+        if count:
+            logger.debug(f"Applied {count} group config deltas since {updated_since}")
+        return count
+
+    async def run_refresh_loop(self, supabase: Client, interval_seconds: float = GROUP_CONFIG_REFRESH_SECONDS):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.refresh(supabase)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Group config delta refresh failed: {repr(e)}")
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def known_missing_count(self) -> int:
+        return len(self._missing_until)
+
+
+group_config_store = GroupConfigStore()
+
+registry.gauge_callback("wisedebot_group_config_store_rows", "Group configs held in the local snapshot.", lambda: len(group_config_store))
+registry.gauge_callback(
+    "wisedebot_group_config_store_staleness_seconds", "Seconds since the last successful group config sync.",
+    lambda: time.monotonic() - group_config_store.last_synced_at if group_config_store.last_synced_at else 0.0
+)
@@ -1,4 +1,8 @@
+import logging
 from cryptography.fernet import Fernet, InvalidToken
+from utils.tracing import span
+
+logger = logging.getLogger("wisedebot.crypto")
 
 class CryptoUtil:
     def __init__(self, encryption_key: str):
@@ -14,19 +18,21 @@ class CryptoUtil:
         if not data:
             return None
         try:
-            return self.fernet.encrypt(data.encode()).decode()
+            with span("crypto.encrypt"):
+                return self.fernet.encrypt(data.encode()).decode()
         except Exception as e:
-            print(f"Encryption failed: {e}")
+            logger.error(f"Encryption failed: {e}")
             return None
 
     def decrypt_data(self, encrypted_data: str) -> str | None:
         if not encrypted_data:
             return None
         try:
-            return self.fernet.decrypt(encrypted_data.encode()).decode()
+            with span("crypto.decrypt"):
+                return self.fernet.decrypt(encrypted_data.encode()).decode()
         except InvalidToken: # Error spesifik jika token/data terenkripsi tidak valid
-            print("Decryption failed: Invalid token or malformed encrypted data.")
+            logger.error("Decryption failed: Invalid token or malformed encrypted data.")
             return None
         except Exception as e:
-            print(f"Decryption failed with an unexpected error: {e}")
+            logger.error(f"Decryption failed with an unexpected error: {e}")
             return None
@@ -1,21 +1,123 @@
+import logging
 import re 
-from groq import AsyncGroq, GroqError
-from bot_config import GROQ_MAX_TOKENS
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from bot_config import (
+    GROQ_MAX_TOKENS, MODEL_FAILURE_COOLDOWN_SECONDS, resolve_task_route,
+    GROQ_HEDGING_ENABLED, GROQ_HEDGE_MODELS, GROQ_HEDGE_PERCENTILE,
+    GROQ_HEDGE_MIN_SAMPLES, GROQ_HEDGE_MIN_DELAY_SECONDS, GROQ_CLIENT_CACHE_SIZE
+)
+from utils.latency_stats import groq_latency
+from utils.metrics import GROQ_COMPLETION_SECONDS, ERRORS, registry
+from utils.tracing import span
+from utils.usage_tracker import usage_tracker
+
+logger = logging.getLogger("wisedebot.groq")
+
+# SDK groq (beserta httpx dan model pydantic-nya) baru di-import saat pertama kali dipakai,
+# supaya tidak memperlambat start bot. warm_groq_sdk() bisa dipanggil di thread saat startup.
+_groq_sdk = None
+# Pengganti groq.AsyncGroq, mis. untuk benchmark; None = pakai SDK asli
+client_factory = None
+# fingerprint api key -> client; client dipakai ulang supaya koneksi HTTP ke Groq tetap hidup
+_clients: OrderedDict[str, object] = OrderedDict()
+# fingerprint api key -> jumlah completion yang sedang berjalan; dihapus begitu key menganggur
+_key_in_flight: dict[str, int] = {}
+# Client yang sudah keluar dari cache tapi masih dipakai completion yang berjalan; ditutup saat key menganggur
+_retired_clients: dict[str, list] = {}
+# Referensi ke task penutupan client supaya tidak di-garbage-collect sebelum selesai
+_close_tasks: set[asyncio.Task] = set()
+
+def warm_groq_sdk():
+    global _groq_sdk
+    if _groq_sdk is None:
+        import groq
+        _groq_sdk = groq
+    return _groq_sdk
+
+def _new_client(api_key: str):
+    factory = client_factory or warm_groq_sdk().AsyncGroq
+    return factory(api_key=api_key)
+
+def _client_for(api_key: str):
+    fingerprint = _key_fingerprint(api_key)
+    client = _clients.get(fingerprint)
+    if client is None:
+        client = _new_client(api_key)
+        _clients[fingerprint] = client
+        while len(_clients) > GROQ_CLIENT_CACHE_SIZE:
+            evicted_fingerprint, evicted = _clients.popitem(last=False)
+            if _key_in_flight.get(evicted_fingerprint):
+                _retired_clients.setdefault(evicted_fingerprint, []).append(evicted)
+            else:
+                _schedule_close(evicted)
+    else:
+        _clients.move_to_end(fingerprint)
+    return client
+
+def _schedule_close(client):
+    # Menutup pool koneksi httpx milik client; _client_for sinkron jadi penutupan dijalankan sebagai task
+    task = asyncio.get_running_loop().create_task(_close_client(client))
+    _close_tasks.add(task)
+    task.add_done_callback(_close_tasks.discard)
+
+async def _close_client(client):
+    try:
+        await client.close()
+    except Exception as e:
+        logger.warning(f"Failed to close Groq client: {repr(e)}")
+
+async def close_groq_clients():
+    """Menutup semua client yang di-cache; dipanggil saat bot berhenti."""
+    clients = list(_clients.values())
+    for retired in _retired_clients.values():
+        clients.extend(retired)
+    _clients.clear()
+    _retired_clients.clear()
+    await asyncio.gather(*(_close_client(client) for client in clients), *_close_tasks)
+
+@contextmanager
+def _track_in_flight(api_key: str):
+    # Hanya penghitung untuk /perfstats; tidak membatasi atau menahan request
+    fingerprint = _key_fingerprint(api_key)
+    _key_in_flight[fingerprint] = _key_in_flight.get(fingerprint, 0) + 1
+    try:
+        yield
+    finally:
+        remaining = _key_in_flight[fingerprint] - 1
+        if remaining:
+            _key_in_flight[fingerprint] = remaining
+        else:
+            del _key_in_flight[fingerprint]
+            for client in _retired_clients.pop(fingerprint, ()):
+                _schedule_close(client)
+
+def groq_key_load() -> dict[str, int]:
+    """fingerprint api key -> jumlah completion yang sedang berjalan."""
+    return dict(_key_in_flight)
 
 async def validate_groq_api_key(api_key: str) -> tuple[bool, str | None]:
     if not api_key:
         return False, "API Key is empty."
+    client = None
     try:
-        client = AsyncGroq(api_key=api_key)
+        # Client baru (tanpa cache): key yang sedang divalidasi belum tentu dipakai, jadi langsung ditutup lagi
+        client = _new_client(api_key)
         await client.models.list() 
         return True, None
-    except GroqError as e:
-        error_message = f"Type: {e.type if hasattr(e, 'type') else 'N/A'}, Message: {e.message if hasattr(e, 'message') else str(e)}"
-        print(f"Groq API Key validation failed: {error_message}")
+    except warm_groq_sdk().GroqError as e:
+        error_message = _format_groq_error(e)
+        logger.error(f"Groq API Key validation failed: {error_message}")
         return False, error_message
     except Exception as e:
-        print(f"Unexpected error during Groq API Key validation: {repr(e)}")
+        logger.error(f"Unexpected error during Groq API Key validation: {repr(e)}")
         return False, repr(e)
+    finally:
+        if client is not None:
+            await _close_client(client)
 
 # --- DEFINISI FUNGSI parse_ai_response DI SINI (SEBELUM get_groq_completion) ---
 def parse_ai_response(raw_response: str) -> dict:
@@ -42,44 +144,233 @@ def parse_ai_response(raw_response: str) -> dict:
     return {"main_response": main_response, "thoughts": all_thoughts}
 # --- AKHIR DEFINISI FUNGSI parse_ai_response ---
 
+def _format_groq_error(e: Exception) -> str:
+    return f"Type: {e.type if hasattr(e, 'type') else 'N/A'}, Message: {e.message if hasattr(e, 'message') else str(e)}"
+
+async def _create_completion(
+    api_key: str,
+    model: str,
+    messages_to_send: list[dict],
+    max_tokens: int,
+    temperature: float | None
+) -> dict:
+    client = _client_for(api_key)
+    request_kwargs = {}
+    if temperature is not None:
+        request_kwargs["temperature"] = temperature
+    chat_completion = await client.chat.completions.create(
+        messages=messages_to_send, # Gunakan list pesan yang sudah dirakit
+        model=model,
+        max_tokens=max_tokens,
+        **request_kwargs
+    )
+    raw_response_content = chat_completion.choices[0].message.content
+    result = parse_ai_response(raw_response_content or "")
+    usage = getattr(chat_completion, "usage", None)
+    result["usage"] = {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+    } if usage is not None else None
+    return result
+
+async def _timed_completion(
+    api_key: str,
+    model: str,
+    messages_to_send: list[dict],
+    max_tokens: int,
+    temperature: float | None,
+    task: str
+) -> dict:
+    with _track_in_flight(api_key):
+        started_at = time.monotonic()
+        try:
+            with span("groq.completion", model=model, task=task):
+                result = await _create_completion(api_key, model, messages_to_send, max_tokens, temperature)
+        except asyncio.CancelledError:
+            # Sampel tersensor: panggilan lambat yang dibatalkan tetap dicatat sebagai batas bawah,
+            # supaya p95 tidak terus mengecil hanya karena request lambat selalu dibatalkan.
+            groq_latency.record(model, time.monotonic() - started_at)
+            raise
+        except Exception as e:
+            ERRORS.inc("groq", type(e).__name__)
+            raise
+        elapsed = time.monotonic() - started_at
+    groq_latency.record(model, elapsed)
+    GROQ_COMPLETION_SECONDS.observe(elapsed, model, task)
+    result["latency_seconds"] = elapsed
+    return result
+
+# Penghitung hedging, dibaca untuk statistik/monitoring
+hedge_stats = {
+    "fired": 0,
+    "primary_wins": 0,
+    "secondary_wins": 0,
+    "both_failed": 0,
+    "estimated_seconds_saved": 0.0,
+}
+registry.gauge_callback(
+    "wisedebot_groq_calls_in_flight", "Groq completions currently running, summed over API keys.",
+    lambda: sum(_key_in_flight.values())
+)
+registry.gauge_callback(
+    "wisedebot_groq_hedge_events", "Hedged Groq request counters (see hedge_stats).",
+    lambda: {(name,): value for name, value in hedge_stats.items()}, ("event",)
+)
+
+async def _completion_with_hedging(
+    api_key: str,
+    model: str,
+    messages_to_send: list[dict],
+    max_tokens: int,
+    temperature: float | None,
+    task: str = "direct"
+) -> dict:
+    secondary_model = GROQ_HEDGE_MODELS.get(model) if GROQ_HEDGING_ENABLED else None
+    hedge_delay = None
+    if secondary_model and secondary_model != model:
+        hedge_delay = groq_latency.percentile(model, GROQ_HEDGE_PERCENTILE, min_samples=GROQ_HEDGE_MIN_SAMPLES)
+    if hedge_delay is None:
+        return await _timed_completion(api_key, model, messages_to_send, max_tokens, temperature, task)
+
+    hedge_delay = max(hedge_delay, GROQ_HEDGE_MIN_DELAY_SECONDS)
+    started_at = time.monotonic()
+    primary_task = asyncio.create_task(_timed_completion(api_key, model, messages_to_send, max_tokens, temperature, task))
+    secondary_task = None
+    try:
+        done, _pending = await asyncio.wait({primary_task}, timeout=hedge_delay)
+        if done:
+            return primary_task.result()
+
+        hedge_stats["fired"] += 1
+        secondary_task = asyncio.create_task(_timed_completion(api_key, secondary_model, messages_to_send, max_tokens, temperature, task))
+        pending = {primary_task, secondary_task}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    continue
+                if task is secondary_task:
+                    hedge_stats["secondary_wins"] += 1
+                    # Perkiraan: model utama diasumsikan selesai di sekitar p99-nya
+                    primary_p99 = groq_latency.percentile(model, 0.99) or 0.0
+                    hedge_stats["estimated_seconds_saved"] += max(0.0, primary_p99 - (time.monotonic() - started_at))
+                else:
+                    hedge_stats["primary_wins"] += 1
+                return task.result()
+
+        hedge_stats["both_failed"] += 1
+        raise primary_task.exception()
+    finally:
+        for task in (primary_task, secondary_task):
+            if task is not None and not task.done():
+                task.cancel()
+
 async def get_groq_completion(
     api_key: str, 
     model: str, 
     system_prompt_for_call: str, # Tetap ada untuk kompatibilitas jika full_messages_list tidak disediakan
     user_prompt_for_call: str,   # atau jika ingin override system prompt
-    full_messages_list: list[dict] | None = None # Argumen baru
+    full_messages_list: list[dict] | None = None, # Argumen baru
+    max_tokens: int = GROQ_MAX_TOKENS,
+    temperature: float | None = None
 ) -> dict | None:
     if not api_key:
-        print("Groq API key is missing.")
+        logger.warning("Groq API key is missing.")
         return {"main_response": "Groq API key is missing.", "thoughts": None}
 
-    try:
-        client = AsyncGroq(api_key=api_key)
+    messages_to_send: list[dict]
+    if full_messages_list:
+        messages_to_send = full_messages_list
+    else:
+        # Fallback jika full_messages_list tidak disediakan (seharusnya tidak terjadi dengan logika baru)
+        messages_to_send = [
+            {"role": "system", "content": system_prompt_for_call if system_prompt_for_call else "You are a helpful assistant."},
+            {"role": "user", "content": user_prompt_for_call}
+        ]
 
-        messages_to_send: list[dict]
-        if full_messages_list:
-            messages_to_send = full_messages_list
-        else:
-            # Fallback jika full_messages_list tidak disediakan (seharusnya tidak terjadi dengan logika baru)
-            messages_to_send = [
-                {"role": "system", "content": system_prompt_for_call if system_prompt_for_call else "You are a helpful assistant."},
-                {"role": "user", "content": user_prompt_for_call}
-            ]
-
-        chat_completion = await client.chat.completions.create(
-            messages=messages_to_send, # Gunakan list pesan yang sudah dirakit
-            model=model,
-            max_tokens=GROQ_MAX_TOKENS,
-        )
-        raw_response_content = chat_completion.choices[0].message.content
-
-        parsed_response = parse_ai_response(raw_response_content)
-        return parsed_response
-
-    except GroqError as e:
-        error_message = f"Type: {e.type if hasattr(e, 'type') else 'N/A'}, Message: {e.message if hasattr(e, 'message') else str(e)}"
-        print(f"Groq API Error: {error_message}")
+    try:
+        with span("groq.get_groq_completion", model=model):
+            return await _completion_with_hedging(api_key, model, messages_to_send, max_tokens, temperature)
+    except warm_groq_sdk().GroqError as e:
+        error_message = _format_groq_error(e)
+        logger.error(f"Groq API Error: {error_message}")
         return {"main_response": f"GROQ_API_ERROR: {error_message}", "thoughts": None}
     except Exception as e:
-        print(f"An unexpected error occurred while calling Groq API: {repr(e)}")
+        logger.error(f"An unexpected error occurred while calling Groq API: {repr(e)}")
         return {"main_response": f"UNEXPECTED_GROQ_ERROR: {repr(e)}", "thoughts": None}
+
+# --- Routing per tugas dengan fallback otomatis ---
+# (fingerprint api key, model) -> waktu monotonic sampai model boleh dicoba lagi
+_model_unhealthy_until: dict[tuple[str, str], float] = {}
+
+def _key_fingerprint(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()[:12]
+
+def _mark_model_unhealthy(api_key: str, model: str):
+    _model_unhealthy_until[(_key_fingerprint(api_key), model)] = time.monotonic() + MODEL_FAILURE_COOLDOWN_SECONDS
+
+def _is_model_healthy(api_key: str, model: str) -> bool:
+    until = _model_unhealthy_until.get((_key_fingerprint(api_key), model))
+    if until is None:
+        return True
+    if until <= time.monotonic():
+        _model_unhealthy_until.pop((_key_fingerprint(api_key), model), None)
+        return True
+    return False
+
+async def get_task_completion(
+    api_key: str,
+    task: str,
+    messages: list[dict],
+    group_config: dict | None = None,
+    group_id: int | None = None
+) -> dict | None:
+    """
+    Memanggil Groq memakai route untuk `task` (qa, moderation, welcome, summary).
+    Jika model utama timeout atau error di sisi server, model fallback dicoba berurutan.
+    Error otentikasi tidak di-fallback karena akan gagal juga di model lain.
+    Jika `group_id` diisi, token dan latensi setiap percobaan dicatat ke usage_tracker.
+    """
+    if not api_key:
+        logger.warning("Groq API key is missing.")
+        return {"main_response": "Groq API key is missing.", "thoughts": None}
+
+    route = resolve_task_route(task, group_config)
+    candidates = [route["model"], *route["fallback_models"]]
+    # Jika semua model sedang ditandai bermasalah, tetap coba semuanya
+    to_try = [m for m in candidates if _is_model_healthy(api_key, m)] or candidates
+
+    last_response = None
+    for model in to_try:
+        try:
+            attempt_started_at = time.monotonic()
+            with span("groq.task_attempt", task=task, model=model):
+                result = await asyncio.wait_for(
+                    _completion_with_hedging(api_key, model, messages, route["max_tokens"], route["temperature"], task),
+                    timeout=route["timeout_seconds"]
+                )
+            if group_id is not None:
+                usage_tracker.record(group_id, task, result.get("usage"), result.get("latency_seconds", time.monotonic() - attempt_started_at))
+            return result
+        except asyncio.TimeoutError:
+            ERRORS.inc("groq", "RouteTimeout")
+            if group_id is not None:
+                usage_tracker.record(group_id, task, None, route["timeout_seconds"])
+            logger.warning(f"Groq model '{model}' timed out after {route['timeout_seconds']}s for task '{task}'. Trying fallback.")
+            _mark_model_unhealthy(api_key, model)
+            last_response = {"main_response": f"GROQ_API_ERROR: Type: timeout, Message: model {model} did not answer in time", "thoughts": None}
+        except (warm_groq_sdk().AuthenticationError, warm_groq_sdk().PermissionDeniedError) as e:
+            error_message = _format_groq_error(e)
+            logger.error(f"Groq API Error: {error_message}")
+            return {"main_response": f"GROQ_API_ERROR: {error_message}", "thoughts": None}
+        except warm_groq_sdk().GroqError as e:
+            error_message = _format_groq_error(e)
+            logger.warning(f"Groq API Error on model '{model}' for task '{task}': {error_message}. Trying fallback.")
+            if group_id is not None:
+                usage_tracker.record(group_id, task, None, time.monotonic() - attempt_started_at)
+            _mark_model_unhealthy(api_key, model)
+            last_response = {"main_response": f"GROQ_API_ERROR: {error_message}", "thoughts": None}
+        except Exception as e:
+            logger.error(f"An unexpected error occurred while calling Groq API: {repr(e)}")
+            return {"main_response": f"UNEXPECTED_GROQ_ERROR: {repr(e)}", "thoughts": None}
+    return last_response
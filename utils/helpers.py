@@ -4,3 +4,10 @@ def escape_html_tags(text: str) -> str:
     if not isinstance(text, str):
         text = str(text)
     return html.escape(text)
+
+def get_topic_id(message) -> int | None:
+    # message_thread_id juga terisi untuk reply biasa di supergroup non-forum,
+    # jadi hanya dipakai jika pesan memang berada di dalam topik forum
+    if getattr(message, "is_topic_message", False) and message.message_thread_id:
+        return message.message_thread_id
+    return None
@@ -0,0 +1,153 @@
+from __future__ import annotations
+import asyncio
+import math
+import re
+from collections import Counter, OrderedDict
+from typing import TYPE_CHECKING
+from bot_config import HISTORY_INDEX_MAX_MESSAGES, HISTORY_INDEX_MAX_GROUPS, HISTORY_RETRIEVAL_TOP_K, HISTORY_RETRIEVAL_RECENT_TURNS
+from utils.metrics import CACHE_REQUESTS, registry
+if TYPE_CHECKING:
+    from supabase import Client
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 1]
+
+
+class HistoryIndex:
+    """
+    Indeks BM25 in-memory untuk satu grup. Setiap pesan history (user/assistant)
+    adalah satu dokumen; seq naik terus sehingga urutan kronologis tetap terjaga.
+    """
+    def __init__(self, max_messages: int = HISTORY_INDEX_MAX_MESSAGES):
+        self.max_messages = max_messages
+        self.docs: dict[int, dict] = {}           # seq -> {"role", "content", "terms": Counter, "length"}
+        self.postings: dict[str, dict[int, int]] = {}  # term -> {seq: tf}
+        self.total_length = 0
+        self.next_seq = 0
+        self.first_seq = 0
+
+    def add(self, role: str, content: str):
+        terms = Counter(tokenize(content))
+        seq = self.next_seq
+        self.next_seq += 1
+        length = sum(terms.values())
+        self.docs[seq] = {"role": role, "content": content, "terms": terms, "length": length}
+        self.total_length += length
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[seq] = tf
+        while len(self.docs) > self.max_messages:
+            self._remove_oldest()
+
+    def _remove_oldest(self):
+        while self.first_seq not in self.docs:
+            self.first_seq += 1
+        doc = self.docs.pop(self.first_seq)
+        self.total_length -= doc["length"]
+        for term in doc["terms"]:
+            term_postings = self.postings.get(term)
+            if term_postings is not None:
+                term_postings.pop(self.first_seq, None)
+                if not term_postings:
+                    del self.postings[term]
+        self.first_seq += 1
+
+    def search(self, query: str, top_k: int, exclude_seqs: set[int] | None = None) -> list[int]:
+        if not self.docs:
+            return []
+        exclude_seqs = exclude_seqs or set()
+        doc_count = len(self.docs)
+        avg_length = (self.total_length / doc_count) or 1.0
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            term_postings = self.postings.get(term)
+            if not term_postings:
+                continue
+            df = len(term_postings)
+            idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for seq, tf in term_postings.items():
+                if seq in exclude_seqs:
+                    continue
+                doc_length = self.docs[seq]["length"]
+                denom = tf + BM25_K1 * (1 - BM25_B + BM25_B * doc_length / avg_length)
+                scores[seq] = scores.get(seq, 0.0) + idf * tf * (BM25_K1 + 1) / denom
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [seq for seq, _score in ranked[:top_k]]
+
+    def recent_seqs(self, count: int) -> list[int]:
+        if count <= 0:
+            return []
+        return sorted(self.docs.keys())[-count:]
+
+    def partner_seq(self, seq: int) -> int | None:
+        # Pertanyaan user dan jawaban assistant disimpan berurutan; ambil pasangannya
+        doc = self.docs.get(seq)
+        if not doc:
+            return None
+        partner = seq + 1 if doc["role"] == "user" else seq - 1
+        partner_doc = self.docs.get(partner)
+        if partner_doc and partner_doc["role"] != doc["role"]:
+            return partner
+        return None
+
+    def messages_for(self, seqs: set[int]) -> list[dict]:
+        return [{"role": self.docs[s]["role"], "content": self.docs[s]["content"]} for s in sorted(seqs) if s in self.docs]
+
+
+# (group_id, message_thread_id) -> indeks; topik forum punya history sendiri-sendiri.
+# LRU: indeks grup/topik yang lama tidak bertanya dibuang dan dibangun ulang dari DB saat dibutuhkan.
+_group_indexes: OrderedDict[tuple[int, int | None], HistoryIndex] = OrderedDict()
+_group_index_locks: dict[tuple[int, int | None], asyncio.Lock] = {}
+
+async def ensure_group_index(supabase: Client, group_id: int, message_thread_id: int | None = None) -> HistoryIndex:
+    key = (group_id, message_thread_id)
+    index = _group_indexes.get(key)
+    if index is not None:
+        _group_indexes.move_to_end(key)
+        return index
+    lock = _group_index_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        index = _group_indexes.get(key)
+        if index is None:
+            # Import di sini untuk menghindari import melingkar dengan supabase_interface
+            from utils.supabase_interface import get_conversation_history
+            index = HistoryIndex()
+            rows = await get_conversation_history(supabase, group_id, limit=HISTORY_INDEX_MAX_MESSAGES, message_thread_id=message_thread_id)
+            for row in rows:
+                index.add(row["role"], row["content"])
+            _group_indexes[key] = index
+            while len(_group_indexes) > HISTORY_INDEX_MAX_GROUPS:
+                _group_indexes.popitem(last=False)
+                CACHE_REQUESTS.inc("history_index", "evicted")
+    _group_index_locks.pop(key, None)
+    return index
+
+def index_conversation_message(group_id: int, role: str, content: str, message_thread_id: int | None = None):
+    # Jika indeks belum dimuat, pesan ini akan ikut terbaca saat indeks dibangun dari DB
+    index = _group_indexes.get((group_id, message_thread_id))
+    if index is not None:
+        index.add(role, content)
+
+def drop_group_index(group_id: int, message_thread_id: int | None = None):
+    _group_indexes.pop((group_id, message_thread_id), None)
+
+def select_context_messages(
+    index: HistoryIndex,
+    question: str,
+    top_k: int = HISTORY_RETRIEVAL_TOP_K,
+    recent_turns: int = HISTORY_RETRIEVAL_RECENT_TURNS
+) -> list[dict]:
+    recent = set(index.recent_seqs(recent_turns * 2))
+    selected = set(recent)
+    for seq in index.search(question, top_k, exclude_seqs=recent):
+        selected.add(seq)
+        partner = index.partner_seq(seq)
+        if partner is not None:
+            selected.add(partner)
+    return index.messages_for(selected)
+
+
+registry.gauge_callback("wisedebot_history_indexes", "Per-group/topic history indexes held in memory.", lambda: len(_group_indexes))
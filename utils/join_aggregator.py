@@ -0,0 +1,42 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+class JoinAggregator:
+    """
+    Mengumpulkan event join per grup selama `window_seconds`, lalu memanggil
+    `flush_callback(group_id, members, context)` sekali untuk seluruh batch.
+    `context` diambil dari join pertama di window tersebut.
+    """
+    def __init__(self, window_seconds: float, flush_callback: Callable[[int, list, dict], Awaitable[Any]]):
+        self.window_seconds = window_seconds
+        self.flush_callback = flush_callback
+        self._pending: dict[int, dict] = {}
+        self._flush_tasks: set[asyncio.Task] = set()
+
+    def add(self, group_id: int, member: Any, context: dict):
+        batch = self._pending.get(group_id)
+        if batch is None:
+            batch = {"members": [], "seen_ids": set(), "context": context}
+            self._pending[group_id] = batch
+            task = asyncio.create_task(self._flush_later(group_id))
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+        # Set id, supaya dedupe tetap O(1) per join saat terjadi join raid
+        member_id = getattr(member, "id", None)
+        if member_id not in batch["seen_ids"]:
+            batch["seen_ids"].add(member_id)
+            batch["members"].append(member)
+
+    async def _flush_later(self, group_id: int):
+        await asyncio.sleep(self.window_seconds)
+        batch = self._pending.pop(group_id, None)
+        if not batch or not batch["members"]:
+            return
+        try:
+            await self.flush_callback(group_id, batch["members"], batch["context"])
+        except Exception as e:
+            logging.error(f"JOIN_AGGREGATOR: Flush failed for group {group_id}: {repr(e)}")
+
+    def pending_count(self) -> int:
+        return sum(len(b["members"]) for b in self._pending.values())
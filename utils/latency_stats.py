@@ -0,0 +1,35 @@
+from collections import deque
+
+class LatencyTracker:
+    """
+    Menyimpan N sampel latensi terakhir per kunci (mis. model Groq) di memori
+    dan menghitung persentil langsung dari jendela tersebut.
+    """
+    def __init__(self, window_size: int = 200):
+        self.window_size = window_size
+        self._samples: dict[str, deque] = {}
+
+    def record(self, key: str, seconds: float):
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window_size)
+        samples.append(seconds)
+
+    def count(self, key: str) -> int:
+        samples = self._samples.get(key)
+        return len(samples) if samples else 0
+
+    def percentile(self, key: str, q: float, min_samples: int = 1) -> float | None:
+        samples = self._samples.get(key)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def keys(self) -> list[str]:
+        return list(self._samples.keys())
+
+
+# Latensi panggilan chat completion Groq, per model
+groq_latency = LatencyTracker()
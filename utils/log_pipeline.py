@@ -0,0 +1,136 @@
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from bot_config import LOG_LEVEL, LOG_FORMAT, LOG_CATEGORY_LEVELS, LOG_SAMPLE_MAX_PER_WINDOW, LOG_SAMPLE_WINDOW_SECONDS
+
+# Atribut bawaan LogRecord; sisanya dianggap field terstruktur dari `extra=`
+_STANDARD_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Satu objek JSON per baris: waktu, level, logger, pesan, plus semua field dari `extra=`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_RECORD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Membatasi record INFO/DEBUG per lokasi pemanggilan (file:baris) menjadi paling banyak
+    `max_per_window` per `window_seconds`. Kuncinya lokasi, bukan isi pesan, supaya log
+    hot path yang isinya selalu berbeda tetap bisa disampling. WARNING ke atas tidak pernah dibuang.
+    Jumlah record yang dibuang dilaporkan lewat field `sampled_out` pada record berikutnya yang lolos.
+    """
+
+    def __init__(self, max_per_window: int, window_seconds: float):
+        super().__init__()
+        self.max_per_window = max_per_window
+        self.window_seconds = window_seconds
+        # (pathname, lineno) -> [awal window, jumlah lolos, jumlah dibuang]
+        self._windows: dict[tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.max_per_window <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.window_seconds:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.sampled_out = suppressed
+                return True
+            if window[1] < self.max_per_window:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler bawaan menggabungkan traceback ke dalam `msg`; di sini pesan dan
+    traceback disimpan terpisah supaya JsonFormatter bisa menulisnya sebagai field sendiri.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parse_category_levels(raw: str | None) -> dict[str, str]:
+    # Format env: "wisedebot.moderation=WARNING,httpx=ERROR"
+    levels = {}
+    for item in (raw or "").split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(
+    level: str | None = None,
+    log_format: str | None = None,
+    category_levels: dict[str, str] | str | None = None,
+    sample_max_per_window: int | None = None,
+    sample_window_seconds: float | None = None
+) -> logging.handlers.QueueListener:
+    """
+    Memasang pipeline log non-blocking: handler di root hanya memasukkan record ke antrian
+    (setelah disaring level kategori dan sampling), sedangkan format JSON dan I/O dikerjakan
+    thread QueueListener. Kembalikan listener; panggil `.stop()` saat shutdown untuk flush.
+    """
+    root = logging.getLogger()
+    # Listener lama (jika ada) tetap milik pemanggil sebelumnya yang wajib menghentikannya
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel((level or LOG_LEVEL).upper())
+
+    levels = dict(LOG_CATEGORY_LEVELS)
+    levels.update(_parse_category_levels(category_levels) if isinstance(category_levels, str) else (category_levels or {}))
+    for name, category_level in levels.items():
+        logging.getLogger(name).setLevel(category_level.upper())
+
+    output = logging.StreamHandler()
+    if (log_format or LOG_FORMAT).lower() == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s'))
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(
+        LOG_SAMPLE_MAX_PER_WINDOW if sample_max_per_window is None else sample_max_per_window,
+        LOG_SAMPLE_WINDOW_SECONDS if sample_window_seconds is None else sample_window_seconds
+    ))
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    root.addHandler(queue_handler)
+    listener.start()
+    return listener
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from bot_config import LOOP_LAG_SAMPLE_INTERVAL_SECONDS, LOOP_STALL_THRESHOLD_SECONDS, LOOP_STALL_STACK_COOLDOWN_SECONDS
+from utils.latency_stats import LatencyTracker
+from utils.metrics import EVENT_LOOP_LAG_SECONDS, EVENT_LOOP_STALLS, registry
+
+logger = logging.getLogger("wisedebot.loop")
+
+# Jumlah bingkai stack (dari yang terdalam) yang ditulis ke log saat loop macet
+_STALL_STACK_FRAMES = 40
+
+
+class LoopMonitor:
+    """
+    Mengukur lag event loop terus-menerus: coroutine sampler tidur `sample_interval` detik
+    dan mencatat seberapa terlambat ia bangun. Thread watchdog terpisah memeriksa detak sampler;
+    jika loop tidak berdetak lebih lama dari `stall_threshold`, watchdog mengambil stack thread
+    loop lewat sys._current_frames() dan mencatat handler/update yang sedang berjalan di task
+    aktif. Handler yang berjalan didaftarkan oleh HandlerMetricsMiddleware lewat handler_started().
+    """
+
+    def __init__(
+        self,
+        sample_interval: float = LOOP_LAG_SAMPLE_INTERVAL_SECONDS,
+        stall_threshold: float = LOOP_STALL_THRESHOLD_SECONDS,
+        stack_cooldown: float = LOOP_STALL_STACK_COOLDOWN_SECONDS
+    ):
+        self.sample_interval = sample_interval
+        self.stall_threshold = stall_threshold
+        self.stack_cooldown = stack_cooldown
+        self.last_lag = 0.0
+        self.stalls = 0
+        self._lags = LatencyTracker(window_size=1200)
+        # id(task) -> (router, handler, update_id, chat_id, waktu mulai); diisi dari thread loop saja
+        self._running: dict[int, tuple[str, str, int | None, int | None, float]] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._last_beat = time.monotonic()
+        self._sampler_task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop_event = threading.Event()
+        self._last_stack_logged_at = 0.0
+
+    def handler_started(self, router: str, handler: str, update_id: int | None, chat_id: int | None) -> int | None:
+        task = asyncio.current_task()
+        if task is None:
+            return None
+        self._running[id(task)] = (router, handler, update_id, chat_id, time.monotonic())
+        return id(task)
+
+    def handler_finished(self, token: int | None):
+        if token is not None:
+            self._running.pop(token, None)
+
+    def start(self):
+        if self._sampler_task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop_event.clear()
+        self._sampler_task = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop_event.set()
+        if self._sampler_task is not None:
+            self._sampler_task.cancel()
+            self._sampler_task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join, self.sample_interval * 4)
+            self._watchdog = None
+
+    async def _sample(self):
+        while True:
+            slept_at = time.monotonic()
+            await asyncio.sleep(self.sample_interval)
+            now = time.monotonic()
+            lag = max(0.0, now - slept_at - self.sample_interval)
+            self._last_beat = now
+            self.last_lag = lag
+            self._lags.record("loop", lag)
+            # Cukup dicatat di histogram; log kemacetan ditulis watchdog dengan cooldown
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+
+    def _watch(self):
+        reported_beat = None
+        # Dicek cukup sering supaya stack diambil selagi loop masih macet
+        check_every = max(0.05, self.stall_threshold / 4)
+        while not self._stop_event.wait(check_every):
+            beat = self._last_beat
+            blocked_for = time.monotonic() - beat - self.sample_interval
+            if blocked_for < self.stall_threshold or beat == reported_beat:
+                continue
+            # Satu laporan per kemacetan: detak yang sama tidak dilaporkan dua kali
+            reported_beat = beat
+            self._report_stall(blocked_for)
+
+    def _current_handler(self) -> tuple[str, str, int | None, int | None, float] | None:
+        # asyncio.current_task(loop) hanya membaca dict; aman dipanggil dari thread watchdog
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            return None
+        return self._running.get(id(task)) if task is not None else None
+
+    def _report_stall(self, blocked_for: float):
+        self.stalls += 1
+        running = self._current_handler()
+        handler_label = f"{running[0]}.{running[1]}" if running else "unknown"
+        EVENT_LOOP_STALLS.inc(handler_label)
+
+        now = time.monotonic()
+        if now - self._last_stack_logged_at < self.stack_cooldown:
+            return
+        self._last_stack_logged_at = now
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)[-_STALL_STACK_FRAMES:]) if frame is not None else "(stack unavailable)"
+        try:
+            in_flight = [
+                {"router": r, "handler": h, "update_id": u, "chat_id": c, "running_seconds": round(now - started_at, 3)}
+                for r, h, u, c, started_at in list(self._running.values())
+            ]
+        except RuntimeError:
+            # Dict berubah saat dibaca (loop baru saja lanjut); laporan tetap ditulis tanpa daftar ini
+            in_flight = []
+        update_info = f"update {running[2]} in chat {running[3]}" if running else "no handler (loop internals or background task)"
+        logger.warning(
+            f"Event loop blocked for more than {blocked_for * 1000:.0f} ms in {handler_label} ({update_info}). Stack of the loop thread:\n{stack}",
+            extra={"blocked_handler": handler_label, "in_flight_handlers": in_flight}
+        )
+
+    def lag_percentile(self, q: float) -> float | None:
+        return self._lags.percentile("loop", q)
+
+    def running_handlers(self) -> int:
+        return len(self._running)
+
+
+loop_monitor = LoopMonitor()
+
+registry.gauge_callback("wisedebot_event_loop_lag_last_seconds", "Most recent event loop lag sample.", lambda: loop_monitor.last_lag)
+registry.gauge_callback("wisedebot_handlers_running", "Handlers currently running on the event loop.", loop_monitor.running_handlers)
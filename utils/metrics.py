@@ -0,0 +1,197 @@
+import functools
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable
+
+from utils.tracing import span
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Lag event loop yang sehat di bawah 1 ms, jadi bucket bawahnya lebih rapat
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(labelnames: tuple[str, ...], labelvalues: tuple) -> str:
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, labelvalues):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1.0):
+        self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0.0)
+
+    def series(self) -> dict[tuple, float]:
+        return self._values
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labelvalues, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Histogram kumulatif gaya Prometheus. observe() hanya melakukan satu bisect dan
+    beberapa penjumlahan, jadi aman dipakai di jalur panas.
+    """
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labelvalues -> [counts per bucket (+Inf terakhir), sum, count]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labelvalues):
+        series = self._series.get(labelvalues)
+        if series is None:
+            series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def series(self) -> dict[tuple, list]:
+        return self._series
+
+    def quantile(self, q: float, *labelvalues) -> float | None:
+        # Perkiraan persentil dari bucket (interpolasi linear di dalam bucket)
+        series = self._series.get(labelvalues)
+        if not series or not series[2]:
+            return None
+        target = q * series[2]
+        cumulative = 0
+        lower = 0.0
+        for i, count in enumerate(series[0]):
+            upper = self.buckets[i] if i < len(self.buckets) else lower
+            if count and cumulative + count >= target:
+                if i >= len(self.buckets):
+                    return lower
+                return lower + (upper - lower) * ((target - cumulative) / count)
+            cumulative += count
+            lower = upper
+        return lower
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labelvalues, (counts, total, count) in self._series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames + ("le",), labelvalues + (le,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            base_labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{base_labels} {total}")
+            lines.append(f"{self.name}_count{base_labels} {count}")
+        return lines
+
+
+class GaugeCallback:
+    # Nilai dibaca saat scrape, jadi tidak ada biaya sama sekali di jalur panas
+    def __init__(self, name: str, documentation: str, callback: Callable[[], dict[tuple, float] | float], labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = labelnames
+
+    def collect(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.callback()
+        except Exception as e:
+            logging.error(f"METRICS: Gauge callback {self.name} failed: {repr(e)}")
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for labelvalues, value in values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: dict[str, object] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name: str, documentation: str, callback, labelnames: tuple[str, ...] = ()) -> GaugeCallback:
+        return self.register(GaugeCallback(name, documentation, callback, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+GROQ_COMPLETION_SECONDS = registry.histogram("wisedebot_groq_completion_seconds", "Groq chat completion latency.", ("model", "task"))
+SUPABASE_CALL_SECONDS = registry.histogram("wisedebot_supabase_call_seconds", "Latency of supabase_interface functions.", ("function",))
+TELEGRAM_API_SECONDS = registry.histogram("wisedebot_telegram_api_seconds", "Telegram Bot API call latency.", ("method",))
+HANDLER_SECONDS = registry.histogram("wisedebot_handler_seconds", "Handler execution time.", ("router", "handler"))
+CACHE_REQUESTS = registry.counter("wisedebot_cache_requests_total", "Cache lookups by cache and result (hit/miss/evicted).", ("cache", "result"))
+MODERATION_VERDICTS = registry.counter("wisedebot_moderation_verdicts_total", "Moderation verdicts by outcome.", ("verdict",))
+GROQ_TOKENS = registry.counter("wisedebot_groq_tokens_total", "Groq tokens reported in completion usage, by task and kind (prompt/completion).", ("task", "kind"))
+QUOTA_DEGRADED = registry.counter("wisedebot_quota_degraded_total", "Work skipped or refused because a group exhausted its daily quota, by task.", ("task",))
+AI_RATE_LIMITED = registry.counter("wisedebot_ai_rate_limited_total", "AI triggers refused by the sliding-window rate limiter, by scope (user/group).", ("scope",))
+AI_PROGRESS_INDICATOR = registry.counter("wisedebot_ai_progress_indicator_total", "AI answers by progress indicator used while waiting (typing/placeholder).", ("mode",))
+DROPPED_UPDATES = registry.counter("wisedebot_updates_dropped_total", "Updates dropped before dispatch, by reason.", ("reason",))
+EVENT_LOOP_LAG_SECONDS = registry.histogram("wisedebot_event_loop_lag_seconds", "Event loop lag: how late the monitor's periodic sleep woke up.", buckets=LOOP_LAG_BUCKETS)
+EVENT_LOOP_STALLS = registry.counter("wisedebot_event_loop_stalls_total", "Times the event loop was blocked past the stall threshold, by handler running at the time.", ("handler",))
+ERRORS = registry.counter("wisedebot_errors_total", "Errors by component and kind.", ("component", "kind"))
+
+
+def observe_supabase_call(func):
+    # Helper privat (mis. _fetch_ai_config) dilaporkan tanpa garis bawah di depan
+    name = func.__name__.lstrip("_")
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            with span(f"supabase.{name}"):
+                return await func(*args, **kwargs)
+        finally:
+            SUPABASE_CALL_SECONDS.observe(time.perf_counter() - started_at, name)
+    return wrapper
+
+
+async def start_metrics_server(host: str, port: int):
+    # aiohttp sudah terpasang sebagai dependensi aiogram
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8", headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logging.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,39 @@
+import asyncio
+import logging
+import logging.handlers
+import resource
+import sys
+import time
+
+
+async def measure_loop_lag() -> float:
+    """Detik antara menjadwalkan callback dan callback itu dijalankan = panjang antrean ready loop saat ini."""
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    scheduled_at = time.perf_counter()
+    loop.call_soon(lambda: done.done() or done.set_result(time.perf_counter()))
+    return await done - scheduled_at
+
+
+def process_rss_bytes() -> tuple[int | None, int]:
+    """(RSS saat ini, RSS puncak) dalam byte. RSS saat ini dibaca dari /proc (Linux), None jika tidak tersedia."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss dalam KB di Linux, dalam byte di macOS
+    peak_bytes = peak if sys.platform == "darwin" else peak * 1024
+    try:
+        with open("/proc/self/status", encoding="ascii") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024, peak_bytes
+    except OSError:
+        pass
+    return None, peak_bytes
+
+
+def log_queue_depth() -> int | None:
+    # Pipeline log (utils/log_pipeline.py) memasang QueueHandler di root logger
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.handlers.QueueHandler):
+            return handler.queue.qsize()
+    return None
+
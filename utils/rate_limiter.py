@@ -0,0 +1,107 @@
+import time
+from bot_config import AI_RATE_LIMIT_LEVELS, DEFAULT_AI_RATE_LIMIT_LEVEL, AI_RATE_LIMIT_WINDOW_SECONDS, AI_RATE_LIMIT_SWEEP_SECONDS
+from utils.metrics import AI_RATE_LIMITED, registry
+
+
+class SlidingWindowCounter:
+    """
+    Sliding window counter: per key hanya disimpan awal window saat ini, jumlah hit di window
+    sebelumnya dan di window saat ini (O(1) memori per key). Jumlah hit dalam window geser
+    diperkirakan dengan membobot window sebelumnya sesuai porsi yang masih tercakup.
+    Key yang tidak aktif selama dua window dibuang oleh sweep berkala di dalam check().
+    """
+
+    def __init__(self, window_seconds: float = AI_RATE_LIMIT_WINDOW_SECONDS, sweep_seconds: float = AI_RATE_LIMIT_SWEEP_SECONDS):
+        self.window_seconds = window_seconds
+        self.sweep_seconds = sweep_seconds
+        # key -> [awal window saat ini, hit window sebelumnya, hit window saat ini, awal window terakhir kali diberi notifikasi]
+        self._entries: dict = {}
+        self._next_sweep_at = time.monotonic() + sweep_seconds
+
+    def _entry(self, key, now: float) -> list:
+        window_start = now - (now % self.window_seconds)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = [window_start, 0, 0, None]
+        elif entry[0] != window_start:
+            # Window bergeser: hit saat ini jadi "sebelumnya", kecuali sudah lewat lebih dari satu window
+            entry[1] = entry[2] if window_start - entry[0] == self.window_seconds else 0
+            entry[2] = 0
+            entry[0] = window_start
+        return entry
+
+    def retry_after(self, key, limit: int, now: float | None = None) -> float:
+        """0 jika satu hit lagi masih di bawah `limit`; selain itu perkiraan detik sampai boleh lagi."""
+        now = time.monotonic() if now is None else now
+        self._maybe_sweep(now)
+        entry = self._entry(key, now)
+        window_start, previous, current = entry[0], entry[1], entry[2]
+        elapsed = now - window_start
+        estimate = previous * (1 - elapsed / self.window_seconds) + current
+        if estimate + 1 <= limit:
+            return 0.0
+        if current + 1 <= limit and previous:
+            # Cukup menunggu bobot window sebelumnya turun
+            return max(self.window_seconds * (1 - (limit - 1 - current) / previous) - elapsed, 0.001)
+        # Window saat ini sendiri sudah penuh: tunggu sampai ia menjadi "sebelumnya" dan cukup meluruh
+        return (self.window_seconds - elapsed) + self.window_seconds * (1 - (limit - 1) / current)
+
+    def hit(self, key, now: float | None = None):
+        now = time.monotonic() if now is None else now
+        self._entry(key, now)[2] += 1
+
+    def should_notify(self, key, now: float | None = None) -> bool:
+        # Pesan "terlalu cepat" cukup sekali per window, supaya pembatasnya tidak ikut membanjiri grup
+        now = time.monotonic() if now is None else now
+        entry = self._entry(key, now)
+        if entry[3] == entry[0]:
+            return False
+        entry[3] = entry[0]
+        return True
+
+    def _maybe_sweep(self, now: float):
+        if now < self._next_sweep_at:
+            return
+        self._next_sweep_at = now + self.sweep_seconds
+        stale_before = now - 2 * self.window_seconds
+        for key in [key for key, entry in self._entries.items() if entry[0] <= stale_before]:
+            del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class AIRateLimiter:
+    """Batas laju pemicu AI per user (dalam satu grup) dan per grup, sesuai ai_rate_limit_level grup."""
+
+    def __init__(self):
+        self._counter = SlidingWindowCounter()
+
+    def check(self, group_id: int, user_id: int, config: dict | None) -> tuple[str, float, bool] | None:
+        """
+        None jika permintaan boleh diproses (dan langsung dihitung). Jika dibatasi, mengembalikan
+        (scope "user"/"group", detik sampai boleh lagi, apakah perlu memberi tahu user).
+        """
+        level = (config or {}).get("ai_rate_limit_level") or DEFAULT_AI_RATE_LIMIT_LEVEL
+        limits = AI_RATE_LIMIT_LEVELS.get(level, AI_RATE_LIMIT_LEVELS[DEFAULT_AI_RATE_LIMIT_LEVEL])
+        if not limits:
+            return None
+        user_limit, group_limit = limits
+        now = time.monotonic()
+        user_key, group_key = ("user", group_id, user_id), ("group", group_id)
+        for scope, key, limit in (("user", user_key, user_limit), ("group", group_key, group_limit)):
+            wait_seconds = self._counter.retry_after(key, limit, now)
+            if wait_seconds:
+                AI_RATE_LIMITED.inc(scope)
+                return scope, wait_seconds, self._counter.should_notify(key, now)
+        self._counter.hit(user_key, now)
+        self._counter.hit(group_key, now)
+        return None
+
+    def tracked_keys(self) -> int:
+        return len(self._counter)
+
+
+ai_rate_limiter = AIRateLimiter()
+
+registry.gauge_callback("wisedebot_ai_rate_limiter_keys", "Users and groups currently tracked by the AI rate limiter.", ai_rate_limiter.tracked_keys)
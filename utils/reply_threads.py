@@ -0,0 +1,100 @@
+from __future__ import annotations
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING
+from bot_config import (
+    REPLY_THREAD_MAX_TURNS, REPLY_THREAD_CACHE_MAX_NODES,
+    REPLY_THREAD_NEGATIVE_MAX_ENTRIES, REPLY_THREAD_NEGATIVE_TTL_SECONDS
+)
+if TYPE_CHECKING:
+    from supabase import Client
+
+# (group_id, message_id jawaban bot) -> {"question", "answer", "parent"}
+# Sumber kebenarannya tetap conversation_history; indeks ini hanya cache LRU yang
+# diisi saat jawaban dikirim dan dimuat ulang dari DB saat miss (mis. setelah restart).
+_thread_nodes: OrderedDict[tuple[int, int], dict] = OrderedDict()
+# (group_id, message_id) -> waktu monotonic kedaluwarsa; pesan yang tidak ada di conversation_history
+_missing_nodes: OrderedDict[tuple[int, int], float] = OrderedDict()
+_thread_locks: dict[tuple[int, int], asyncio.Lock] = {}
+_thread_lock_users: dict[tuple[int, int], int] = {}
+
+def register_turn(group_id: int, message_ids: list[int], question: str, answer: str, parent: int | None):
+    node = {"question": question, "answer": answer, "parent": parent}
+    # Jawaban panjang terbagi beberapa pesan; membalas potongan mana pun tetap masuk ke thread yang sama
+    for message_id in message_ids:
+        _missing_nodes.pop((group_id, message_id), None)
+        _thread_nodes[(group_id, message_id)] = node
+        _thread_nodes.move_to_end((group_id, message_id))
+    while len(_thread_nodes) > REPLY_THREAD_CACHE_MAX_NODES:
+        _thread_nodes.popitem(last=False)
+
+async def _get_node(supabase: Client, group_id: int, message_id: int) -> dict | None:
+    node = _thread_nodes.get((group_id, message_id))
+    if node is not None:
+        _thread_nodes.move_to_end((group_id, message_id))
+        return node
+    key = (group_id, message_id)
+    missing_until = _missing_nodes.get(key)
+    if missing_until is not None:
+        if missing_until > time.monotonic():
+            return None
+        del _missing_nodes[key]
+    from utils.supabase_interface import get_conversation_turn
+    node = await get_conversation_turn(supabase, group_id, message_id)
+    if node is not None:
+        register_turn(group_id, [message_id], node["question"], node["answer"], node["parent"])
+    else:
+        _missing_nodes[key] = time.monotonic() + REPLY_THREAD_NEGATIVE_TTL_SECONDS
+        _missing_nodes.move_to_end(key)
+        while len(_missing_nodes) > REPLY_THREAD_NEGATIVE_MAX_ENTRIES:
+            _missing_nodes.popitem(last=False)
+    return node
+
+async def get_thread_context(supabase: Client, group_id: int, message_id: int) -> tuple[list[dict], int] | None:
+    """
+    Menyusun history dari reply chain yang berakhir di jawaban bot `message_id`.
+    Mengembalikan (pesan kronologis, message_id akar thread) atau None jika bukan jawaban bot yang dikenal.
+    """
+    turns = []
+    current_id = message_id
+    root_id = message_id
+    visited = set()
+    while current_id is not None and current_id not in visited and len(turns) < REPLY_THREAD_MAX_TURNS:
+        visited.add(current_id)
+        node = await _get_node(supabase, group_id, current_id)
+        if node is None:
+            break
+        turns.append(node)
+        root_id = current_id
+        current_id = node["parent"]
+    if not turns:
+        return None
+    messages = []
+    for node in reversed(turns):
+        if node["question"]:
+            messages.append({"role": "user", "content": node["question"]})
+        messages.append({"role": "assistant", "content": node["answer"]})
+    return messages, root_id
+
+@asynccontextmanager
+async def thread_lock(group_id: int, root_id: int):
+    # Giliran dalam thread yang sama diproses berurutan; thread lain di grup yang sama tetap paralel
+    key = (group_id, root_id)
+    lock = _thread_locks.setdefault(key, asyncio.Lock())
+    _thread_lock_users[key] = _thread_lock_users.get(key, 0) + 1
+    try:
+        async with lock:
+            yield
+    finally:
+        _thread_lock_users[key] -= 1
+        if _thread_lock_users[key] <= 0:
+            _thread_lock_users.pop(key, None)
+            _thread_locks.pop(key, None)
+
+def drop_group_threads(group_id: int):
+    for key in [k for k in _thread_nodes if k[0] == group_id]:
+        del _thread_nodes[key]
+    for key in [k for k in _missing_nodes if k[0] == group_id]:
+        del _missing_nodes[key]
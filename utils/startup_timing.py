@@ -0,0 +1,57 @@
+import importlib
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+# Modul ini di-import paling awal oleh main.py, jadi waktu import-nya dipakai sebagai awal proses
+_PROCESS_STARTED_AT = time.perf_counter()
+
+
+class StartupTimer:
+    """
+    Mencatat durasi tiap fase startup (import per modul, inisialisasi client) dan waktu
+    sampai update pertama selesai ditangani. Laporan ditulis ke log sekali, setelah update pertama,
+    dan diekspor sebagai metrik wisedebot_startup_seconds{phase}.
+    """
+
+    def __init__(self, started_at: float = _PROCESS_STARTED_AT):
+        self.started_at = started_at
+        self.phases: dict[str, float] = {}
+        self.first_update_seconds: float | None = None
+
+    @contextmanager
+    def phase(self, name: str):
+        phase_started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - phase_started_at
+
+    def mark(self, name: str):
+        # Fase yang berjalan dari awal proses sampai titik ini (mis. import inti di main.py)
+        self.phases[name] = time.perf_counter() - self.started_at
+
+    def import_module(self, module_name: str):
+        if module_name in sys.modules:
+            return sys.modules[module_name]
+        with self.phase(f"import {module_name}"):
+            return importlib.import_module(module_name)
+
+    def mark_first_update(self):
+        if self.first_update_seconds is not None:
+            return
+        self.first_update_seconds = time.perf_counter() - self.started_at
+        logging.info(
+            f"Startup: first update handled {self.first_update_seconds:.2f}s after process start",
+            extra={"startup_phases": {name: round(seconds, 4) for name, seconds in self.phases.items()}}
+        )
+
+    def report(self) -> dict[str, float]:
+        report = dict(self.phases)
+        if self.first_update_seconds is not None:
+            report["first_update"] = self.first_update_seconds
+        return report
+
+
+startup_timer = StartupTimer()
@@ -1,9 +1,32 @@
+from __future__ import annotations
+import logging
 import asyncio
-from supabase import Client
-from bot_config import DEFAULT_LANGUAGE, AVAILABLE_LANGUAGES, CONVERSATION_HISTORY_LIMIT,  DEFAULT_MODERATION_LEVEL
+from typing import TYPE_CHECKING
+from bot_config import DEFAULT_LANGUAGE, AVAILABLE_LANGUAGES, CONVERSATION_HISTORY_LIMIT
 from datetime import datetime, timezone
+from utils.metrics import observe_supabase_call, CACHE_REQUESTS
+from utils.answer_cache import invalidate_group_answers, invalidate_topic_answers
+from utils.history_index import index_conversation_message, drop_group_index
+from utils.reply_threads import drop_group_threads
+from utils.welcome_template import forget_compiled_custom_template
+from utils.config_store import group_config_store, apply_config_defaults, GROUP_CONFIG_COLUMNS
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger("wisedebot.supabase")
 
 async def get_group_language(supabase: Client, group_id: int) -> str:
+    if group_config_store.loaded:
+        config = group_config_store.get(group_id)
+        if config and config.get("language_code") in AVAILABLE_LANGUAGES:
+            return config["language_code"]
+        return DEFAULT_LANGUAGE
+    if group_config_store.is_known_missing(group_id):
+        return DEFAULT_LANGUAGE
+    return await _fetch_group_language(supabase, group_id)
+
+@observe_supabase_call
+async def _fetch_group_language(supabase: Client, group_id: int) -> str:
     try:
         response = await asyncio.to_thread(
             supabase.table("group_configs")
@@ -16,9 +39,10 @@ async def get_group_language(supabase: Client, group_id: int) -> str:
             return response.data["language_code"]
     except Exception as e:
         error_message = repr(e) if e is not None else "Unknown error (exception object was None)"
-        print(f"Error fetching language for group {group_id}: {error_message}")
+        logger.error(f"Error fetching language for group {group_id}: {error_message}")
     return DEFAULT_LANGUAGE
 
+@observe_supabase_call
 async def set_group_language(supabase: Client, group_id: int, lang_code: str, admin_user_id: int) -> bool:
     try:
         current_time = datetime.now(timezone.utc).isoformat()
@@ -33,51 +57,49 @@ async def set_group_language(supabase: Client, group_id: int, lang_code: str, ad
             .upsert(data_to_upsert, on_conflict="group_id")
             .execute
         )
-        if hasattr(response, 'status_code') and 200 <= response.status_code < 300: #
-             return True
-        elif hasattr(response, 'data') and response.data is not None: #
+        if (hasattr(response, 'status_code') and 200 <= response.status_code < 300) or \
+           (hasattr(response, 'data') and response.data is not None): #
+             group_config_store.apply_local_write(group_id, data_to_upsert)
              return True
         else:
-            print(f"Supabase upsert for group {group_id} lang {lang_code} might have failed. Status: {response.status_code if hasattr(response, 'status_code') else 'N/A'}. Data: {response.data if hasattr(response, 'data') else 'N/A'}")
+            logger.warning(f"Supabase upsert for group {group_id} lang {lang_code} might have failed. Status: {response.status_code if hasattr(response, 'status_code') else 'N/A'}. Data: {response.data if hasattr(response, 'data') else 'N/A'}")
             return False
     except Exception as e:
         error_message = repr(e) if e is not None else "Unknown error (exception object was None)"
-        print(f"Error setting language for group {group_id} to {lang_code}: {error_message}")
+        logger.error(f"Error setting language for group {group_id} to {lang_code}: {error_message}")
         return False
 
 async def get_ai_config(supabase: Client, group_id: int):
+    # Dari snapshot lokal (tanpa round trip) jika sudah termuat; grup tanpa baris -> None
+    if group_config_store.loaded:
+        CACHE_REQUESTS.inc("group_config", "hit")
+        return group_config_store.get(group_id)
+    if group_config_store.is_known_missing(group_id):
+        return None
+    CACHE_REQUESTS.inc("group_config", "miss")
+    return await _fetch_ai_config(supabase, group_id)
+
+@observe_supabase_call
+async def _fetch_ai_config(supabase: Client, group_id: int):
     try:
         response = await asyncio.to_thread(
             supabase.table("group_configs")
-            .select(
-                "encrypted_groq_api_key, system_prompt, groq_model, "
-                "configured_by_user_id, last_updated_at, is_active, language_code, "
-                "ai_trigger_command_enabled, ai_trigger_mention_enabled, ai_trigger_custom_prefix, "
-                "welcome_message_enabled, custom_welcome_message, welcome_message_ai_enabled, "
-                "moderation_level, moderation_action, moderation_text_categories, moderation_image_categories"
-            )
+            .select(GROUP_CONFIG_COLUMNS)
             .eq("group_id", group_id)
             .maybe_single()
             .execute
         )
-        if response and hasattr(response, 'data'):
-            if response.data:
-                response.data.setdefault('ai_trigger_command_enabled', True)
-                response.data.setdefault('ai_trigger_mention_enabled', True)
-                response.data.setdefault('ai_trigger_custom_prefix', None)
-                response.data.setdefault('welcome_message_enabled', False)
-                response.data.setdefault('custom_welcome_message', None)
-                response.data.setdefault('welcome_message_ai_enabled', False)
-                response.data.setdefault('moderation_level', DEFAULT_MODERATION_LEVEL)
-                response.data.setdefault('moderation_action', 'warn')
-                response.data.setdefault('moderation_text_categories', [])
-                response.data.setdefault('moderation_image_categories', [])
-            return response.data
+        if response and getattr(response, 'data', None):
+            response.data.pop('group_id', None)
+            return apply_config_defaults(response.data)
+        # maybe_single() tanpa baris: grup belum pernah dikonfigurasi
+        group_config_store.remember_missing(group_id)
         return None
     except Exception as e:
-        print(f"Error fetching AI config for group {group_id}: {repr(e)}")
+        logger.error(f"Error fetching AI config for group {group_id}: {repr(e)}")
         return None
 
+@observe_supabase_call
 async def save_ai_config(
     supabase: Client, group_id: int, admin_user_id: int,
     groq_api_key: str | None = None,
@@ -94,7 +116,11 @@ async def save_ai_config(
     moderation_level: str | None = None,
     moderation_action: str | None = None,
     moderation_text_categories: list | None = None,
-    moderation_image_categories: list | None = None
+    moderation_image_categories: list | None = None,
+    model_routes: dict | None = None,
+    answer_cache_enabled: bool | None = None,
+    answer_cache_history_scoped: bool | None = None,
+    ai_rate_limit_level: str | None = None
     ) -> bool:
     try:
         current_time = datetime.now(timezone.utc).isoformat()
@@ -121,11 +147,15 @@ async def save_ai_config(
         if moderation_action is not None: data_to_upsert["moderation_action"] = moderation_action
         if moderation_text_categories is not None: data_to_upsert["moderation_text_categories"] = moderation_text_categories
         if moderation_image_categories is not None: data_to_upsert["moderation_image_categories"] = moderation_image_categories
+        if model_routes is not None: data_to_upsert["model_routes"] = model_routes
+        if answer_cache_enabled is not None: data_to_upsert["answer_cache_enabled"] = answer_cache_enabled
+        if answer_cache_history_scoped is not None: data_to_upsert["answer_cache_history_scoped"] = answer_cache_history_scoped
+        if ai_rate_limit_level is not None: data_to_upsert["ai_rate_limit_level"] = ai_rate_limit_level
 
 
         update_fields_count = len(data_to_upsert) - 3
         if update_fields_count <= 0:
-             print(f"No actual data provided to save_ai_config for group {group_id}, skipping upsert.")
+             logger.debug(f"No actual data provided to save_ai_config for group {group_id}, skipping upsert.")
              return True
 
 
@@ -134,18 +164,51 @@ async def save_ai_config(
             .upsert(data_to_upsert, on_conflict="group_id")
             .execute
         )
-        if hasattr(response, 'status_code') and 200 <= response.status_code < 300:
-             return True
-        elif hasattr(response, 'data') and response.data is not None:
+        # Setiap perubahan konfigurasi membuat jawaban yang di-cache tidak valid lagi
+        invalidate_group_answers(group_id)
+        if (hasattr(response, 'status_code') and 200 <= response.status_code < 300) or \
+           (hasattr(response, 'data') and response.data is not None):
+             group_config_store.apply_local_write(group_id, data_to_upsert)
              return True
         else:
-            print(f"Supabase upsert AI config for group {group_id} failed. Status: {response.status_code if hasattr(response, 'status_code') else 'N/A'}. Data: {response.data if hasattr(response, 'data') else 'N/A'}")
+            logger.warning(f"Supabase upsert AI config for group {group_id} failed. Status: {response.status_code if hasattr(response, 'status_code') else 'N/A'}. Data: {response.data if hasattr(response, 'data') else 'N/A'}")
             return False
     except Exception as e:
-        print(f"Error saving AI config for group {group_id}: {repr(e)}")
+        logger.error(f"Error saving AI config for group {group_id}: {repr(e)}")
         return False
 
 
+@observe_supabase_call
+async def set_group_quota(
+    supabase: Client, group_id: int, admin_user_id: int,
+    daily_token_quota: int | None, daily_request_quota: int | None
+) -> bool:
+    # None = tanpa batas; ditulis apa adanya (berbeda dengan save_ai_config yang melewati nilai None)
+    try:
+        data_to_upsert = {
+            "group_id": group_id,
+            "configured_by_user_id": admin_user_id,
+            "last_updated_at": datetime.now(timezone.utc).isoformat(),
+            "daily_token_quota": daily_token_quota,
+            "daily_request_quota": daily_request_quota,
+        }
+        response = await asyncio.to_thread(
+            supabase.table("group_configs")
+            .upsert(data_to_upsert, on_conflict="group_id")
+            .execute
+        )
+        if (hasattr(response, 'status_code') and 200 <= response.status_code < 300) or \
+           (hasattr(response, 'data') and response.data is not None):
+            group_config_store.apply_local_write(group_id, data_to_upsert)
+            return True
+        logger.warning(f"Supabase upsert quota for group {group_id} failed. Data: {response.data if hasattr(response, 'data') else 'N/A'}")
+        return False
+    except Exception as e:
+        logger.error(f"Error saving quota for group {group_id}: {repr(e)}")
+        return False
+
+
+@observe_supabase_call
 async def delete_ai_config(supabase: Client, group_id: int) -> bool: #
     try:
         current_time = datetime.now(timezone.utc).isoformat()
@@ -164,44 +227,72 @@ async def delete_ai_config(supabase: Client, group_id: int) -> bool: #
             .eq("group_id", group_id)
             .execute
         )
-        if hasattr(response, 'status_code') and 200 <= response.status_code < 300: #
+        invalidate_group_answers(group_id)
+        if (hasattr(response, 'status_code') and 200 <= response.status_code < 300) or \
+           (hasattr(response, 'data') and response.data is not None): #
+            group_config_store.apply_local_write(group_id, update_data, create=False)
+            # custom_welcome_message direset, template kompilasinya tidak akan dipakai lagi
+            forget_compiled_custom_template(group_id)
             return True
-        elif hasattr(response, 'data') and response.data is not None: #
-             return True
         else:
-            print(f"Supabase delete (update to null) AI config for group {group_id} failed. Status: {response.status_code if hasattr(response, 'status_code') else 'N/A'}. Data: {response.data if hasattr(response, 'data') else 'N/A'}")
+            logger.warning(f"Supabase delete (update to null) AI config for group {group_id} failed. Status: {response.status_code if hasattr(response, 'status_code') else 'N/A'}. Data: {response.data if hasattr(response, 'data') else 'N/A'}")
             return False
     except Exception as e:
-        print(f"Error deleting AI config for group {group_id}: {repr(e)}")
+        logger.error(f"Error deleting AI config for group {group_id}: {repr(e)}")
         return False
 
-async def add_conversation_message(supabase: Client, group_id: int, role: str, content: str) -> bool: #
+@observe_supabase_call
+async def add_conversation_message(
+    supabase: Client, group_id: int, role: str, content: str,
+    message_id: int | None = None, reply_to_message_id: int | None = None,
+    message_thread_id: int | None = None
+) -> bool: #
     try:
         data_to_insert = {
             "group_id": group_id,
             "role": role,
             "content": content
         }
+        # message_id = id pesan jawaban bot untuk giliran ini (dipakai oleh baris user & assistant),
+        # reply_to_message_id = jawaban bot yang dibalas user (induk dalam reply chain)
+        if message_id is not None: data_to_insert["message_id"] = message_id
+        if reply_to_message_id is not None: data_to_insert["reply_to_message_id"] = reply_to_message_id
+        if message_thread_id is not None: data_to_insert["message_thread_id"] = message_thread_id
         response = await asyncio.to_thread(
             supabase.table("conversation_history").insert(data_to_insert).execute #
         )
         if hasattr(response, 'status_code') and response.status_code == 201: #
+             index_conversation_message(group_id, role, content, message_thread_id)
              return True
         elif hasattr(response, 'data') and response.data is not None: #
+             index_conversation_message(group_id, role, content, message_thread_id)
              return True
         else:
-            print(f"Supabase insert conversation history for group {group_id} failed. Status: {response.status_code if hasattr(response, 'status_code') else 'N/A'}. Data: {response.data if hasattr(response, 'data') else 'N/A'}")
+            logger.warning(f"Supabase insert conversation history for group {group_id} failed. Status: {response.status_code if hasattr(response, 'status_code') else 'N/A'}. Data: {response.data if hasattr(response, 'data') else 'N/A'}")
             return False
     except Exception as e:
-        print(f"Error adding conversation message for group {group_id}: {repr(e)}")
+        logger.error(f"Error adding conversation message for group {group_id}: {repr(e)}")
         return False
 
-async def get_conversation_history(supabase: Client, group_id: int, limit: int = CONVERSATION_HISTORY_LIMIT) -> list[dict]: #
+def _filter_topic(query, message_thread_id: int | None):
+    # History di luar topik forum (dan semua baris lama) memiliki message_thread_id NULL
+    if message_thread_id is None:
+        return query.is_("message_thread_id", "null")
+    return query.eq("message_thread_id", message_thread_id)
+
+@observe_supabase_call
+async def get_conversation_history(
+    supabase: Client, group_id: int, limit: int = CONVERSATION_HISTORY_LIMIT,
+    message_thread_id: int | None = None
+) -> list[dict]: #
     try:
         response = await asyncio.to_thread(
-            supabase.table("conversation_history") #
-            .select("role, content") #
-            .eq("group_id", group_id) #
+            _filter_topic(
+                supabase.table("conversation_history") #
+                .select("role, content") #
+                .eq("group_id", group_id), #
+                message_thread_id
+            )
             .order("timestamp", desc=True) #
             .limit(limit) #
             .execute
@@ -210,30 +301,67 @@ async def get_conversation_history(supabase: Client, group_id: int, limit: int =
             return response.data[::-1]
         return []
     except Exception as e:
-        print(f"Error fetching conversation history for group {group_id}: {repr(e)}")
+        logger.error(f"Error fetching conversation history for group {group_id} (topic {message_thread_id}): {repr(e)}")
         return []
 
-async def clear_conversation_history(supabase: Client, group_id: int) -> bool: #
+@observe_supabase_call
+async def get_conversation_turn(supabase: Client, group_id: int, message_id: int) -> dict | None:
+    """
+    Mengambil satu giliran (pertanyaan + jawaban) berdasarkan message_id jawaban bot.
+    Mengembalikan {"question", "answer", "parent"} atau None jika tidak ditemukan.
+    """
+    try:
+        response = await asyncio.to_thread(
+            supabase.table("conversation_history")
+            .select("role, content, reply_to_message_id")
+            .eq("group_id", group_id)
+            .eq("message_id", message_id)
+            .execute
+        )
+        if not (response and hasattr(response, 'data') and response.data):
+            return None
+        turn = {"question": None, "answer": None, "parent": None}
+        for row in response.data:
+            if row.get("role") == "user":
+                turn["question"] = row.get("content")
+            elif row.get("role") == "assistant":
+                turn["answer"] = row.get("content")
+            if row.get("reply_to_message_id") is not None:
+                turn["parent"] = row.get("reply_to_message_id")
+        return turn if turn["answer"] is not None else None
+    except Exception as e:
+        logger.error(f"Error fetching conversation turn {message_id} for group {group_id}: {repr(e)}")
+        return None
+
+@observe_supabase_call
+async def clear_conversation_history(supabase: Client, group_id: int, message_thread_id: int | None = None) -> bool: #
     try:
         response = await asyncio.to_thread(
-            supabase.table("conversation_history") #
-            .delete() #
-            .eq("group_id", group_id) #
+            _filter_topic(
+                supabase.table("conversation_history") #
+                .delete() #
+                .eq("group_id", group_id), #
+                message_thread_id
+            )
             .execute
         )
+        invalidate_topic_answers(group_id, message_thread_id)
+        drop_group_index(group_id, message_thread_id)
+        drop_group_threads(group_id)
         if hasattr(response, 'status_code') and (response.status_code == 204 or (200 <= response.status_code < 300 and response.data is not None)): #
              return True
         elif hasattr(response, 'data') and response.data is not None: #
              return True
         else:
-            print(f"Supabase delete conversation history for group {group_id} might have failed. Status: {response.status_code if hasattr(response, 'status_code') else 'N/A'}. Data: {response.data if hasattr(response, 'data') else 'N/A'}")
+            logger.warning(f"Supabase delete conversation history for group {group_id} might have failed. Status: {response.status_code if hasattr(response, 'status_code') else 'N/A'}. Data: {response.data if hasattr(response, 'data') else 'N/A'}")
             return False
     except Exception as e:
-        print(f"Error clearing conversation history for group {group_id}: {repr(e)}")
+        logger.error(f"Error clearing conversation history for group {group_id}: {repr(e)}")
         return False
 
 # ... (semua fungsi yang sudah ada sebelumnya: get_group_language, set_group_language, get_ai_config, save_ai_config, delete_ai_config, add_conversation_message, get_conversation_history, clear_conversation_history) ...
 
+@observe_supabase_call
 async def get_user_language(supabase: Client, user_id: int) -> str | None:
     """
     Mengambil preferensi bahasa pengguna dari tabel user_preferences.
@@ -251,9 +379,10 @@ async def get_user_language(supabase: Client, user_id: int) -> str | None:
             return response.data["language_code"]
         return None
     except Exception as e:
-        print(f"Error fetching language preference for user {user_id}: {repr(e)}")
+        logger.error(f"Error fetching language preference for user {user_id}: {repr(e)}")
         return None
 
+@observe_supabase_call
 async def set_user_language(supabase: Client, user_id: int, lang_code: str) -> bool:
     """
     Menyimpan atau memperbarui preferensi bahasa pengguna di tabel user_preferences.
@@ -276,8 +405,8 @@ async def set_user_language(supabase: Client, user_id: int, lang_code: str) -> b
         elif hasattr(response, 'data') and response.data is not None: # Upsert sukses bisa mengembalikan data atau tidak
             return True
         else:
-            print(f"Supabase upsert for user {user_id} lang {lang_code} preference might have failed. Status: {response.status_code if hasattr(response, 'status_code') else 'N/A'}. Data: {response.data if hasattr(response, 'data') else 'N/A'}")
+            logger.warning(f"Supabase upsert for user {user_id} lang {lang_code} preference might have failed. Status: {response.status_code if hasattr(response, 'status_code') else 'N/A'}. Data: {response.data if hasattr(response, 'data') else 'N/A'}")
             return False
     except Exception as e:
-        print(f"Error setting language preference for user {user_id} to {lang_code}: {repr(e)}")
+        logger.error(f"Error setting language preference for user {user_id} to {lang_code}: {repr(e)}")
         return False
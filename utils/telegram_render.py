@@ -0,0 +1,243 @@
+import html
+import re
+
+# Batas Telegram untuk teks pesan, dihitung dalam UTF-16 code unit setelah entity di-parse
+TELEGRAM_TEXT_LIMIT = 4096
+TELEGRAM_CAPTION_LIMIT = 1024
+
+_FENCE_RE = re.compile(r"^\s*```\s*([\w+#.-]*)\s*$")
+_HEADING_RE = re.compile(r"^\s{0,3}#{1,6}\s+(.*?)\s*#*\s*$")
+_BULLET_RE = re.compile(r"^(\s*)[-*+]\s+(.*)$")
+_QUOTE_RE = re.compile(r"^\s{0,3}>\s?(.*)$")
+_MARKUP_DOCUMENT_PREFIXES = ("<!doctype html", "<html", "<?xml")
+_ALLOWED_LINK_SCHEMES = ("http://", "https://", "tg://", "mailto:")
+
+_INLINE_RE = re.compile(
+    r"(?<!`)(?P<code_tick>`+)(?!`)(?P<code>.+?)(?<!`)(?P=code_tick)(?!`)"
+    r"|\[(?P<link_text>[^\]\n]+)\]\((?P<link_url>[^)\s]+)\)"
+    r"|\*\*(?P<bold>(?:(?!\*\*).)+?)\*\*"
+    r"|(?<![\w_])__(?P<bold_alt>[^_\s](?:(?!__).)*?)__(?![\w_])"
+    r"|~~(?P<strike>.+?)~~"
+    r"|(?<![\w*])\*(?P<italic>[^*\s](?:[^*\n]*?[^*\s])?)\*(?![\w*])"
+    r"|(?<![\w_])_(?P<italic_alt>[^_\s](?:[^_\n]*?[^_\s])?)_(?![\w_])"
+)
+
+_TAG_RE = re.compile(r"<(/?)([a-zA-Z][\w-]*)([^>]*)>")
+
+
+def escape(text: str) -> str:
+    return html.escape(text, quote=False)
+
+
+def utf16_len(text: str) -> int:
+    # Karakter di luar BMP (mis. emoji) dihitung dua code unit oleh Telegram
+    return len(text) + sum(1 for ch in text if ord(ch) > 0xFFFF)
+
+
+def render_inline(text: str) -> str:
+    parts = []
+    position = 0
+    for match in _INLINE_RE.finditer(text):
+        parts.append(escape(text[position:match.start()]))
+        position = match.end()
+        if match.group("code") is not None:
+            parts.append(f"<code>{escape(match.group('code'))}</code>")
+        elif match.group("link_text") is not None:
+            url = match.group("link_url")
+            if url.lower().startswith(_ALLOWED_LINK_SCHEMES):
+                parts.append(f'<a href="{html.escape(url, quote=True)}">{render_inline(match.group("link_text"))}</a>')
+            else:
+                parts.append(escape(match.group(0)))
+        elif match.group("bold") is not None:
+            parts.append(f"<b>{render_inline(match.group('bold'))}</b>")
+        elif match.group("bold_alt") is not None:
+            # __init__, __main__ dan sejenisnya adalah identifier dunder, bukan teks tebal
+            if match.group("bold_alt").isidentifier():
+                parts.append(escape(match.group(0)))
+            else:
+                parts.append(f"<b>{render_inline(match.group('bold_alt'))}</b>")
+        elif match.group("strike") is not None:
+            parts.append(f"<s>{render_inline(match.group('strike'))}</s>")
+        else:
+            parts.append(f"<i>{render_inline(match.group('italic') or match.group('italic_alt'))}</i>")
+    parts.append(escape(text[position:]))
+    return "".join(parts)
+
+
+def _code_block(lines: list[str], language: str) -> str:
+    body = escape("\n".join(lines))
+    if language:
+        return f'<pre><code class="language-{escape(language)}">{body}</code></pre>'
+    return f"<pre>{body}</pre>"
+
+
+def markdown_to_telegram_html(text: str) -> str:
+    """
+    Mengubah Markdown keluaran model menjadi HTML yang diterima Telegram dalam satu kali jalan:
+    blok kode berpagar, kode inline, tebal, miring, coret, tautan, heading, kutipan dan daftar.
+    Semua teks lain di-escape, jadi hasilnya selalu HTML yang valid.
+    """
+    if not isinstance(text, str):
+        text = str(text)
+    stripped = text.strip()
+    if stripped.lower().startswith(_MARKUP_DOCUMENT_PREFIXES):
+        return _code_block(stripped.split("\n"), "")
+
+    output: list[str] = []
+    quote_lines: list[str] = []
+    lines = text.split("\n")
+    index = 0
+
+    def flush_quote():
+        if quote_lines:
+            output.append("<blockquote>" + "\n".join(quote_lines) + "</blockquote>")
+            quote_lines.clear()
+
+    while index < len(lines):
+        line = lines[index]
+        fence = _FENCE_RE.match(line)
+        if fence:
+            flush_quote()
+            code_lines = []
+            index += 1
+            # Pagar yang tidak ditutup dianggap berlanjut sampai akhir jawaban
+            while index < len(lines) and not lines[index].strip().startswith("```"):
+                code_lines.append(lines[index])
+                index += 1
+            output.append(_code_block(code_lines, fence.group(1)))
+            index += 1
+            continue
+
+        quote = _QUOTE_RE.match(line)
+        if quote:
+            quote_lines.append(render_inline(quote.group(1)))
+            index += 1
+            continue
+        flush_quote()
+
+        heading = _HEADING_RE.match(line)
+        bullet = _BULLET_RE.match(line)
+        if heading:
+            output.append(f"<b>{render_inline(heading.group(1))}</b>")
+        elif bullet:
+            output.append(f"{bullet.group(1)}• {render_inline(bullet.group(2))}")
+        else:
+            output.append(render_inline(line))
+        index += 1
+
+    flush_quote()
+    return "\n".join(output).strip()
+
+
+def _tokenize_html(markup: str) -> list[tuple[str, str, str]]:
+    """Token (jenis, nama tag / teks terdekode, tag mentah)."""
+    tokens = []
+    position = 0
+    for match in _TAG_RE.finditer(markup):
+        if match.start() > position:
+            tokens.append(("text", html.unescape(markup[position:match.start()]), ""))
+        kind = "close" if match.group(1) else "open"
+        tokens.append((kind, match.group(2).lower(), match.group(0)))
+        position = match.end()
+    if position < len(markup):
+        tokens.append(("text", html.unescape(markup[position:]), ""))
+    return tokens
+
+
+def _choose_split(text: str, start: int, limit: int) -> int:
+    """Posisi akhir chunk terbaik: paragraf, lalu baris, lalu spasi, lalu potong paksa."""
+    used = 0
+    end = start
+    while end < len(text):
+        cost = 2 if ord(text[end]) > 0xFFFF else 1
+        if used + cost > limit:
+            break
+        used += cost
+        end += 1
+    if end >= len(text):
+        return len(text)
+    # Batas yang terlalu dekat dengan awal chunk menghasilkan pesan pendek-pendek; abaikan
+    minimum = start + (end - start) // 3
+    for separator in ("\n\n", "\n", " "):
+        found = text.rfind(separator, minimum, end)
+        if found != -1:
+            return found + len(separator)
+    return end
+
+
+def split_telegram_html(markup: str, limit: int = TELEGRAM_TEXT_LIMIT) -> list[str]:
+    """
+    Memecah HTML Telegram menjadi beberapa pesan yang masing-masing muat dalam `limit`
+    UTF-16 code unit teks terlihat. Pemotongan tidak pernah terjadi di dalam tag atau
+    entity HTML; tag yang masih terbuka ditutup di akhir chunk dan dibuka lagi di chunk berikutnya.
+    """
+    tokens = _tokenize_html(markup)
+    visible = "".join(value for kind, value, _ in tokens if kind == "text")
+    if utf16_len(visible) <= limit:
+        return [markup] if visible.strip() else []
+
+    split_points = []
+    position = 0
+    while position < len(visible):
+        position = _choose_split(visible, position, limit)
+        split_points.append(position)
+
+    chunks: list[str] = []
+    current: list[str] = []
+    open_tags: list[tuple[str, str]] = []
+    offset = 0
+    next_split = 0
+
+    def close_chunk():
+        current.extend(f"</{name}>" for name, _ in reversed(open_tags))
+        chunk = "".join(current)
+        if _TAG_RE.sub("", chunk).strip():
+            chunks.append(chunk)
+        current.clear()
+        current.extend(raw for _, raw in open_tags)
+
+    for kind, value, raw in tokens:
+        if kind == "open":
+            open_tags.append((value, raw))
+            current.append(raw)
+        elif kind == "close":
+            for i in range(len(open_tags) - 1, -1, -1):
+                if open_tags[i][0] == value:
+                    del open_tags[i]
+                    break
+            current.append(raw)
+        else:
+            while value:
+                boundary = split_points[next_split] if next_split < len(split_points) else None
+                if boundary is None or offset + len(value) <= boundary:
+                    current.append(escape(value))
+                    offset += len(value)
+                    value = ""
+                    continue
+                take = boundary - offset
+                current.append(escape(value[:take]))
+                offset += take
+                value = value[take:]
+                next_split += 1
+                close_chunk()
+    close_chunk()
+    return chunks
+
+
+def render_for_telegram(markdown_text: str, limit: int = TELEGRAM_TEXT_LIMIT) -> list[str]:
+    return split_telegram_html(markdown_to_telegram_html(markdown_text), limit)
+
+
+def plain_preview(text: str, limit: int) -> str:
+    """Awal teks sebagai HTML ter-escape (tanpa format) yang muat dalam `limit` UTF-16 code unit, diakhiri "…" jika terpotong."""
+    if utf16_len(escape(text)) <= limit:
+        return escape(text)
+    cut = min(len(text), limit)
+    while cut > 0 and utf16_len(escape(text[:cut].rstrip()) + "…") > limit:
+        cut -= max(1, cut // 10)
+    preview = text[:cut]
+    # Potong di batas kata/baris terakhir supaya preview tidak berhenti di tengah kata
+    boundary = max(preview.rfind("\n"), preview.rfind(" "))
+    if boundary > cut // 2:
+        preview = preview[:boundary]
+    return escape(preview.rstrip()) + "…"
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from bot_config import (
+    THOUGHTS_STORE_MAX_ENTRIES, THOUGHTS_STORE_MAX_BYTES, THOUGHTS_STORE_TTL_SECONDS,
+    THOUGHTS_STORE_COMPRESS_MIN_BYTES, THOUGHTS_STORE_SQLITE_PATH
+)
+from utils.metrics import CACHE_REQUESTS, registry
+
+# Baris kedaluwarsa di SQLite dibersihkan sekali setiap N penulisan
+_SQLITE_PURGE_EVERY_WRITES = 100
+
+
+class ThoughtsStore:
+    """
+    Penyimpanan payload tombol "show thoughts" dengan batas jumlah entri, batas total byte
+    dan TTL. Payload besar dikompres zlib. Jika `sqlite_path` diisi, setiap entri juga
+    ditulis ke SQLite supaya tombol tetap berfungsi setelah restart (dan antar replika yang
+    berbagi file yang sama); memori tetap menjadi lapisan pertama.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = THOUGHTS_STORE_MAX_ENTRIES,
+        max_bytes: int = THOUGHTS_STORE_MAX_BYTES,
+        ttl_seconds: float = THOUGHTS_STORE_TTL_SECONDS,
+        compress_min_bytes: int = THOUGHTS_STORE_COMPRESS_MIN_BYTES,
+        sqlite_path: str | None = THOUGHTS_STORE_SQLITE_PATH
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.compress_min_bytes = compress_min_bytes
+        # thought_id -> (expires_at, compressed, payload); expires_at memakai waktu wall-clock
+        # karena ikut disimpan ke SQLite dan harus tetap bermakna setelah restart
+        self._entries: OrderedDict[str, tuple[float, bool, bytes]] = OrderedDict()
+        self._total_bytes = 0
+        self._db: sqlite3.Connection | None = None
+        self._db_lock = threading.Lock()
+        self._writes_since_purge = 0
+        if sqlite_path:
+            self.configure_persistence(sqlite_path)
+
+    def configure_persistence(self, sqlite_path: str | None):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+            if not sqlite_path:
+                return
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS thoughts ("
+                "thought_id TEXT PRIMARY KEY, expires_at REAL NOT NULL, compressed INTEGER NOT NULL, payload BLOB NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS thoughts_expires_at ON thoughts (expires_at)")
+            self._db.commit()
+        logging.info(f"Thoughts store persisted to SQLite at {sqlite_path}")
+
+    def _encode(self, text: str) -> tuple[bool, bytes]:
+        raw = text.encode("utf-8")
+        if len(raw) >= self.compress_min_bytes:
+            compressed = zlib.compress(raw, 6)
+            if len(compressed) < len(raw):
+                return True, compressed
+        return False, raw
+
+    @staticmethod
+    def _decode(compressed: bool, payload: bytes) -> str:
+        return (zlib.decompress(payload) if compressed else payload).decode("utf-8")
+
+    def _remember(self, thought_id: str, expires_at: float, compressed: bool, payload: bytes):
+        self._forget(thought_id)
+        self._entries[thought_id] = (expires_at, compressed, payload)
+        self._total_bytes += len(payload)
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            oldest_id = next(iter(self._entries))
+            self._forget(oldest_id)
+            CACHE_REQUESTS.inc("thoughts", "evicted")
+
+    def _forget(self, thought_id: str):
+        entry = self._entries.pop(thought_id, None)
+        if entry is not None:
+            self._total_bytes -= len(entry[2])
+
+    async def put(self, thought_id: str, text: str):
+        compressed, payload = self._encode(text)
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(thought_id, expires_at, compressed, payload)
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._db_put, thought_id, expires_at, compressed, payload)
+            except sqlite3.Error as e:
+                logging.error(f"Failed to persist thoughts {thought_id} to SQLite: {e}")
+
+    async def get(self, thought_id: str) -> str | None:
+        now = time.time()
+        entry = self._entries.get(thought_id)
+        if entry is not None and entry[0] <= now:
+            self._forget(thought_id)
+            entry = None
+        if entry is None and self._db is not None:
+            try:
+                entry = await asyncio.to_thread(self._db_get, thought_id, now)
+            except sqlite3.Error as e:
+                logging.error(f"Failed to read thoughts {thought_id} from SQLite: {e}")
+            if entry is not None:
+                self._remember(thought_id, *entry)
+        if entry is None:
+            CACHE_REQUESTS.inc("thoughts", "miss")
+            return None
+        self._entries.move_to_end(thought_id)
+        CACHE_REQUESTS.inc("thoughts", "hit")
+        return self._decode(entry[1], entry[2])
+
+    def _db_put(self, thought_id: str, expires_at: float, compressed: bool, payload: bytes):
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO thoughts (thought_id, expires_at, compressed, payload) VALUES (?, ?, ?, ?)",
+                (thought_id, expires_at, int(compressed), payload)
+            )
+            self._writes_since_purge += 1
+            if self._writes_since_purge >= _SQLITE_PURGE_EVERY_WRITES:
+                self._writes_since_purge = 0
+                self._db.execute("DELETE FROM thoughts WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+
+    def _db_get(self, thought_id: str, now: float) -> tuple[float, bool, bytes] | None:
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT expires_at, compressed, payload FROM thoughts WHERE thought_id = ? AND expires_at > ?",
+                (thought_id, now)
+            ).fetchone()
+        return (row[0], bool(row[1]), row[2]) if row else None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+
+thoughts_store = ThoughtsStore()
+
+registry.gauge_callback("wisedebot_thoughts_store_entries", "Show-thoughts payloads held in memory.", lambda: len(thoughts_store))
+registry.gauge_callback("wisedebot_thoughts_store_bytes", "Bytes of (possibly compressed) show-thoughts payloads held in memory.", lambda: thoughts_store.total_bytes)
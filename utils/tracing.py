@@ -0,0 +1,131 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from bot_config import TRACING_ENABLED, TRACE_SLOW_THRESHOLD_SECONDS, TRACE_EXPORT_PATH
+
+# Span yang sedang aktif untuk update ini. asyncio.create_task menyalin context,
+# jadi task anak (mis. request hedging) otomatis menempel ke span induknya.
+_current_span: ContextVar["Span | None"] = ContextVar("current_span", default=None)
+
+_settings = {
+    "enabled": TRACING_ENABLED,
+    "slow_threshold_seconds": TRACE_SLOW_THRESHOLD_SECONDS,
+    "export_path": TRACE_EXPORT_PATH,
+}
+# Penulisan file trace terjadi di thread executor; lock menjaga baris dari beberapa thread tidak bercampur
+_export_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ("name", "attrs", "started_at", "ended_at", "children", "_token")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.perf_counter()
+        self.ended_at: float | None = None
+        self.children: list[Span] = []
+        self._token = None
+
+    @property
+    def duration(self) -> float:
+        end = self.ended_at if self.ended_at is not None else time.perf_counter()
+        return end - self.started_at
+
+    def to_dict(self, origin: float) -> dict:
+        data = {
+            "name": self.name,
+            "start_ms": round((self.started_at - origin) * 1000, 2),
+            "duration_ms": round(self.duration * 1000, 2),
+        }
+        if self.attrs:
+            data["attrs"] = self.attrs
+        if self.children:
+            data["children"] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class span:
+    """
+    Context manager untuk child span. Tanpa trace aktif (mis. task latar belakang),
+    hanya satu ContextVar.get() yang dibayar, jadi aman di jalur panas.
+    """
+    __slots__ = ("_name", "_attrs", "_span", "_token")
+
+    def __init__(self, name: str, **attrs):
+        self._name = name
+        self._attrs = attrs
+        self._span = None
+        self._token = None
+
+    def __enter__(self) -> Span | None:
+        parent = _current_span.get()
+        if parent is None:
+            return None
+        self._span = Span(self._name, self._attrs)
+        parent.children.append(self._span)
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._span is None:
+            return False
+        self._span.ended_at = time.perf_counter()
+        if exc_type is not None:
+            self._span.attrs["error"] = exc_type.__name__
+        _current_span.reset(self._token)
+        return False
+
+
+def configure_tracing(enabled: bool | None = None, slow_threshold_seconds: float | None = None, export_path: str | None = None):
+    if enabled is not None:
+        _settings["enabled"] = enabled
+    if slow_threshold_seconds is not None:
+        _settings["slow_threshold_seconds"] = slow_threshold_seconds
+    if export_path is not None:
+        _settings["export_path"] = export_path
+
+
+def start_trace(name: str, **attrs) -> Span | None:
+    if not _settings["enabled"]:
+        return None
+    root = Span(name, attrs)
+    root._token = _current_span.set(root)
+    return root
+
+
+def finish_trace(root: Span | None, error: str | None = None):
+    if root is None:
+        return
+    root.ended_at = time.perf_counter()
+    if error:
+        root.attrs["error"] = error
+    _current_span.reset(root._token)
+    if root.duration >= _settings["slow_threshold_seconds"]:
+        _export_slow_trace(root)
+
+
+def _export_slow_trace(root: Span):
+    record = {"timestamp": datetime.now(timezone.utc).isoformat()}
+    record.update(root.to_dict(root.started_at))
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    # Trace lambat muncul justru saat loop sedang sibuk, jadi I/O file tidak dijalankan di loop
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        _append_trace_line(_settings["export_path"], line)
+        return
+    loop.run_in_executor(None, _append_trace_line, _settings["export_path"], line)
+
+
+def _append_trace_line(path: str, line: str):
+    try:
+        with _export_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line)
+    except OSError as e:
+        logging.warning(f"Failed to export slow trace to {path}: {e}")
@@ -0,0 +1,153 @@
+from __future__ import annotations
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING
+from bot_config import USAGE_FLUSH_INTERVAL_SECONDS
+from utils.metrics import GROQ_TOKENS, observe_supabase_call, registry
+if TYPE_CHECKING:
+    from supabase import Client
+
+logger = logging.getLogger("wisedebot.groq")
+
+
+def _today() -> str:
+    # Kuota harian dihitung per hari UTC, sama dengan kolom usage_date di database
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+@observe_supabase_call
+async def _increment_group_usage(supabase: Client, rows: list[dict]) -> list[dict]:
+    response = await asyncio.to_thread(supabase.rpc("increment_group_usage", {"rows": rows}).execute)
+    return response.data or []
+
+
+@observe_supabase_call
+async def _fetch_usage_for_day(supabase: Client, usage_date: str) -> list[dict]:
+    response = await asyncio.to_thread(
+        supabase.table("group_usage_daily")
+        .select("group_id, requests, prompt_tokens, completion_tokens")
+        .eq("usage_date", usage_date)
+        .execute
+    )
+    return response.data or []
+
+
+class UsageTracker:
+    """
+    Mengakumulasi pemakaian Groq (request, token prompt/completion, latensi) per grup, hari
+    dan tugas di memori, lalu menulisnya ke tabel group_usage_daily per batch lewat RPC
+    increment_group_usage. Total hari ini per grup dipakai untuk mengecek kuota harian tanpa
+    query; setiap flush menyelaraskannya dengan total di database (termasuk replika lain).
+    """
+
+    def __init__(self):
+        # (group_id, usage_date, task) -> [requests, prompt_tokens, completion_tokens, latency_ms_total]
+        self._pending: dict[tuple[int, str, str], list[int]] = {}
+        # group_id -> [requests, total_tokens] untuk _today_date
+        self._today_totals: dict[int, list[int]] = {}
+        self._today_date = _today()
+
+    def _roll_day(self):
+        today = _today()
+        if today != self._today_date:
+            self._today_date = today
+            self._today_totals.clear()
+
+    def record(self, group_id: int, task: str, usage: dict | None, latency_seconds: float):
+        self._roll_day()
+        prompt_tokens = int((usage or {}).get("prompt_tokens") or 0)
+        completion_tokens = int((usage or {}).get("completion_tokens") or 0)
+        entry = self._pending.setdefault((group_id, self._today_date, task), [0, 0, 0, 0])
+        entry[0] += 1
+        entry[1] += prompt_tokens
+        entry[2] += completion_tokens
+        entry[3] += int(latency_seconds * 1000)
+        totals = self._today_totals.setdefault(group_id, [0, 0])
+        totals[0] += 1
+        totals[1] += prompt_tokens + completion_tokens
+        GROQ_TOKENS.inc(task, "prompt", amount=prompt_tokens)
+        GROQ_TOKENS.inc(task, "completion", amount=completion_tokens)
+
+    def usage_today(self, group_id: int) -> tuple[int, int]:
+        self._roll_day()
+        requests, tokens = self._today_totals.get(group_id, (0, 0))
+        return requests, tokens
+
+    def quota_exhausted(self, group_id: int, config: dict | None) -> bool:
+        if not config:
+            return False
+        token_quota = config.get("daily_token_quota")
+        request_quota = config.get("daily_request_quota")
+        if not token_quota and not request_quota:
+            return False
+        requests, tokens = self.usage_today(group_id)
+        return bool((token_quota and tokens >= token_quota) or (request_quota and requests >= request_quota))
+
+    async def load_today(self, supabase: Client):
+        self._roll_day()
+        try:
+            rows = await _fetch_usage_for_day(supabase, self._today_date)
+        except Exception as e:
+            logger.warning(f"Could not load today's Groq usage, quotas start from zero: {repr(e)}")
+            return
+        totals: dict[int, list[int]] = {}
+        for row in rows:
+            group_totals = totals.setdefault(row["group_id"], [0, 0])
+            group_totals[0] += row.get("requests") or 0
+            group_totals[1] += (row.get("prompt_tokens") or 0) + (row.get("completion_tokens") or 0)
+        # Pemakaian yang tercatat sebelum load selesai tetap dihitung
+        for group_id, (requests, tokens) in totals.items():
+            local = self._today_totals.setdefault(group_id, [0, 0])
+            local[0] += requests
+            local[1] += tokens
+
+    async def flush(self, supabase: Client) -> int:
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        rows = [
+            {
+                "group_id": group_id, "usage_date": usage_date, "task": task,
+                "requests": values[0], "prompt_tokens": values[1],
+                "completion_tokens": values[2], "latency_ms_total": values[3],
+            }
+            for (group_id, usage_date, task), values in batch.items()
+        ]
+        try:
+            day_totals = await _increment_group_usage(supabase, rows)
+        except Exception as e:
+            # Batch dikembalikan supaya ikut flush berikutnya; tidak ada pemakaian yang hilang
+            for key, values in batch.items():
+                entry = self._pending.setdefault(key, [0, 0, 0, 0])
+                for i, value in enumerate(values):
+                    entry[i] += value
+            logger.warning(f"Groq usage flush failed ({len(rows)} rows kept for retry): {repr(e)}")
+            return 0
+
+        self._roll_day()
+        for total in day_totals:
+            if total.get("usage_date") != self._today_date:
+                continue
+            group_id = total["group_id"]
+            # Total database + pemakaian yang tercatat selama flush berjalan
+            requests, tokens = int(total.get("requests") or 0), int(total.get("total_tokens") or 0)
+            for (pending_group_id, usage_date, _task), values in self._pending.items():
+                if pending_group_id == group_id and usage_date == self._today_date:
+                    requests += values[0]
+                    tokens += values[1] + values[2]
+            self._today_totals[group_id] = [requests, tokens]
+        return len(rows)
+
+    async def run_flush_loop(self, supabase: Client, interval_seconds: float = USAGE_FLUSH_INTERVAL_SECONDS):
+        while True:
+            await asyncio.sleep(interval_seconds)
+            await self.flush(supabase)
+
+    def pending_rows(self) -> int:
+        return len(self._pending)
+
+
+usage_tracker = UsageTracker()
+
+registry.gauge_callback("wisedebot_usage_pending_rows", "Usage aggregates waiting to be flushed to Supabase.", usage_tracker.pending_rows)
@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+import json
+import logging
+from collections import deque
+from bot_config import WELCOME_POOL_SIZE, WELCOME_POOL_LOW_WATERMARK
+from utils.groq_interface import get_task_completion
+from utils.welcome_template import CompiledTemplate, compile_template
+from utils.usage_tracker import usage_tracker
+from utils.metrics import QUOTA_DEGRADED
+
+DEFAULT_AI_WELCOME_PROMPT_TEMPLATE = (
+    "You are a friendly greeter bot for a Telegram group named '{{group_name_context}}'. "
+    "A new member has just joined. "
+    "Craft a unique, warm, and welcoming message template for them. "
+    "You MUST use ALL of the following placeholders in your response exactly as they are written, "
+    "they will be filled in for each new member later: "
+    "{{user_mention}}, {{user_first_name}}, {{user_last_name}}, {{user_full_name}}, {{group_name}}. "
+    "Do not add any extra text before or after the welcome message itself. Only the welcome message. "
+    "Make the message concise and engaging. Example: 'Hey {{user_mention}}, welcome to {{group_name}}! So glad to have you, {{user_first_name}}!' "
+)
+AI_WELCOME_USER_PROMPT = "Generate a short and friendly welcome message template now, using the required placeholders."
+
+# group_id -> {"fingerprint", "templates": deque, "last_template", "refill_task"}
+_welcome_pools: dict[int, dict] = {}
+
+def _pool_fingerprint(config: dict, group_name: str) -> str:
+    # Pool dibuat ulang hanya jika pengaturan yang memengaruhi isi template berubah
+    relevant = {
+        "group_name": group_name,
+        "prompt": config.get("ai_welcome_system_prompt") or "",
+        "route": (config.get("model_routes") or {}).get("welcome"),
+        "api_key": config.get("encrypted_groq_api_key") or "",
+    }
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def _build_system_prompt(config: dict, safe_group_name: str) -> str:
+    custom_prompt = config.get("ai_welcome_system_prompt")
+    if custom_prompt and custom_prompt.strip():
+        return custom_prompt.replace("{{group_name}}", safe_group_name).replace("{{user_full_name_placeholder}}", "a new member")
+    return DEFAULT_AI_WELCOME_PROMPT_TEMPLATE.replace("{{group_name_context}}", safe_group_name)
+
+async def _generate_template(group_id: int, api_key: str, config: dict, system_prompt: str) -> CompiledTemplate | None:
+    if usage_tracker.quota_exhausted(group_id, config):
+        # Kuota harian habis: pemanggil memakai template yang ada atau welcome non-AI
+        QUOTA_DEGRADED.inc("welcome")
+        return None
+    response_data = await get_task_completion(
+        api_key=api_key, task="welcome",
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": AI_WELCOME_USER_PROMPT}
+        ],
+        group_config=config,
+        group_id=group_id
+    )
+    template = (response_data or {}).get("main_response") or ""
+    if template.startswith("GROQ_API_ERROR:") or template.startswith("UNEXPECTED_GROQ_ERROR:"):
+        logging.error(f"WELCOME_POOL: Groq error while generating welcome template: {template}")
+        return None
+    # Template dikompilasi sekali di sini (termasuk membuang blok <think>), bukan di setiap join
+    compiled = compile_template(template)
+    # Template tanpa mention tidak menyapa siapa pun; buang saja
+    if "user_mention" not in compiled.segments[1::2]:
+        logging.warning(f"WELCOME_POOL: Discarding generated template without {{{{user_mention}}}}: '{template[:100]}'")
+        return None
+    return compiled
+
+async def _refill_pool(group_id: int, pool: dict, api_key: str, config: dict, system_prompt: str):
+    failures = 0
+    try:
+        while len(pool["templates"]) < WELCOME_POOL_SIZE and failures < 3:
+            template = await _generate_template(group_id, api_key, config, system_prompt)
+            if template is None:
+                failures += 1
+                continue
+            pool["templates"].append(template)
+        logging.info(f"WELCOME_POOL: Pool for group {group_id} refilled to {len(pool['templates'])} templates.")
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logging.error(f"WELCOME_POOL: Refill failed for group {group_id}: {repr(e)}")
+    finally:
+        pool["refill_task"] = None
+
+def _schedule_refill(group_id: int, pool: dict, api_key: str, config: dict, system_prompt: str):
+    if pool["refill_task"] is None:
+        pool["refill_task"] = asyncio.create_task(_refill_pool(group_id, pool, api_key, config, system_prompt))
+
+async def take_welcome_template(group_id: int, config: dict, group_name: str, safe_group_name: str, api_key: str) -> CompiledTemplate | None:
+    """
+    Mengambil satu template welcome AI (placeholder masih utuh) dari pool grup.
+    Pool diisi ulang di background saat hampir habis; hanya join pertama yang menunggu generasi.
+    """
+    fingerprint = _pool_fingerprint(config, group_name)
+    pool = _welcome_pools.get(group_id)
+    if pool is None or pool["fingerprint"] != fingerprint:
+        invalidate_welcome_pool(group_id)
+        pool = {"fingerprint": fingerprint, "templates": deque(), "last_template": None, "refill_task": None}
+        _welcome_pools[group_id] = pool
+
+    system_prompt = _build_system_prompt(config, safe_group_name)
+    if pool["templates"]:
+        template = pool["templates"].popleft()
+        pool["last_template"] = template
+    elif pool["last_template"]:
+        template = pool["last_template"]
+    else:
+        template = await _generate_template(group_id, api_key, config, system_prompt)
+        pool["last_template"] = template
+
+    if len(pool["templates"]) < WELCOME_POOL_LOW_WATERMARK:
+        _schedule_refill(group_id, pool, api_key, config, system_prompt)
+    return template
+
+def invalidate_welcome_pool(group_id: int):
+    pool = _welcome_pools.pop(group_id, None)
+    if pool and pool["refill_task"] is not None:
+        pool["refill_task"].cancel()
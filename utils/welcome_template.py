@@ -0,0 +1,75 @@
+import re
+from utils.helpers import escape_html_tags
+
+WELCOME_PLACEHOLDERS = ("user_mention", "user_first_name", "user_last_name", "user_full_name", "group_name")
+
+_PLACEHOLDER_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+_THINK_RE = re.compile(r"<think>.*?</think>", re.DOTALL | re.IGNORECASE)
+
+
+class CompiledTemplate:
+    """
+    Template welcome yang sudah dipecah menjadi segmen: indeks genap adalah teks literal,
+    indeks ganjil adalah nama placeholder. Render cukup satu kali join, tanpa .replace() berantai.
+    """
+    __slots__ = ("source", "segments")
+
+    def __init__(self, source: str, segments: tuple[str, ...]):
+        self.source = source
+        self.segments = segments
+
+    def render(self, values: dict[str, str]) -> str:
+        segments = self.segments
+        parts = list(segments)
+        for i in range(1, len(segments), 2):
+            parts[i] = values.get(segments[i], "")
+        return "".join(parts).strip()
+
+
+def compile_template(text: str) -> CompiledTemplate:
+    cleaned = _THINK_RE.sub("", text or "")
+    segments = []
+    literal_start = 0
+    for match in _PLACEHOLDER_RE.finditer(cleaned):
+        name = match.group(1)
+        if name not in WELCOME_PLACEHOLDERS:
+            continue  # placeholder tak dikenal dibiarkan sebagai teks apa adanya
+        segments.append(cleaned[literal_start:match.start()])
+        segments.append(name)
+        literal_start = match.end()
+    segments.append(cleaned[literal_start:])
+    return CompiledTemplate(text, tuple(segments))
+
+
+def find_invalid_placeholders(text: str) -> list[str]:
+    invalid = [f"{{{{{m.group(1)}}}}}" for m in _PLACEHOLDER_RE.finditer(text) if m.group(1) not in WELCOME_PLACEHOLDERS]
+    # "{{" atau "}}" yang tidak membentuk placeholder (mis. "{{user_mention" tanpa penutup)
+    stripped = _PLACEHOLDER_RE.sub("", text)
+    if "{{" in stripped or "}}" in stripped:
+        invalid.append("{{ … }}")
+    return invalid
+
+
+# group_id -> template kustom yang sudah dikompilasi (dibandingkan dengan teks sumber saat dipakai)
+_compiled_custom_templates: dict[int, CompiledTemplate] = {}
+
+def get_compiled_custom_template(group_id: int, text: str) -> CompiledTemplate:
+    compiled = _compiled_custom_templates.get(group_id)
+    if compiled is None or compiled.source != text:
+        compiled = compile_template(text)
+        _compiled_custom_templates[group_id] = compiled
+    return compiled
+
+def forget_compiled_custom_template(group_id: int):
+    _compiled_custom_templates.pop(group_id, None)
+
+
+def build_welcome_values(users: list, group_name: str) -> dict[str, str]:
+    # Semua nilai di-escape sekali di sini; template tidak perlu escape lagi saat render
+    return {
+        "user_mention": ", ".join(f"<a href='tg://user?id={u.id}'>{escape_html_tags(u.full_name)}</a>" for u in users),
+        "user_first_name": ", ".join(escape_html_tags(u.first_name) for u in users),
+        "user_last_name": ", ".join(escape_html_tags(u.last_name) for u in users if u.last_name),
+        "user_full_name": ", ".join(escape_html_tags(u.full_name) for u in users),
+        "group_name": escape_html_tags(group_name),
+    }